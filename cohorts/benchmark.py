@@ -0,0 +1,323 @@
+import argparse
+import calendar
+import csv
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+from cohort import CohortAnalysis
+from cohort import ENGINES
+from cohort import iter_columns_from_file
+from cohort import load_columns_from_file
+from collections import OrderedDict
+from instrument import Instrumentation
+from timeparse import SECONDS_PER_DAY
+
+
+CUSTOMERS_FILE = 'customers.csv'
+ORDERS_FILE = 'orders.csv'
+STAGES = ('parse', 'load', 'add customers', 'add orders', 'analyze', 'render')
+# the stages summed into the total ("parse" times another way of adding the same rows)
+PIPELINE_STAGES = STAGES[1:]
+HEAVY_MODULES = ('multiprocessing', 'numpy', 'pendulum', 'prettytable')
+COHORT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cohort.py')
+
+
+def generate_data(
+        directory,
+        num_customers,
+        orders_per_customer=1.0,
+        duplicate_rate=0.0,
+        num_days=365,
+        start_date='2015-01-01',
+        seed=0):
+    """Writes synthetic customers and orders CSV files (in the same schema as
+    the data files) for benchmarking; the same seed always produces the same files.
+
+    Customers join uniformly over the date span and make a geometrically
+    distributed number of orders between their join date and the end of the span.
+
+    :param directory: the directory of the CSV files (created if needed).
+    :param num_customers: the number of customers.
+    :param orders_per_customer: the average number of orders per customer.
+    :param duplicate_rate: the fraction of orders written twice (same order id).
+    :param num_days: the number of days of the date span.
+    :param start_date: the first day of the date span ("YYYY-MM-DD").
+    :param seed: the random seed.
+
+    :return: tuple (number of customer rows, number of order rows)
+    """
+    if orders_per_customer < 0:
+        raise ValueError('orders per customer must not be negative')
+
+    if not 0 <= duplicate_rate <= 1:
+        raise ValueError('duplicate rate must be between 0 and 1')
+
+    if not num_days or num_days <= 0:
+        raise ValueError('number of days must be greater than 0')
+
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    rng = random.Random(seed)
+    start_epoch = calendar.timegm(time.strptime(start_date, '%Y-%m-%d'))
+    end_epoch = start_epoch + (num_days * SECONDS_PER_DAY) - 1
+    format_date = _DateFormatter()
+
+    # P(n orders) = (1 - p) * p^n has a mean of orders_per_customer
+    continue_rate = float(orders_per_customer) / (orders_per_customer + 1)
+
+    order_id = 0
+    num_orders = 0
+    with open(os.path.join(directory, CUSTOMERS_FILE), 'wb') as customers_file, \
+            open(os.path.join(directory, ORDERS_FILE), 'wb') as orders_file:
+        customers = csv.writer(customers_file, lineterminator='\n')
+        orders = csv.writer(orders_file, lineterminator='\n')
+        customers.writerow(('id', 'created'))
+        orders.writerow(('id', 'order_number', 'user_id', 'created'))
+
+        for user_id in xrange(1, num_customers + 1):
+            join_epoch = rng.randint(start_epoch, end_epoch)
+            customers.writerow((user_id, format_date(join_epoch)))
+
+            order_epochs = []
+            while rng.random() < continue_rate:
+                order_epochs.append(rng.randint(join_epoch, end_epoch))
+
+            for order_number, order_epoch in enumerate(sorted(order_epochs), 1):
+                order_id += 1
+                row = (order_id, order_number, user_id, format_date(order_epoch))
+                orders.writerow(row)
+                num_orders += 1
+
+                if duplicate_rate and rng.random() < duplicate_rate:
+                    orders.writerow(row)
+                    num_orders += 1
+
+    return num_customers, num_orders
+
+
+def run_benchmark(directory, use_cache=False, **options):
+    """Runs the stages of a cohort analysis over the CSV files of a directory
+    and times each of them:
+        parse: streams the rows of strings of the CSV files into add_customers and
+            add_orders of another CohortAnalysis (the default path of cohort.py)
+        load: parses the CSV files (or loads their binary cache) into typed arrays
+        add customers / add orders: adds the rows to the CohortAnalysis
+        analyze: CohortAnalysis.analyze
+        render: CohortAnalysis.print_table (to /dev/null)
+
+    :param directory: the directory with the customers.csv and orders.csv files.
+    :param use_cache: whether to load the files through their binary cache.
+    :param options: the keyword arguments of the CohortAnalysis (e.g., timezone).
+
+    :return: tuple (number of customers, number of orders, OrderedDict of seconds by stage)
+    """
+    customers_path = os.path.join(directory, CUSTOMERS_FILE)
+    orders_path = os.path.join(directory, ORDERS_FILE)
+    instrumentation = Instrumentation()
+
+    processes = options.get('processes', 1)
+
+    with instrumentation.span('parse'):
+        parsed = CohortAnalysis(**options)
+        parsed.add_customers(iter_columns_from_file(customers_path, ('id', 'created')))
+        parsed.add_orders(iter_columns_from_file(orders_path, ('user_id', 'id', 'order_number', 'created')))
+
+    del parsed
+
+    # typed arrays rather than rows of strings, so large data sets fit in memory
+    with instrumentation.span('load'):
+        customers = load_columns_from_file(customers_path, ('id', 'created'), use_cache, processes=processes)
+        orders = load_columns_from_file(
+            orders_path, ('user_id', 'id', 'order_number', 'created'), use_cache, processes=processes
+        )
+
+    cohorts = CohortAnalysis(instrumentation=instrumentation, **options)
+    num_customers = cohorts.add_customer_epochs(*customers)
+    num_orders = cohorts.add_order_epochs(*orders)
+
+    del customers, orders
+
+    cohorts.analyze()
+
+    stdout = sys.stdout
+    with open(os.devnull, 'w') as devnull:
+        sys.stdout = devnull
+        try:
+            cohorts.print_table()
+        finally:
+            sys.stdout = stdout
+
+    timings = OrderedDict((stage, instrumentation.get_span(stage).seconds) for stage in STAGES)
+
+    return num_customers, num_orders, timings
+
+
+def run_startup_benchmark(arguments=('--help',), repeat=10):
+    """Times the start of the command line (in a new interpreter each time),
+    e.g., to keep the imports of its heavy dependencies deferred.
+
+    :param arguments: the command line arguments of cohort.py.
+    :param repeat: the number of runs.
+
+    :return: tuple (best seconds, heavy modules imported by the cohort module)
+    """
+    command = [sys.executable, COHORT_SCRIPT] + list(arguments)
+    best = None
+    with open(os.devnull, 'w') as devnull:
+        for i in range(max(repeat, 1)):
+            start = time.time()
+            subprocess.call(command, stdout=devnull, stderr=devnull)
+            seconds = time.time() - start
+            best = seconds if best is None else min(best, seconds)
+
+    return best, get_imported_modules()
+
+
+def get_imported_modules(modules=HEAVY_MODULES):
+    """Gets the modules imported by importing the cohort module (in a new interpreter).
+
+    :param modules: the names of the modules to look for.
+
+    :return: list of the names of the imported modules
+    """
+    code = 'import sys, cohort; print " ".join(i for i in {!r} if i in sys.modules)'.format(tuple(modules))
+    output = subprocess.check_output([sys.executable, '-c', code], cwd=os.path.dirname(COHORT_SCRIPT))
+
+    return output.split()
+
+
+class _DateFormatter(object):
+    def __init__(self):
+        """Formats UTC epoch seconds as "YYYY-MM-DD HH:mm:ss" (memoizing the days)."""
+        super(_DateFormatter, self).__init__()
+
+        self._days = dict()
+
+    def __call__(self, epoch):
+        day_number, seconds = divmod(epoch, SECONDS_PER_DAY)
+
+        day = self._days.get(day_number)
+        if day is None:
+            day = self._days[day_number] = time.strftime('%Y-%m-%d', time.gmtime(day_number * SECONDS_PER_DAY))
+
+        minutes, seconds = divmod(seconds, 60)
+        hours, minutes = divmod(minutes, 60)
+
+        return '{} {:02d}:{:02d}:{:02d}'.format(day, hours, minutes, seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='cohort analysis benchmarks')
+    commands = parser.add_subparsers(dest='command')
+
+    generate = commands.add_parser('generate', help='generate synthetic customers and orders CSV files')
+    generate.add_argument('-n', '--customers', type=int, default=100000, help='number of customers')
+    generate.add_argument('-o', '--orders-per-customer', type=float, default=1.0, help='average number of orders per customer')
+    generate.add_argument('--duplicate-rate', type=float, default=0.0, help='fraction of duplicated orders')
+    generate.add_argument('--days', type=int, default=365, help='number of days of the date span')
+    generate.add_argument('--start-date', default='2015-01-01', help='first day of the date span (YYYY-MM-DD)')
+    generate.add_argument('--seed', type=int, default=0, help='random seed')
+    generate.add_argument('directory', help='the directory of the generated CSV files')
+
+    run = commands.add_parser('run', help='time the stages of the cohort analysis')
+    run.add_argument('-r', '--repeat', type=int, default=1, help='number of runs (the best time of each stage is kept)')
+    run.add_argument('-tz', '--timezone', default='UTC', help='the timezone associated with the cohort groups')
+    run.add_argument('-d', '--days-per-bucket', metavar='DAYS', type=int, default=7, help='number of days per bucket')
+    run.add_argument('--columnar', action='store_true', help='store the customers and orders in typed arrays')
+    run.add_argument('--engine', choices=ENGINES, default='python', help='the cohort analysis engine')
+    run.add_argument('-j', '--processes', type=int, default=1, help='number of processes used for the analysis')
+    run.add_argument('--cache', action='store_true', help='load the CSV files through their binary cache')
+    run.add_argument('--sketch-precision', metavar='BITS', type=int, help='estimate the bucket counts with HyperLogLog sketches')
+    run.add_argument('--json', action='store_true', help='output one JSON object per directory')
+    run.add_argument('directories', nargs='+', help='the directories with the customers and orders CSV files')
+
+    startup = commands.add_parser('startup', help='time the start of the command line (with --help by default)')
+    startup.add_argument('-r', '--repeat', type=int, default=10, help='number of runs (the best time is kept)')
+    startup.add_argument('--max-seconds', type=float, help='fail when the best time is over this limit')
+    startup.add_argument('--json', action='store_true', help='output a JSON object')
+    startup.add_argument('arguments', nargs=argparse.REMAINDER, help='the command line arguments of cohort.py')
+    args = parser.parse_args()
+
+    if args.command == 'startup':
+        return _run_startup(args)
+
+    if args.command == 'generate':
+        num_customers, num_orders = generate_data(
+            args.directory,
+            args.customers,
+            orders_per_customer=args.orders_per_customer,
+            duplicate_rate=args.duplicate_rate,
+            num_days=args.days,
+            start_date=args.start_date,
+            seed=args.seed
+        )
+        print 'generated {} customers and {} orders in {}'.format(num_customers, num_orders, args.directory)
+        return 0
+
+    options = dict(
+        timezone=args.timezone,
+        days_per_bucket=args.days_per_bucket,
+        columnar=args.columnar,
+        engine=args.engine,
+        processes=args.processes,
+        sketch_precision=args.sketch_precision,
+    )
+
+    from prettytable import PrettyTable
+
+    ptable = PrettyTable(['Data', 'Customers', 'Orders'] + list(STAGES) + ['total'])
+    ptable.align = 'r'
+    for directory in args.directories:
+        best = OrderedDict()
+        for i in range(max(args.repeat, 1)):
+            num_customers, num_orders, timings = run_benchmark(directory, use_cache=args.cache, **options)
+            for stage, seconds in timings.items():
+                best[stage] = min(best.get(stage, seconds), seconds)
+
+        total = sum(best[i] for i in PIPELINE_STAGES)
+        if args.json:
+            print json.dumps(OrderedDict([
+                ('data', directory),
+                ('customers', num_customers),
+                ('orders', num_orders),
+                ('options', dict(options, cache=args.cache)),
+                ('timings', best),
+                ('total', total),
+            ]))
+        else:
+            ptable.add_row(
+                [directory, num_customers, num_orders] + ['{:.3f}'.format(best[i]) for i in STAGES] + ['{:.3f}'.format(total)]
+            )
+
+    if not args.json:
+        print ptable
+
+    return 0
+
+
+def _run_startup(args):
+    seconds, modules = run_startup_benchmark(args.arguments or ['--help'], repeat=args.repeat)
+    if args.json:
+        print json.dumps(OrderedDict([
+            ('arguments', args.arguments or ['--help']),
+            ('seconds', seconds),
+            ('modules', modules),
+        ]))
+    else:
+        print 'startup: {:.3f} seconds'.format(seconds)
+        print 'heavy modules imported by cohort.py: {}'.format(', '.join(modules) or 'none')
+
+    if args.max_seconds is not None and seconds > args.max_seconds:
+        print >> sys.stderr, 'startup time over the limit of {:.3f} seconds'.format(args.max_seconds)
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,292 @@
+import binascii
+
+from array import array
+from bisect import bisect_left
+
+
+# bits per value of the sparse representation
+SPARSE_ITEM_BITS = array('i').itemsize * 8
+
+
+class Bitmap(object):
+    __slots__ = ('_array', '_bits', '_count')
+
+    def __init__(self, indices=()):
+        """Constructor.
+
+        An immutable set of dense indices (small non-negative integers, e.g.,
+        the positions of the customers of a cohort group). Like the containers
+        of a Roaring bitmap, it is stored either as a sorted typed array of the
+        indices when they are sparse, or as a bitset (a Python long, so the
+        unions, intersections and cardinalities run in C) when they are dense;
+        either way, it uses a fraction of the memory of a set.
+
+        :param indices: iterable of non-negative integers (in any order, with duplicates).
+        """
+        super(Bitmap, self).__init__()
+
+        self._array = None
+        self._bits = None
+        self._count = None
+
+        indices = sorted(set(indices))
+        if indices and indices[0] < 0:
+            raise ValueError('bitmap indices must not be negative')
+
+        self._set_sorted(indices)
+
+    @classmethod
+    def from_sorted(cls, indices):
+        """Creates a bitmap from sorted, unique, non-negative indices (without checking them).
+
+        :param indices: sequence of integers.
+
+        :return: Bitmap
+        """
+        result = cls.__new__(cls)
+        result._array = None
+        result._bits = None
+        result._count = None
+        result._set_sorted(indices)
+
+        return result
+
+    @property
+    def is_sparse(self):
+        return self._array is not None
+
+    @property
+    def nbytes(self):
+        """The number of bytes of the indices (array items or bitset)."""
+        if self._array is not None:
+            return len(self._array) * self._array.itemsize
+
+        return (self._bits.bit_length() + 7) // 8
+
+    def __len__(self):
+        if self._count is None:
+            self._count = bin(self._bits).count('1')
+
+        return self._count
+
+    def __iter__(self):
+        if self._array is not None:
+            return iter(self._array)
+
+        return iter(_get_indices(self._bits))
+
+    def __contains__(self, index):
+        # the bitmaps of get_buckets used to be sets of user ids, so "user_id in
+        # bitmap" must not silently test a position instead
+        raise TypeError('Bitmaps hold positions: use contains() (or CohortGroup.has_customer for user ids)')
+
+    def contains(self, index):
+        """Whether an index is in the bitmap.
+
+        :param index: integer (e.g., the position of a customer in a cohort group).
+
+        :return: boolean
+        """
+        if index < 0:
+            return False
+
+        if self._array is not None:
+            position = bisect_left(self._array, index)
+            return position < len(self._array) and self._array[position] == index
+
+        return bool((self._bits >> index) & 1)
+
+    def __eq__(self, other):
+        if not isinstance(other, Bitmap):
+            return NotImplemented
+
+        return self._to_bits() == other._to_bits()
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+
+        return not result
+
+    def __hash__(self):
+        return hash(self._to_bits())
+
+    def __or__(self, other):
+        return self.union(other)
+
+    def __and__(self, other):
+        return self.intersection(other)
+
+    def __sub__(self, other):
+        return self.difference(other)
+
+    def __repr__(self):
+        return 'Bitmap({})'.format(list(self))
+
+    def union(self, other):
+        if self._array is not None and other._array is not None:
+            return Bitmap.from_sorted(sorted(set(self._array).union(other._array)))
+
+        return _from_bits(self._to_bits() | other._to_bits())
+
+    def intersection(self, other):
+        if self._array is not None and other._array is not None:
+            return Bitmap.from_sorted(sorted(set(self._array).intersection(other._array)))
+
+        return _from_bits(self._to_bits() & other._to_bits())
+
+    def intersection_count(self, other):
+        """The number of indices in both bitmaps, without building their intersection."""
+        if self._array is not None and other._array is not None:
+            return len(set(self._array).intersection(other._array))
+
+        return bin(self._to_bits() & other._to_bits()).count('1')
+
+    def difference(self, other):
+        if self._array is not None and other._array is not None:
+            return Bitmap.from_sorted(sorted(set(self._array).difference(other._array)))
+
+        return _from_bits(self._to_bits() & ~other._to_bits())
+
+    def _set_sorted(self, indices):
+        count = len(indices)
+        universe = (indices[-1] + 1) if count else 0
+        if count * SPARSE_ITEM_BITS <= universe:
+            self._array = array('i', indices)
+        else:
+            bitset = bytearray((universe + 7) // 8)
+            for index in indices:
+                bitset[index >> 3] |= 1 << (index & 7)
+            self._bits = _bytes_to_long(bitset)
+
+        self._count = count
+
+    def _to_bits(self):
+        if self._bits is not None:
+            return self._bits
+
+        if not self._array:
+            return 0
+
+        bitset = bytearray((self._array[-1] + 8) // 8)
+        for index in self._array:
+            bitset[index >> 3] |= 1 << (index & 7)
+
+        return _bytes_to_long(bitset)
+
+
+def _from_bits(bits):
+    # picks the representation of the bitset of an operation
+    count = bin(bits).count('1')
+    if count * SPARSE_ITEM_BITS <= bits.bit_length():
+        return Bitmap.from_sorted(_get_indices(bits))
+
+    result = Bitmap.__new__(Bitmap)
+    result._array = None
+    result._bits = bits
+    result._count = count
+
+    return result
+
+
+def _get_indices(bits):
+    # the positions of the set bits, lowest first
+    text = bin(bits)[:1:-1]
+    result = []
+    index = text.find('1')
+    while index >= 0:
+        result.append(index)
+        index = text.find('1', index + 1)
+
+    return result
+
+
+def _bytes_to_long(bitset):
+    # little endian bytes
+    if not bitset:
+        return 0
+
+    return int(binascii.hexlify(bytes(bitset[::-1])), 16)
+
+
+class IdSet(object):
+    def __init__(self, min_bits=1 << 16):
+        """Constructor.
+
+        A growable set of integer ids (e.g., the order ids seen so far). The ids
+        are kept in a bitset (one bit per id up to the largest one), which only
+        grows while it takes at most 2 * SPARSE_ITEM_BITS bits per id (a set
+        takes hundreds); the ids too large for it (or negative) are kept in a set.
+
+        :param min_bits: the number of bits the bitset may always grow to.
+        """
+        super(IdSet, self).__init__()
+
+        self._bits = bytearray()
+        self._size = 0
+        self._others = set()
+        self._count = 0
+        self._min_bits = min_bits
+
+    @property
+    def nbytes(self):
+        """The number of bytes of the bitset (the ids of the set not included)."""
+        return len(self._bits)
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, value):
+        if 0 <= value < self._size and self._bits[value >> 3] & (1 << (value & 7)):
+            return True
+
+        return bool(self._others) and value in self._others
+
+    def add(self, value):
+        """Adds an id.
+
+        :param value: an integer.
+
+        :return: boolean whether the id was added (False when it was already there)
+        """
+        bits = self._bits
+        if not 0 <= value < self._size:
+            if value < 0 or not self._grow(value):
+                if value in self._others:
+                    return False
+
+                self._others.add(value)
+                self._count += 1
+                return True
+
+            bits = self._bits
+
+        mask = 1 << (value & 7)
+        if bits[value >> 3] & mask:
+            return False
+
+        bits[value >> 3] |= mask
+        self._count += 1
+
+        return True
+
+    def _grow(self, value):
+        # doubles the bitset to fit the value, unless it would become too sparse
+        size = max(self._size * 2, self._min_bits)
+        while size <= value:
+            size *= 2
+
+        if size > max(self._min_bits, (self._count + 1) * SPARSE_ITEM_BITS * 2):
+            return False
+
+        self._bits.extend(bytearray((size - self._size) // 8))
+        self._size = size
+
+        # the ids of the set that now fit in the bitset
+        moved = [i for i in self._others if 0 <= i < size]
+        for i in moved:
+            self._others.discard(i)
+            self._bits[i >> 3] |= 1 << (i & 7)
+
+        return True
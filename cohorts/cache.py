@@ -0,0 +1,153 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+
+from array import array
+
+
+MAGIC = 'COHORTS\x01'
+HEADER_SIZE = struct.Struct('<I')
+ITEM_SIZE = 8
+HASH_CHUNK_SIZE = 1 << 20
+
+
+class ColumnCache(object):
+    def __init__(self, file_path, cache_path=None):
+        """Constructor.
+
+        A binary sidecar of the parsed integer columns of a data file (e.g., ids
+        and UTC epoch seconds). The sidecar holds a small JSON header followed
+        by each column as contiguous native 64-bit integers, so it can be mapped
+        into memory and copied straight into typed arrays.
+
+        The sidecar is keyed on the size, modification time and content hash
+        of the data file: a different size invalidates it, and a different
+        modification time only invalidates it when the content hash changed.
+
+        :param file_path: the path to the data file.
+        :param cache_path: the path to the sidecar (defaults to "<file_path>.cache").
+        """
+        super(ColumnCache, self).__init__()
+
+        self._file_path = file_path
+        self._cache_path = cache_path or (file_path + '.cache')
+
+    @property
+    def cache_path(self):
+        return self._cache_path
+
+    def load(self, fields):
+        """Loads the columns from the sidecar.
+
+        :param fields: the names of the columns to load.
+
+        :return: dict of typed arrays by column name, or None when the sidecar
+            is missing, stale or does not have all the columns
+        """
+        if array('l').itemsize != ITEM_SIZE or not os.path.exists(self._cache_path):
+            return None
+
+        with open(self._cache_path, 'rb') as cachefile:
+            try:
+                data = mmap.mmap(cachefile.fileno(), 0, access=mmap.ACCESS_READ)
+            except (mmap.error, ValueError):
+                # empty or unreadable sidecar
+                return None
+
+            try:
+                header = self._read_header(data)
+                if header is None or not self._is_valid(header) or not set(fields) <= set(header['fields']):
+                    return None
+
+                num_rows = header['rows']
+                offset = header['offset']
+                result = dict()
+                for field in header['fields']:
+                    if field in fields:
+                        result[field] = array('l')
+                        result[field].fromstring(data[offset:offset + (num_rows * ITEM_SIZE)])
+
+                    offset += num_rows * ITEM_SIZE
+            finally:
+                data.close()
+
+        return result
+
+    def save(self, columns):
+        """Saves the columns to the sidecar (atomically replacing any previous one).
+
+        :param columns: list of (column name, typed array) tuples, all of the same length.
+        """
+        if array('l').itemsize != ITEM_SIZE:
+            return
+
+        lengths = set(len(values) for field, values in columns)
+        if len(lengths) > 1:
+            raise ValueError('all columns must have the same length')
+
+        stat = os.stat(self._file_path)
+        header = {
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'sha1': self._get_hash(),
+            'byteorder': sys.byteorder,
+            'rows': lengths.pop() if lengths else 0,
+            'fields': [field for field, values in columns],
+        }
+
+        # align the columns on 8 bytes
+        header_size = len(MAGIC) + HEADER_SIZE.size
+        header_data = json.dumps(header)
+        header_data += ' ' * (-(header_size + len(header_data)) % ITEM_SIZE)
+
+        temp_path = '{}.{}.tmp'.format(self._cache_path, os.getpid())
+        with open(temp_path, 'wb') as cachefile:
+            cachefile.write(MAGIC)
+            cachefile.write(HEADER_SIZE.pack(len(header_data)))
+            cachefile.write(header_data)
+            for field, values in columns:
+                if not (isinstance(values, array) and values.typecode == 'l'):
+                    values = array('l', values)
+                values.tofile(cachefile)
+
+        os.rename(temp_path, self._cache_path)
+
+    def _read_header(self, data):
+        header_size = len(MAGIC) + HEADER_SIZE.size
+        if len(data) < header_size or data[:len(MAGIC)] != MAGIC:
+            return None
+
+        json_size = HEADER_SIZE.unpack_from(data, len(MAGIC))[0]
+        try:
+            header = json.loads(data[header_size:header_size + json_size])
+        except ValueError:
+            return None
+
+        header['offset'] = header_size + json_size
+        expected_size = header['offset'] + (header['rows'] * ITEM_SIZE * len(header['fields']))
+        if header.get('byteorder') != sys.byteorder or len(data) != expected_size:
+            return None
+
+        return header
+
+    def _is_valid(self, header):
+        stat = os.stat(self._file_path)
+        if stat.st_size != header['size']:
+            return False
+
+        if stat.st_mtime != header['mtime']:
+            # touched or copied; only the content matters
+            return self._get_hash() == header['sha1']
+
+        return True
+
+    def _get_hash(self):
+        result = hashlib.sha1()
+        with open(self._file_path, 'rb') as datafile:
+            for chunk in iter(lambda: datafile.read(HASH_CHUNK_SIZE), ''):
+                result.update(chunk)
+
+        return result.hexdigest()
@@ -1,11 +1,48 @@
 import argparse
 import csv
-import pendulum
+import os
 import sys
 import time
 
+from array import array
+from bitmap import Bitmap
+from bitmap import IdSet
+from cache import ColumnCache
+from collections import OrderedDict
 from collections import defaultdict
-from prettytable import PrettyTable
+from compression import is_compressed
+from compression import open_data_file
+from instrument import Instrumentation
+from itertools import imap
+from itertools import izip
+from operator import attrgetter
+from operator import itemgetter
+from output import FORMATS
+from output import get_writer
+from sketch import DEFAULT_PRECISION
+from sketch import HyperLogLog
+from sketch import MAX_PRECISION
+from sketch import MIN_PRECISION
+from sketch import get_relative_error
+from store import ColumnStore
+from store import ShardedStore
+from store import SpilledStore
+from timeparse import SECONDS_PER_DAY
+from timeparse import Timestamp
+from timeparse import TimestampParser
+from timeparse import as_timestamp
+from timeparse import to_datetime
+
+
+ENGINES = ('python', 'numpy')
+DATE_FIELDS = ('created',)
+BYTES_PER_MB = 1024 * 1024
+PARSE_CHUNK_SIZE = 32 * BYTES_PER_MB
+STAGES = ('load customers', 'load orders', 'load', 'add customers', 'add orders', 'analyze', 'render')
+
+# the heavy modules (multiprocessing, numpy, pendulum and prettytable) are imported
+# by the code paths that use them, so the command line starts fast (e.g., for
+# --help, argument errors or small jobs run in a loop); see benchmark.py startup
 
 
 class CohortAnalysis(object):
@@ -13,18 +50,68 @@ class CohortAnalysis(object):
             self,
             days_per_bucket=7,
             timezone='UTC',
-            verbosity=0):
+            verbosity=0,
+            columnar=False,
+            engine='python',
+            processes=1,
+            instrumentation=None,
+            memory_budget=None,
+            spill_directory=None,
+            sketch_precision=None,
+            filter_orders=False):
         """Constructor.
 
         :param days_per_bucket: the number of days per cohort group.
         :param timezone: the timezone used to perform the cohort analysis.
         :param verbosity: integer > 0 that represents the debugging verbosity.
+        :param columnar: whether to keep the customers and orders in a ColumnStore
+            (typed arrays) instead of per-row dictionaries.
+        :param engine: 'python' or 'numpy'; the numpy engine computes the cohort matrix
+            with array operations and always uses the ColumnStore.
+        :param processes: the number of processes used to analyze the data; with more
+            than one, the customers and their orders are sharded by user id into
+            ColumnStores that are analyzed in parallel and their counts are merged.
+            Order ids are expected to be unique across customers, since duplicates
+            can only be detected within a shard (unless filter_orders is set).
+        :param instrumentation: the Instrumentation recording the time spent (and rows
+            processed) in each stage; a new one by default.
+        :param memory_budget: the number of bytes of memory the customers and orders may
+            use; when set, they are spilled to disk (see SpilledStore) and analyzed one
+            partition at a time (split between the processes), and their counts are merged.
+        :param spill_directory: the directory of the spilled files (defaults to the system
+            temporary directory).
+        :param sketch_precision: when set, the distinct customers of each bucket are
+            estimated with HyperLogLog sketches of this precision (see HyperLogLog),
+            which use bounded memory per bucket and merge across partitions; the
+            relative standard error of the estimates is given by relative_error.
+        :param filter_orders: whether to drop the orders as they are added when their
+            order id was already added (the first one added is kept, whatever its
+            date) or, once customers were added, when their user is not a customer;
+            the ids are kept in compact IdSets and the number of orders dropped for
+            each reason is given by dropped_orders. The customers should then be
+            added before their orders.
         """
         super(CohortAnalysis, self).__init__()
 
         if not days_per_bucket or days_per_bucket <= 0:
             raise ValueError('days per bucket must be greater than 0')
 
+        if engine not in ENGINES:
+            raise ValueError('engine must be one of: {}'.format(', '.join(ENGINES)))
+        elif engine == 'numpy':
+            from engine import numpy
+            if numpy is None:
+                raise ValueError('the numpy engine requires numpy')
+
+        if not processes or processes <= 0:
+            raise ValueError('number of processes must be greater than 0')
+
+        if memory_budget is not None and memory_budget <= 0:
+            raise ValueError('memory budget must be greater than 0')
+
+        if sketch_precision is not None and not MIN_PRECISION <= sketch_precision <= MAX_PRECISION:
+            raise ValueError('sketch precision must be between {} and {}'.format(MIN_PRECISION, MAX_PRECISION))
+
         self._customer_join_date = defaultdict(dict)
         self._cust_orders = defaultdict(list)
         self._min_customer_join_date = None
@@ -32,43 +119,220 @@ class CohortAnalysis(object):
         self._days_per_bucket = days_per_bucket
         self._cohort_groups = list()
         self._verbosity = verbosity
+        self._engine = engine
+        self._processes = processes
+        self._memory_budget = memory_budget
+        self._sketch_precision = sketch_precision
+        self._matrix = None
+        self._group_counts = None
+        self._group_sketches = None
+
+        # ingest filtering state (see filter_orders)
+        self._order_ids = IdSet() if filter_orders else None
+        self._customer_ids = IdSet() if filter_orders else None
+        self._dropped_orders = OrderedDict([('duplicate', 0), ('orphan', 0)])
+
+        # incremental analysis state (set by analyze)
+        self._dirty_users = None
+        self._customer_groups = None
+        self._order_index = None
+        self._indexed_rows = 0
+        self._late_rows = None
 
         if timezone:
             self._timezone = timezone
         else:
             self._timezone = 'UTC'
 
+        self._parser = TimestampParser(self._timezone)
+        self._instrumentation = instrumentation or Instrumentation()
+
+        if memory_budget:
+            self._store = SpilledStore(memory_budget // processes, spill_directory, self._parser.offset)
+        elif processes > 1:
+            self._store = ShardedStore(processes)
+        elif columnar or engine == 'numpy':
+            self._store = ColumnStore()
+        else:
+            self._store = None
+
+    @property
+    def instrumentation(self):
+        return self._instrumentation
+
+    @property
+    def relative_error(self):
+        """The relative standard error of the bucket counts (None when they are exact)."""
+        if self._sketch_precision is None:
+            return None
+
+        return get_relative_error(self._sketch_precision)
+
+    @property
+    def dropped_orders(self):
+        """The number of orders dropped by filter_orders, by reason ('duplicate' and 'orphan')."""
+        return OrderedDict(self._dropped_orders)
+
+    @property
+    def num_customers(self):
+        if self._store is not None:
+            return self._store.num_customers
+
+        return len(self._customer_join_date)
+
+    def reconfigure(self, timezone=None, days_per_bucket=None):
+        """Changes the timezone and/or the number of days per bucket of the analysis
+        without adding the customers and orders again; the next analyze() starts over.
+
+        The customers and orders must be kept in a column store (columnar, the numpy
+        engine, several processes or a memory budget), since only their UTC offsets
+        are recomputed.
+
+        :param timezone: the new timezone (None keeps the current one).
+        :param days_per_bucket: the new number of days per bucket (None keeps the current one).
+        """
+        if self._store is None:
+            raise ValueError('reconfiguring requires a column store')
+
+        if days_per_bucket is not None:
+            if days_per_bucket <= 0:
+                raise ValueError('days per bucket must be greater than 0')
+
+            self._days_per_bucket = days_per_bucket
+
+        if timezone and timezone != self._timezone:
+            self._timezone = timezone
+            self._parser = TimestampParser(timezone)
+            self._store.localize(self._parser.offset)
+
+            if self._min_customer_join_date is not None:
+                self._min_customer_join_date = self._parser.from_epoch(self._min_customer_join_date.epoch)
+                self._max_customer_join_date = self._parser.from_epoch(self._max_customer_join_date.epoch)
+
+        self._cohort_groups = list()
+        self._matrix = None
+        self._group_counts = None
+        self._dirty_users = None
+        self._customer_groups = None
+        self._late_rows = None
+
+    def sweep(self, configurations):
+        """Analyzes the same customers and orders with several configurations, one
+        after the other; the parsed dates and the per-user order index are shared, and
+        only the UTC offsets are recomputed when the timezone changes (see reconfigure).
+
+        :param configurations: iterable of (timezone, days_per_bucket) tuples.
+
+        :return: generator of the (timezone, days_per_bucket) tuples, each one yielded
+            once the analysis (e.g., print_table) reflects it
+        """
+        for timezone, days_per_bucket in configurations:
+            self.reconfigure(timezone, days_per_bucket)
+            self.analyze()
+
+            yield timezone, days_per_bucket
+
     def add_customer(self, user_id, date_created):
         """Add a customer to be analyzed.
 
         :param user_id: the user id associated with the order.
         :param date_created: the join date of the customer, specified as a date/time
-            string in UTC (e.g., "2015-07-03 22:57:23")
+            string in UTC (e.g., "2015-07-03 22:57:23"); the fixed format is parsed
+            without pendulum (see TimestampParser)
 
         :return: boolean whether the customer was added successfully
         """
+        self.add_customers(((user_id, date_created),))
+
+        return True
+
+    def add_customers(self, customers):
+        """Add a batch of customers to be analyzed.
 
-        if not (user_id and date_created):
-            raise ValueError('all arguments are required')
+        The join date range is only updated once for the whole batch (even when
+        a row is rejected, for the rows added before it).
 
-        if not isinstance(date_created, basestring):
-            raise ValueError('order date must be a UTC string format "YYYY-MM-DD HH:mm:ss"')
+        :param customers: iterable of (user_id, date_created) tuples; see add_customer.
 
-        join_date = pendulum.parse(date_created, tz='UTC').in_timezone(self._timezone)
+        :return: the number of customers added
+        """
+        with self._instrumentation.span('add customers') as timer:
+            timer.rows = count = self._add_customers(self._parse_customers(customers))
 
-        if not self._min_customer_join_date:
-            self._min_customer_join_date = join_date
-        elif join_date < self._min_customer_join_date:
-            self._min_customer_join_date = join_date
+        return count
 
-        if not self._max_customer_join_date:
-            self._max_customer_join_date = join_date
-        elif join_date > self._max_customer_join_date:
-            self._max_customer_join_date = join_date
+    def add_customer_epochs(self, user_ids, epochs):
+        """Add a batch of customers with already parsed join dates (e.g., loaded
+        from a ColumnCache).
 
-        self._customer_join_date[int(user_id)] = join_date
+        :param user_ids: sequence of user ids (integers).
+        :param epochs: sequence of join dates as UTC epoch seconds (integers).
 
-        return True
+        :return: the number of customers added
+        """
+        _check_columns(user_ids, epochs)
+
+        with self._instrumentation.span('add customers') as timer:
+            timer.rows = count = self._add_customers(izip(user_ids, imap(self._parser.from_epoch, epochs)))
+
+        return count
+
+    def _parse_customers(self, customers):
+        parse = self._parser.parse
+        for user_id, date_created in customers:
+            if not (user_id and date_created):
+                raise ValueError('all arguments are required')
+
+            if not isinstance(date_created, basestring):
+                raise ValueError('order date must be a UTC string format "YYYY-MM-DD HH:mm:ss"')
+
+            yield user_id, parse(date_created)
+
+    def _add_customers(self, customers):
+        dirty_users = self._dirty_users
+        if self._store is not None:
+            add = self._store.add_customer
+        else:
+            add = self._customer_join_date.__setitem__
+
+        customer_ids = self._customer_ids
+        min_join_date = self._min_customer_join_date
+        max_join_date = self._max_customer_join_date
+        count = 0
+        try:
+            for user_id, join_date in customers:
+                if not min_join_date or join_date < min_join_date:
+                    min_join_date = join_date
+
+                if not max_join_date or join_date > max_join_date:
+                    max_join_date = join_date
+
+                user_id = int(user_id)
+                index = add(user_id, join_date)
+                if dirty_users is not None:
+                    dirty_users.add(user_id if index is None else index)
+
+                if customer_ids is not None:
+                    customer_ids.add(user_id)
+
+                count += 1
+        finally:
+            self._min_customer_join_date = min_join_date
+            self._max_customer_join_date = max_join_date
+
+        return count
+
+    def add_customer_columns(self, user_ids, dates_created):
+        """Add a batch of customers given as parallel column sequences.
+
+        :param user_ids: sequence of user ids.
+        :param dates_created: sequence of join dates; see add_customer.
+
+        :return: the number of customers added
+        """
+        _check_columns(user_ids, dates_created)
+
+        return self.add_customers(izip(user_ids, dates_created))
 
     def add_order(
             self,
@@ -86,117 +350,496 @@ class CohortAnalysis(object):
 
         :return: boolean whether the order was added successfully
         """
+        self.add_orders(((user_id, order_id, order_number, date_created),))
 
-        if not (user_id and order_id and order_number and date_created):
-            raise ValueError('all arguments are required')
+        return True
 
-        if not isinstance(date_created, basestring):
-            raise ValueError('order date must be a UTC string format "YYYY-MM-DD HH:mm:ss"')
+    def add_orders(self, orders):
+        """Add a batch of orders to be analyzed.
 
-        order_date = pendulum.parse(date_created, tz='UTC').in_timezone(self._timezone)
+        :param orders: iterable of (user_id, order_id, order_number, date_created)
+            tuples; see add_order.
 
-        self._cust_orders[int(user_id)].append({
-            'id': int(order_id),
-            'order_number': int(order_number),
-            'created': order_date
-        })
+        :return: the number of orders added
+        """
+        with self._instrumentation.span('add orders') as timer:
+            timer.rows = count = self._add_orders(self._parse_orders(orders))
 
-        return True
+        return count
+
+    def add_order_epochs(self, user_ids, order_ids, order_numbers, epochs):
+        """Add a batch of orders with already parsed dates (e.g., loaded from a
+        ColumnCache).
+
+        :param user_ids: sequence of user ids (integers).
+        :param order_ids: sequence of order ids (integers).
+        :param order_numbers: sequence of order numbers (integers).
+        :param epochs: sequence of order dates as UTC epoch seconds (integers).
+
+        :return: the number of orders added
+        """
+        _check_columns(user_ids, order_ids, order_numbers, epochs)
+
+        with self._instrumentation.span('add orders') as timer:
+            timer.rows = count = self._add_orders(
+                izip(user_ids, order_ids, order_numbers, imap(self._parser.from_epoch, epochs))
+            )
+
+        return count
+
+    def _parse_orders(self, orders):
+        parse = self._parser.parse
+        for user_id, order_id, order_number, date_created in orders:
+            if not (user_id and order_id and order_number and date_created):
+                raise ValueError('all arguments are required')
+
+            if not isinstance(date_created, basestring):
+                raise ValueError('order date must be a UTC string format "YYYY-MM-DD HH:mm:ss"')
+
+            yield user_id, order_id, order_number, parse(date_created)
+
+    def _add_orders(self, orders):
+        store = self._store
+        cust_orders = self._cust_orders
+        dirty_users = self._dirty_users
+        order_ids = self._order_ids
+        customer_ids = self._customer_ids
+        dropped = self._dropped_orders
+
+        count = 0
+        for user_id, order_id, order_number, order_date in orders:
+            user_id = int(user_id)
+            if order_ids is not None:
+                if customer_ids and user_id not in customer_ids:
+                    dropped['orphan'] += 1
+                    continue
+
+                order_id = int(order_id)
+                if not order_ids.add(order_id):
+                    dropped['duplicate'] += 1
+                    continue
+
+            if store is not None:
+                row = store.add_order(user_id, int(order_id), int(order_number), order_date)
+                if dirty_users is not None:
+                    dirty_users.add(store.order_user[row])
+            else:
+                cust_orders[user_id].append(Order(user_id, int(order_id), int(order_number), order_date))
+                if dirty_users is not None:
+                    dirty_users.add(user_id)
+
+            count += 1
+
+        return count
+
+    def add_order_columns(self, user_ids, order_ids, order_numbers, dates_created):
+        """Add a batch of orders given as parallel column sequences.
+
+        :param user_ids: sequence of user ids.
+        :param order_ids: sequence of order ids.
+        :param order_numbers: sequence of order numbers.
+        :param dates_created: sequence of order dates; see add_order.
+
+        :return: the number of orders added
+        """
+        _check_columns(user_ids, order_ids, order_numbers, dates_created)
+
+        return self.add_orders(izip(user_ids, order_ids, order_numbers, dates_created))
 
-    def analyze(self):
+    def analyze(self, incremental=False):
         """Perform the actual cohort analysis and generate the summarized data
         based on the customer and order collected.
+
+        :param incremental: only update the cohort groups affected by the customers
+            and orders added since the previous analysis. New groups are added when
+            the join date range grows; when the group boundaries shift (the newest
+            join day moved by a number of days that is not a multiple of
+            days_per_bucket) or with the numpy engine, several processes or a memory
+            budget, everything is recomputed.
         """
+        with self._instrumentation.span('analyze') as timer:
+            self._analyze(incremental)
+            timer.rows = self.num_customers
+
+    def _analyze(self, incremental):
         if self._verbosity > 0:
-            print 'DEBUG: analyzing - min cust join date:', self._min_customer_join_date
-            print 'DEBUG: analyzing - max cust join date:', self._max_customer_join_date
+            print 'DEBUG: analyzing - min cust join date:', to_datetime(self._min_customer_join_date, self._timezone)
+            print 'DEBUG: analyzing - max cust join date:', to_datetime(self._max_customer_join_date, self._timezone)
 
         # create the cohort groups
         cohort_groups = self._generate_groups(
             self._min_customer_join_date,
             self._max_customer_join_date,
-            self._timezone,
             self._days_per_bucket,
         )
         if not cohort_groups:
             raise ValueError('no groups were created')
 
-        # reverse sort the customers since the cohort groups are also returned by reverse date
-        rev_sorted_customer_ids = sorted(
-            self._customer_join_date.keys(),
-            key=lambda x: self._customer_join_date[x],
-            reverse=True
-        )
+        if incremental and self._dirty_users is not None:
+            reused_groups = self._reuse_groups(cohort_groups)
+            if reused_groups is not None:
+                self._analyze_incremental(reused_groups)
+                self._cohort_groups = reused_groups
+                self._dirty_users = set()
+                return
+
+            if self._verbosity > 0:
+                print 'DEBUG: group boundaries changed - full analysis'
+
+        self._matrix = None
+        self._group_counts = None
+        self._group_sketches = None
+        if self._processes > 1 or self._memory_budget:
+            self._analyze_partitions(cohort_groups)
+        elif self._engine == 'numpy':
+            self._analyze_numpy(cohort_groups)
+        elif self._store is not None:
+            self._analyze_columns(cohort_groups)
+        else:
+            self._analyze_rows(cohort_groups)
+
+        # data grouping complete; keep track of the changes from now on
+        self._cohort_groups = cohort_groups
+        if self._engine != 'numpy' and self._processes == 1 and not self._memory_budget:
+            self._dirty_users = set()
+
+    def _analyze_rows(self, cohort_groups):
+        """Populates the cohort groups from the per-row customers and orders."""
 
         # add all the customers to the appropriate cohort groups
-        num_cohort_groups = len(cohort_groups)
-        grp_num = 0
+        end_day = self._max_customer_join_date.local_day
+        customer_groups = dict()
+        group_members = defaultdict(list)
         cust_count = 0
-        cohort_grp = cohort_groups[grp_num]
-        for user_id in rev_sorted_customer_ids:
+        for user_id, cust_join_date in self._customer_join_date.iteritems():
             cust_count += 1
-            cust_join_date = self._customer_join_date[user_id]
 
-            # find the right cohort group
-            is_in_group = cohort_grp.is_date_in_group(cust_join_date)
-            while not is_in_group and (grp_num < num_cohort_groups):
-                grp_num += 1
-                cohort_grp = cohort_groups[grp_num]
-                is_in_group = cohort_grp.is_date_in_group(cust_join_date)
+            cohort_grp = self._find_group(cohort_groups, end_day, cust_join_date)
+            group_members[cohort_grp].append(user_id)
 
-            cohort_grp.add_customer(user_id, cust_join_date)
+            # remember the group for the incremental analysis
+            customer_groups[user_id] = cohort_grp
 
         if self._verbosity > 0:
             print 'DEBUG: # customers:', cust_count
             print 'DEBUG: # exp #:', len(self._customer_join_date)
 
-        # iterate thru each customer to get all of their orders
-        users_found = 0
-        for user_id in self._cust_orders.keys():
-            # skip any customers that we do not have any join date information
-            if not self._customer_join_date.get(user_id):
-                continue
+        for cohort_grp in cohort_groups:
+            self._fill_group(cohort_grp, group_members[cohort_grp])
 
-            user_join_date = self._customer_join_date[user_id]
-            customer_orders_list = sorted(
-                self._cust_orders[user_id],
-            )
+        self._customer_groups = customer_groups
+
+    def _fill_group(self, cohort_grp, user_ids):
+        """Adds customers (by user id) and all of their orders to a group.
 
-            # find the appropriate cohort bucket
-            found_group = None
-            for grp in cohort_groups:
-                if grp.is_date_in_group(user_join_date):
-                    found_group = grp
-                    break
+        The customers are walked by descending join date (then user id), whatever
+        the order of user_ids, so a full and an incremental analysis keep the same
+        copy of an order id shared by several customers.
+        """
+        user_ids = sorted(sorted(user_ids), key=self._customer_join_date.get, reverse=True)
 
-            if not found_group:
-                # should never get this condition with no cohort group found
-                raise ValueError('cohort group not found')
+        for user_id in user_ids:
+            cohort_grp.add_customer(user_id, self._customer_join_date[user_id])
 
-            # make sure the orders are unique
+        # iterate thru each customer to get all of their orders
+        for user_id in user_ids:
+            customer_orders_list = sorted(
+                self._cust_orders.get(user_id) or [],
+                key=_order_key
+            )
+
+            # the group ignores the duplicate orders
             order_num = 0
             for order in customer_orders_list:
-                order_id = order['id']
-                order_date = order['created']
+                order_num += 1
+                cohort_grp.add_order_record(order, order_num)
+
+    def _find_group(self, cohort_groups, end_day, join_date):
+        """Finds the cohort group of a join date in constant time.
+
+        The groups are consecutive runs of days_per_bucket local days going
+        back from end_day (the last day of the newest group), so the index of
+        the group is the number of whole buckets between the two days.
 
+        :param cohort_groups: the cohort groups, newest first.
+        :param end_day: the local day number of the last day of the newest group.
+        :param join_date: the join date Timestamp.
+
+        :return: the CohortGroup
+        """
+        index = (end_day - join_date.local_day) // self._days_per_bucket
+        if index < 0 or index >= len(cohort_groups):
+            # should never get this condition with no cohort group found
+            raise ValueError('cohort group not found')
+
+        return cohort_groups[index]
+
+    def _analyze_columns(self, cohort_groups):
+        """Populates the cohort groups from the column store.
+
+        The customers of each group are walked by descending join date, with each
+        customer's orders added right after it.
+        """
+        store = self._store
+        self._order_index = store.orders_by_user()
+        self._indexed_rows = store.num_orders
+        self._late_rows = defaultdict(list)
+
+        end_day = self._max_customer_join_date.local_day
+        customer_groups = [None] * store.num_users
+        group_members = defaultdict(list)
+        for index in store.customer_indices():
+            cohort_grp = self._find_group(cohort_groups, end_day, store.join_date(index))
+            group_members[cohort_grp].append(index)
+            customer_groups[index] = cohort_grp
+
+        for cohort_grp in cohort_groups:
+            self._fill_columnar_group(cohort_grp, group_members[cohort_grp])
+
+        if self._verbosity > 0:
+            print 'DEBUG: # customers:', store.num_customers
+            print 'DEBUG: # orders:', store.num_orders
+
+        self._customer_groups = customer_groups
+
+    def _fill_columnar_group(self, cohort_grp, indices):
+        """Adds customers (by dense index) and all of their orders to a group."""
+        store = self._store
+        starts, rows = self._order_index
+        num_indexed_users = len(starts) - 1
+
+        # then by index (like the NumPy engine), so a full and an incremental
+        # analysis keep the same copy of an order id shared by several customers
+        rev_sorted_customers = sorted(
+            sorted(indices),
+            key=lambda x: (store.join_epoch[x], store.join_offset[x]),
+            reverse=True
+        )
+
+        order_ids = set()
+        for index in rev_sorted_customers:
+            cohort_grp.add_customer_index(index)
+
+            customer_rows = self._late_rows.get(index, [])
+            if index < num_indexed_users:
+                customer_rows = list(rows[starts[index]:starts[index + 1]]) + customer_rows
+
+            # order the customer's orders the same way as the per-row analysis
+            customer_rows.sort(
+                key=lambda x: (store.order_epoch[x], store.order_offset[x], store.order_id[x], store.order_number[x])
+            )
+
+            order_num = 0
+            for row in customer_rows:
                 order_num += 1
-                found_group.add_order(
-                    user_id,
-                    order_id,
-                    order_date,
-                    order_num
-                )
 
-            users_found += 1
+                # ignore duplicate orders
+                order_id = store.order_id[row]
+                if order_id in order_ids:
+                    continue
 
-        # data grouping complete
-        self._cohort_groups = cohort_groups
+                order_ids.add(order_id)
+                cohort_grp.add_order_row(row, order_num)
+
+    def _reuse_groups(self, cohort_groups):
+        """Matches freshly generated groups with the groups of the previous analysis.
+
+        :return: list of groups (previous groups renumbered, new groups for the
+            new date ranges) or None when the group boundaries changed
+        """
+        previous_groups = dict(
+            ((grp._start_epoch, grp._end_epoch), grp)
+            for grp in self._cohort_groups
+        )
+
+        result = list()
+        for grp in cohort_groups:
+            previous_grp = previous_groups.pop((grp._start_epoch, grp._end_epoch), None)
+            if previous_grp is not None:
+                previous_grp.renumber(grp.group_number)
+                grp = previous_grp
+
+            result.append(grp)
+
+        if previous_groups:
+            return None
+
+        return result
+
+    def _analyze_incremental(self, cohort_groups):
+        """Refills only the cohort groups gaining or losing customers (or orders)
+        since the previous analysis.
+        """
+        end_day = self._max_customer_join_date.local_day
+        store = self._store
+
+        if store is not None:
+            # index the orders added since the previous analysis by customer
+            order_user = store.order_user
+            for row in xrange(self._indexed_rows, store.num_orders):
+                self._late_rows[order_user[row]].append(row)
+            self._indexed_rows = store.num_orders
+
+            self._customer_groups.extend([None] * (store.num_users - len(self._customer_groups)))
+
+        affected_groups = set()
+        for user in self._dirty_users:
+            previous_grp = self._customer_groups[user] if store is not None else self._customer_groups.get(user)
+            if previous_grp is not None:
+                affected_groups.add(previous_grp)
+
+            if store is not None:
+                join_date = store.join_date(user) if store.joined[user] else None
+            else:
+                join_date = self._customer_join_date.get(user)
+
+            if join_date is not None:
+                cohort_grp = self._find_group(cohort_groups, end_day, join_date)
+                affected_groups.add(cohort_grp)
+                self._customer_groups[user] = cohort_grp
+
+        if self._verbosity > 0:
+            print 'DEBUG: incremental - # changed customers:', len(self._dirty_users)
+            print 'DEBUG: incremental - # affected groups:', len(affected_groups)
+
+        for cohort_grp in affected_groups:
+            if store is not None:
+                members = [i for i in cohort_grp.customer_indices if self._customer_groups[i] is cohort_grp]
+                members.extend(i for i in self._dirty_users if self._customer_groups[i] is cohort_grp)
+                cohort_grp.clear()
+                self._fill_columnar_group(cohort_grp, set(members))
+            else:
+                members = [i for i in cohort_grp.customer_ids if self._customer_groups[i] is cohort_grp]
+                members.extend(i for i in self._dirty_users if self._customer_groups.get(i) is cohort_grp)
+                cohort_grp.clear()
+                self._fill_group(cohort_grp, set(members))
+
+    def _analyze_numpy(self, cohort_groups):
+        """Populates the cohort groups and the cohort matrix with the NumPy engine."""
+        from engine import analyze_store
+
+        matrix, assignment = analyze_store(
+            self._store,
+            self._max_customer_join_date.local_day,
+            len(cohort_groups),
+            self._days_per_bucket,
+        )
+
+        for i, grp in enumerate(cohort_groups):
+            grp.add_customer_indices(assignment.customer_indices[i])
+            grp.add_order_rows(assignment.order_rows[i], assignment.order_nums[i])
+
+        if self._verbosity > 0:
+            print 'DEBUG: # customers:', self._store.num_customers
+            print 'DEBUG: # orders:', self._store.num_orders
+
+        self._matrix = matrix
+
+    def _analyze_partitions(self, cohort_groups):
+        """Analyzes each partition of the ShardedStore (or SpilledStore) on its own,
+        in separate processes when there are several, and merges the per-group,
+        per-bucket customer counts. The partitions are disjoint sets of customers,
+        so the counts simply add up (and the HyperLogLog sketches are merged).
+        """
+        global _parallel_analysis
+
+        num_partitions = self._store.num_partitions
+        processes = min(self._processes, num_partitions)
+
+        if processes > 1:
+            # the workers are forked, so they read the partitions from this analysis
+            _parallel_analysis = self
+            try:
+                import multiprocessing
+
+                pool = multiprocessing.Pool(processes=processes)
+                try:
+                    results = self._collect_partitions(pool.imap(_analyze_partition, range(num_partitions)))
+                finally:
+                    pool.close()
+                    pool.join()
+            finally:
+                _parallel_analysis = None
+        else:
+            results = self._collect_partitions(self._analyze_partition(i) for i in range(num_partitions))
+
+        group_counts = list()
+        for i, grp in enumerate(cohort_groups):
+            num_customers = 0
+            num_orderers = [0] * grp.group_number
+            num_first = [0] * grp.group_number
+            for shard_counts in results:
+                shard_customers, shard_buckets = shard_counts[i]
+                num_customers += shard_customers
+                for j, (orderers, first) in enumerate(shard_buckets):
+                    num_orderers[j] += orderers
+                    num_first[j] += first
+
+            group_counts.append((num_customers, zip(num_orderers, num_first)))
+
+        if self._verbosity > 0:
+            print 'DEBUG: # processes:', processes
+            print 'DEBUG: # partitions:', num_partitions
+            print 'DEBUG: # customers:', self._store.num_customers
+            print 'DEBUG: # orders:', self._store.num_orders
+
+        self._group_counts = group_counts
+
+    def _collect_partitions(self, results):
+        """Collects the results of the partitions as they are analyzed, merging
+        their sketches one partition at a time when the counts are estimated.
+
+        :param results: iterable of the results of _analyze_partition.
+
+        :return: list of the per-group counts of each partition (of the merged
+            sketches when the counts are estimated)
+        """
+        if not self._sketch_precision:
+            return list(results)
+
+        self._group_sketches = _merge_group_sketches(results)
+
+        return [
+            [(num_customers, _count_sketches(sketches)) for num_customers, sketches in self._group_sketches]
+        ]
+
+    def _analyze_partition(self, index):
+        """Analyzes a single partition with the same groups as the whole analysis.
+
+        :param index: the index of the partition in the ShardedStore (or SpilledStore).
+
+        :return: list of (num customers, bucket counts) tuples, one per group (bucket
+            sketches instead of counts when the counts are estimated)
+        """
+        shard = CohortAnalysis(
+            days_per_bucket=self._days_per_bucket,
+            timezone=self._timezone,
+            engine=self._engine,
+            columnar=True,
+            sketch_precision=self._sketch_precision,
+        )
+        shard._store = self._store.get_partition(index)
+        shard._min_customer_join_date = self._min_customer_join_date
+        shard._max_customer_join_date = self._max_customer_join_date
+        shard.analyze()
+
+        if self._sketch_precision:
+            return shard.get_sketches()
+
+        return [
+            shard._get_group_counts(i, grp)
+            for i, grp in enumerate(shard._cohort_groups)
+        ]
 
     def print_table(self, max_groups=0):
         """Displays the cohort groups.
 
         :param max_groups: the number of cohort groups to display; <= 0 shows all groups.
         """
+        with self._instrumentation.span('render'):
+            self._print_table(max_groups)
+
+    def _print_table(self, max_groups):
         cohort_grps = self._cohort_groups
         num_cohort_groups = len(cohort_grps)
 
@@ -221,86 +864,235 @@ class CohortAnalysis(object):
             fields.append(label)
             count += 1
 
+        from prettytable import PrettyTable
+
         ptable = PrettyTable(fields)
         ptable.align = 'l'
 
         # add the row/cell data to the table
-        count = 0
-        for grp in cohort_grps:
-            if count >= num_groups_to_output:
-                break
-
+        for row in self.iter_rows(num_groups_to_output):
             row_data = [
-                grp.label,
-                '{} customers'.format(grp.num_customers),
+                row['cohort'],
+                '{} customers'.format(row['customers']),
                 ]
 
             # for each cohort group, get the order age buckets
-            bucket_count = 0
-            for age_bucket in grp.get_buckets():
-                num_customers_with_orders = len(age_bucket['customers'] or [])
-                num_first_orders = len(age_bucket['first'] or [])
-
-                if grp.num_customers <= 0:
-                    cust_order_pct = 0
-                    first_order_pct = 0
-                else:
-                    cust_order_pct = float(num_customers_with_orders * 100) / grp.num_customers
-                    first_order_pct = float(num_first_orders * 100) / grp.num_customers
-
+            for bucket in row['buckets']:
                 # generate the intended cell format
                 cell_text = '{}% orderers ({})\n{}% 1st time ({})'.format(
-                    int(round(cust_order_pct, 0)),
-                    num_customers_with_orders,
-                    int(round(first_order_pct, 0)),
-                    num_first_orders
+                    int(round(bucket['orderers_pct'], 0)),
+                    bucket['orderers'],
+                    int(round(bucket['first_pct'], 0)),
+                    bucket['first']
                 )
 
                 row_data.append(cell_text)
-                bucket_count += 1
 
             # fill the empty cells with blanks
-            for i in range(num_groups_to_output - bucket_count):
+            for i in range(num_groups_to_output - len(row['buckets'])):
                 row_data.append('')
 
             # add the row data to the table
             ptable.add_row(row_data)
 
-            count += 1
-
         print ptable
 
+    def iter_rows(self, max_groups=0):
+        """Generates the rows of the cohort table (newest group first), one at
+        a time, with the raw counts and the percentages of each bucket.
+
+        :param max_groups: the number of cohort groups to generate; <= 0 generates all groups.
+
+        :return: generator of dictionaries
+            {
+                "cohort": <label>, - e.g., "7/1-7/7"
+                "start": <ISO 8601 start date/time>,
+                "end": <ISO 8601 end date/time>,
+                "customers": <number of customers>,
+                "buckets": [{
+                    "bucket": <bucket index>,
+                    "start_day": <first day since joining>,
+                    "end_day": <last day since joining>,
+                    "orderers": <number of customers that made an order>,
+                    "orderers_pct": <percentage of the customers that made an order>,
+                    "first": <number of customers that made their first order>,
+                    "first_pct": <percentage of the customers that made their first order>,
+                }, ...]
+            }
+        """
+        cohort_grps = self._cohort_groups
+        if max_groups > 0:
+            cohort_grps = cohort_grps[:max_groups]
+
+        for index, grp in enumerate(cohort_grps):
+            num_customers, bucket_counts = self._get_group_counts(index, grp)
+
+            buckets = []
+            for i, (num_customers_with_orders, num_first_orders) in enumerate(bucket_counts):
+                if num_customers <= 0:
+                    cust_order_pct = 0.0
+                    first_order_pct = 0.0
+                else:
+                    cust_order_pct = float(num_customers_with_orders * 100) / num_customers
+                    first_order_pct = float(num_first_orders * 100) / num_customers
+
+                buckets.append(OrderedDict([
+                    ('bucket', i),
+                    ('start_day', i * self._days_per_bucket),
+                    ('end_day', ((i + 1) * self._days_per_bucket) - 1),
+                    ('orderers', num_customers_with_orders),
+                    ('orderers_pct', cust_order_pct),
+                    ('first', num_first_orders),
+                    ('first_pct', first_order_pct),
+                ]))
+
+            yield OrderedDict([
+                ('cohort', grp.label),
+                ('start', grp.start_date.isoformat()),
+                ('end', grp.end_date.isoformat()),
+                ('customers', num_customers),
+                ('buckets', buckets),
+            ])
+
+    def write_output(self, writer, max_groups=0):
+        """Writes the cohort rows with an output writer, as they are generated.
+
+        :param writer: the OutputWriter (see output.get_writer).
+        :param max_groups: the number of cohort groups to write; <= 0 writes all groups.
+
+        :return: the number of rows written
+        """
+        with self._instrumentation.span('render') as timer:
+            timer.rows = writer.write_analysis(self._timezone, self._days_per_bucket, self.iter_rows(max_groups))
+
+        return timer.rows
+
+    def get_sketches(self):
+        """Gets the HyperLogLog sketches of the customers of each bucket, e.g., to
+        merge them with the sketches of another analysis (with the same groups).
+
+        :return: list of (num customers, list of (customers, first) HyperLogLog tuples),
+            one per group (None instead of the sketches of the empty buckets)
+        """
+        if not self._sketch_precision:
+            raise ValueError('the sketches require a sketch precision')
+
+        if self._group_sketches is not None:
+            return self._group_sketches
+
+        return [
+            (grp.num_customers, grp.get_bucket_sketches(self._sketch_precision))
+            for grp in self._cohort_groups
+        ]
+
+    def _get_group_counts(self, index, grp):
+        """Gets the number of customers of a group and the (customers, first)
+        counts of its age buckets, from the merged, estimated or NumPy counts when
+        available.
+        """
+        if self._group_counts is not None:
+            return self._group_counts[index]
+        elif self._sketch_precision:
+            return grp.num_customers, _count_sketches(grp.get_bucket_sketches(self._sketch_precision))
+        elif self._matrix is not None:
+            return int(self._matrix.num_customers[index]), self._matrix.get_bucket_counts(index)
+
+        return grp.num_customers, grp.get_bucket_counts()
+
     def _generate_groups(
             self,
-            input_start_date,
-            input_end_date,
-            timezone,
+            min_join_date,
+            max_join_date,
             days_per_bucket):
+        """Generates the cohort groups, newest first, of runs of days_per_bucket local
+        days going back from the day of the newest join date to the day of the oldest.
+
+        The boundaries are computed on integer seconds, with the local times
+        resolved by the OffsetTable of the timezone, and given to the groups as
+        Timestamps (only converted into pendulum datetimes when displayed).
+
+        :param min_join_date: the Timestamp of the oldest join date.
+        :param max_join_date: the Timestamp of the newest join date.
+        :param days_per_bucket: the number of days per cohort group.
 
-        local_start_date = input_start_date.in_timezone(timezone)
-        local_end_date = input_end_date.in_timezone(timezone).at(23, 59, 59)
+        :return: list of cohort groups
+        """
+        offsets = self._parser.offsets
+        bucket_seconds = days_per_bucket * SECONDS_PER_DAY
+
+        # the last second of the newest local day
+        local_end = (max_join_date.local_day * SECONDS_PER_DAY) + SECONDS_PER_DAY - 1
+        end_epoch = offsets.to_epoch(local_end)
 
         count = 1
         groups = list()
-        while local_start_date < local_end_date:
-            next_end_date = local_end_date.subtract(days=days_per_bucket)
-
-            bucket = CohortGroup(
-                count,
-                count,
-                days_per_bucket,
-                next_end_date.add(seconds=1),
-                local_end_date,
-                verbosity=self._verbosity
-            )
+        while min_join_date.epoch < end_epoch:
+            local_end -= bucket_seconds
+            next_end_epoch = offsets.to_epoch(local_end)
+            start_date = Timestamp(next_end_epoch + 1, offsets.offset(next_end_epoch + 1))
+            end_date = Timestamp(end_epoch, offsets.offset(end_epoch))
+
+            if self._store is not None:
+                bucket = ColumnarCohortGroup(
+                    self._store,
+                    count,
+                    count,
+                    days_per_bucket,
+                    start_date,
+                    end_date,
+                    verbosity=self._verbosity,
+                    timezone=self._timezone
+                )
+            else:
+                bucket = CohortGroup(
+                    count,
+                    count,
+                    days_per_bucket,
+                    start_date,
+                    end_date,
+                    verbosity=self._verbosity,
+                    timezone=self._timezone
+                )
             groups.append(bucket)
 
-            local_end_date = next_end_date
+            end_epoch = next_end_epoch
             count += 1
 
         return groups
 
 
+class Order(object):
+    __slots__ = ('user_id', 'order_id', 'order_number', 'order_date', 'order_num')
+
+    def __init__(self, user_id, order_id, order_number, order_date, order_num=None):
+        """Constructor.
+
+        An order of a customer; the same record is kept in the orders of the
+        analysis and in the orders of the customer's cohort group.
+
+        :param user_id: the user id associated with the order.
+        :param order_id: the order id.
+        :param order_number: the order number of the data file (None when unknown).
+        :param order_date: the order date Timestamp.
+        :param order_num: the order number with respect to that particular customer
+            (set by the cohort group of the customer).
+        """
+        self.user_id = user_id
+        self.order_id = order_id
+        self.order_number = order_number
+        self.order_date = order_date
+        self.order_num = order_num
+
+    def __repr__(self):
+        return 'Order(user_id={!r}, order_id={!r}, order_number={!r}, order_date={!r})'.format(
+            self.user_id, self.order_id, self.order_number, self.order_date
+        )
+
+
+# the order of a customer's orders (by date, then id and number)
+_order_key = attrgetter('order_date', 'order_id', 'order_number')
+
+
 class CohortGroup(object):
     def __init__(
             self,
@@ -309,15 +1101,18 @@ class CohortGroup(object):
             bucket_days,
             start_date,
             end_date,
-            verbosity=0):
+            verbosity=0,
+            timezone=None):
         """Constructor.
 
         :param name: a descriptive name for this group.
         :param group_number: the number of this group (integer > 0).
         :param bucket_days: the number of days in this group.
-        :param start_date: the start date/time of this group.
-        :param end_date: the end date/time of this group.
+        :param start_date: the start date/time (or Timestamp) of this group.
+        :param end_date: the end date/time (or Timestamp) of this group.
         :param verbosity: verbosity integer > 0 that represents the debugging verbosity.
+        :param timezone: the timezone of the start and end dates given as Timestamps
+            (converted into pendulum datetimes when first needed).
         """
         super(CohortGroup, self).__init__()
 
@@ -335,25 +1130,44 @@ class CohortGroup(object):
         self._name = name
         self._group_number = group_number
         self._bucket_days = bucket_days
-        self._start_date = start_date
-        self._end_date = end_date
+        self._start = as_timestamp(start_date)
+        self._end = as_timestamp(end_date)
+        self._start_date = None if isinstance(start_date, Timestamp) else start_date
+        self._end_date = None if isinstance(end_date, Timestamp) else end_date
+        self._start_epoch = self._start.epoch
+        self._end_epoch = self._end.epoch
+        self._timezone = timezone or 'UTC'
         self._verbosity = verbosity
         self._customers = dict()
         self._orders = dict()
+        self._buckets = None
+        self._bucket_customer_ids = None
+        self._bucket_positions = None
+        self._bucket_counts = None
 
     @property
     def end_date(self):
+        if self._end_date is None:
+            self._end_date = to_datetime(self._end, self._timezone)
+
         return self._end_date
 
     @property
     def label(self):
-        result = '{start}-{end}'.format(
-            start=self._start_date.format('M/D', formatter='alternative'),
-            end=self._end_date.format('M/D', formatter='alternative'),
-        )
+        start = self._start.local_date
+        end = self._end.local_date
+        result = '{}/{}-{}/{}'.format(start.month, start.day, end.month, end.day)
 
         return result
 
+    @property
+    def customer_ids(self):
+        return self._customers.keys()
+
+    @property
+    def group_number(self):
+        return self._group_number
+
     @property
     def name(self):
         return self._name
@@ -368,12 +1182,34 @@ class CohortGroup(object):
 
     @property
     def start_date(self):
+        if self._start_date is None:
+            self._start_date = to_datetime(self._start, self._timezone)
+
         return self._start_date
 
+    def renumber(self, group_number):
+        """Changes the number of this group (e.g., when newer groups are added),
+        which also changes its number of buckets.
+
+        :param group_number: the new number of this group (integer > 0).
+        """
+        if not group_number or group_number <= 0:
+            raise ValueError('group number must be greater than 0')
+
+        self._name = group_number
+        self._group_number = group_number
+        self._invalidate()
+
+    def clear(self):
+        """Removes all the customers and orders of this group."""
+        self._customers = dict()
+        self._orders = dict()
+        self._invalidate()
+
     def is_date_in_group(self, date_value):
         """Determines whether the specified date is within the range of this group.
 
-        :param date_value: the date to check whether it is in the current cohort group.
+        :param date_value: the date (or Timestamp) to check whether it is in the current cohort group.
 
         :return: boolean whether the date is in this cohort group
         """
@@ -382,13 +1218,10 @@ class CohortGroup(object):
 
         if self._verbosity > 2:
             print 'START: {} / END: {} / VALUE: {}'.format(
-                self._start_date, self._end_date, date_value)
+                self.start_date, self.end_date, date_value)
 
-        result = date_value.between(
-            self._start_date,
-            self._end_date,
-            equal=True
-        )
+        epoch = as_timestamp(date_value).epoch
+        result = self._start_epoch <= epoch <= self._end_epoch
 
         return result
 
@@ -408,9 +1241,8 @@ class CohortGroup(object):
         if not (user_id and join_date):
             raise ValueError('all customer params are required')
 
-        self._customers[user_id] = {
-            'join_date': join_date,
-        }
+        self._customers[user_id] = as_timestamp(join_date)
+        self._invalidate()
 
         return True
 
@@ -438,12 +1270,24 @@ class CohortGroup(object):
         if order_id in self._orders:
             return False
 
-        self._orders[order_id] = {
-            'user_id': user_id,
-            'order_id': order_id,
-            'order_num': order_num,
-            'order_date': order_date,
-        }
+        return self.add_order_record(Order(user_id, order_id, None, as_timestamp(order_date)), order_num)
+
+    def add_order_record(self, order, order_num):
+        """Add an order to this group without copying it.
+
+        :param order: the Order (its order_num is set when it is added).
+        :param order_num: the order number with respect to that particular customer.
+
+        :return: boolean whether the order was added successfully
+        """
+
+        # ignore duplicate orders
+        if order.order_id in self._orders:
+            return False
+
+        order.order_num = order_num
+        self._orders[order.order_id] = order
+        self._invalidate()
 
         return True
 
@@ -451,83 +1295,577 @@ class CohortGroup(object):
         """Gets the buckets that represents cohorts of customers of when
         they made their purchases relative on their signup date.
 
+        The customers are Bitmaps of their positions among the customers of this
+        group that made an order rather than sets of user ids (see get_customer_ids
+        and has_customer), so each bucket takes a few bits (or a few bytes when
+        sparse) per customer instead of a set.
+        The buckets are cached until the customers or orders of this group change.
+
         :return: list of cohort buckets (dict)
             {
-                "customers": set(<user id>), - customers that made an order
-                "first": set(<user id>), - customers that made their first order
+                "customers": Bitmap(<position>), - customers that made an order
+                "first": Bitmap(<position>), - customers that made their first order
 
             }
         """
-        customer_age_buckets = list()
+        if self._buckets is not None:
+            return self._buckets
+
+        customer_ids = list()
+        positions = dict()
+        customers = [array('l') for i in range(self._group_number)]
+        first = [array('l') for i in range(self._group_number)]
+
+        # add the customer orders in the appropriate buckets; the orders come
+        # grouped by customer, so the positions are added in increasing order
+        for user_id, bucket_index, order_num in self._iter_bucket_orders():
+            position = positions.get(user_id)
+            if position is None:
+                position = positions[user_id] = len(customer_ids)
+                customer_ids.append(user_id)
+
+            bucket_customers = customers[bucket_index]
+            if not bucket_customers or bucket_customers[-1] != position:
+                bucket_customers.append(position)
+
+            bucket_first = first[bucket_index]
+            if order_num == 1 and (not bucket_first or bucket_first[-1] != position):
+                bucket_first.append(position)
 
-        # create the buckets
+        customer_age_buckets = list()
         for i in range(self._group_number):
             customer_age_buckets.append({
                 'num': i + 1,
-                'customers': set(),
-                'first': set(),
+                'customers': Bitmap.from_sorted(customers[i]),
+                'first': Bitmap.from_sorted(first[i]),
             })
 
-        # add the customer orders in the appropriate buckets
-        for order_id in sorted(self._orders.keys(), key=lambda x: self._orders[x]['user_id']):
-            order = self._orders[order_id]
-            user_id = order['user_id']
-            order_num = order['order_num']
-            order_date = order['order_date']
+        self._buckets = customer_age_buckets
+        self._bucket_customer_ids = customer_ids
+
+        return customer_age_buckets
+
+    def get_customer_ids(self, customers):
+        """Gets the user ids of the customers of a bucket.
+
+        :param customers: a Bitmap of the buckets of get_buckets (or a union,
+            intersection or difference of them).
+
+        :return: list of user ids
+        """
+        if self._bucket_customer_ids is None:
+            raise ValueError('the buckets changed; get them again')
+
+        return [self._bucket_customer_ids[i] for i in customers]
+
+    def has_customer(self, bucket_index, user_id, first=False):
+        """Whether a customer made an order in a bucket (the buckets hold the
+        positions of the customers rather than their user ids; see get_buckets).
+
+        :param bucket_index: the index of a bucket (0 for the first days since joining).
+        :param user_id: the user id of the customer.
+        :param first: whether to test for the customer's first order instead.
+
+        :return: boolean
+        """
+        buckets = self.get_buckets()
+        if not 0 <= bucket_index < len(buckets):
+            raise ValueError('bucket index must be between 0 and {}'.format(len(buckets) - 1))
+
+        if self._bucket_positions is None:
+            self._bucket_positions = dict((j, i) for i, j in enumerate(self._bucket_customer_ids))
+
+        position = self._bucket_positions.get(user_id)
+        if position is None:
+            return False
+
+        return buckets[bucket_index]['first' if first else 'customers'].contains(position)
+
+    def get_retention(self, bucket_index, other_index):
+        """Gets the number of customers that made an order in both of two buckets.
+
+        :param bucket_index: the index of a bucket (0 for the first days since joining).
+        :param other_index: the index of the other bucket.
+
+        :return: integer
+        """
+        buckets = self.get_buckets()
+        if not (0 <= bucket_index < len(buckets) and 0 <= other_index < len(buckets)):
+            raise ValueError('bucket index must be between 0 and {}'.format(len(buckets) - 1))
+
+        return buckets[bucket_index]['customers'].intersection_count(buckets[other_index]['customers'])
+
+    def get_bucket_counts(self):
+        """Gets the number of customers in each bucket without building the
+        bitmaps of the customers (see get_buckets); cached the same way.
+
+        :return: list of (customers, first) tuples, one per bucket
+        """
+        if self._bucket_counts is not None:
+            return self._bucket_counts
+
+        if self._buckets is not None:
+            self._bucket_counts = [(len(i['customers']), len(i['first'])) for i in self._buckets]
+            return self._bucket_counts
+
+        num_customers = [0] * self._group_number
+        num_first = [0] * self._group_number
+        last_customer = [None] * self._group_number
+        last_first = [None] * self._group_number
+
+        # the orders come grouped by customer, so a customer is new to a bucket
+        # when it is not the last customer counted in that bucket
+        for user_id, bucket_index, order_num in self._iter_bucket_orders():
+            if last_customer[bucket_index] != user_id:
+                last_customer[bucket_index] = user_id
+                num_customers[bucket_index] += 1
+
+            if order_num == 1 and last_first[bucket_index] != user_id:
+                last_first[bucket_index] = user_id
+                num_first[bucket_index] += 1
+
+        self._bucket_counts = zip(num_customers, num_first)
+
+        return self._bucket_counts
+
+    def get_bucket_sketches(self, precision=DEFAULT_PRECISION):
+        """Gets HyperLogLog sketches of the customers in each bucket instead of
+        their bitmaps (see get_buckets). Unlike the counts, they are not cached:
+        they are counted (or merged) once and dropped.
+
+        :param precision: the precision of the sketches (see HyperLogLog).
+
+        :return: list of (customers, first) HyperLogLog tuples, one per bucket
+            (None instead of the sketch of a bucket without customers)
+        """
+        customers = [None] * self._group_number
+        first = [None] * self._group_number
+        for user_id, bucket_index, order_num in self._iter_bucket_orders():
+            sketch = customers[bucket_index]
+            if sketch is None:
+                sketch = customers[bucket_index] = HyperLogLog(precision)
+            sketch.add(user_id)
+
+            if order_num == 1:
+                sketch = first[bucket_index]
+                if sketch is None:
+                    sketch = first[bucket_index] = HyperLogLog(precision)
+                sketch.add(user_id)
+
+        return zip(customers, first)
+
+    def _iter_bucket_orders(self):
+        """Generates (user id, bucket index, order number) for each order of a
+        known customer that falls in one of the buckets, grouped by customer.
+        """
+        customers = self._customers
+        for order in sorted(self._orders.itervalues(), key=attrgetter('user_id')):
+            user_id = order.user_id
+            order_num = order.order_num
+            order_date = order.order_date
 
             # try to resolve the user join date
-            user_join_date = self._customers.get(user_id) and self._customers[user_id].get('join_date')
+            user_join_date = customers.get(user_id)
             if not user_join_date:
                 # skip since we don't have the join date
                 continue
 
-            # calculate the time between the order and the user's join date
-            delta = order_date.diff(user_join_date, True)
-            bucket_index = (delta.in_days() / self._bucket_days)
+            # calculate the number of calendar days between the order and the user's join date
+            delta_days = abs(order_date.local_day - user_join_date.local_day)
+            bucket_index = (delta_days / self._bucket_days)
 
             # ignore orders in future buckets
             if bucket_index >= self._group_number:
                 continue
 
-            customer_age_buckets[bucket_index]['customers'].add(user_id)
-            if order_num == 1:
-                customer_age_buckets[bucket_index]['first'].add(user_id)
+            yield user_id, bucket_index, order_num
 
-        return customer_age_buckets
+    def _invalidate(self):
+        self._buckets = None
+        self._bucket_customer_ids = None
+        self._bucket_positions = None
+        self._bucket_counts = None
+
+
+class ColumnarCohortGroup(CohortGroup):
+    def __init__(
+            self,
+            store,
+            name,
+            group_number,
+            bucket_days,
+            start_date,
+            end_date,
+            verbosity=0,
+            timezone=None):
+        """Constructor.
+
+        A cohort group that references the customers and orders of a ColumnStore
+        by their dense index / row instead of copying them into dictionaries.
+
+        :param store: the ColumnStore holding the customers and orders.
+
+        See CohortGroup for the other parameters.
+        """
+        super(ColumnarCohortGroup, self).__init__(
+            name,
+            group_number,
+            bucket_days,
+            start_date,
+            end_date,
+            verbosity=verbosity,
+            timezone=timezone
+        )
+
+        self._store = store
+        self._customer_indices = array('l')
+        self._order_rows = array('l')
+        self._order_nums = array('l')
 
+    @property
+    def customer_indices(self):
+        return self._customer_indices
 
-def get_objects_from_file(file_path):
+    @property
+    def num_customers(self):
+        return len(self._customer_indices)
+
+    @property
+    def num_orders(self):
+        return len(self._order_rows)
+
+    def add_customer_index(self, index):
+        """Add a customer to this group.
+
+        :param index: the dense index of the customer in the store.
+        """
+        self._customer_indices.append(index)
+        self._invalidate()
+
+    def clear(self):
+        """Removes all the customers and orders of this group."""
+        super(ColumnarCohortGroup, self).clear()
+
+        self._customer_indices = array('l')
+        self._order_rows = array('l')
+        self._order_nums = array('l')
+
+    def add_customer_indices(self, indices):
+        """Add customers to this group.
+
+        :param indices: typed array of the dense indices of the customers in the store.
+        """
+        self._customer_indices.extend(indices)
+        self._invalidate()
+
+    def add_order_rows(self, rows, order_nums):
+        """Add orders to this group; the orders of a customer must be consecutive.
+
+        :param rows: typed array of the rows of the orders in the store.
+        :param order_nums: typed array of the order numbers with respect to each customer.
+        """
+        self._order_rows.extend(rows)
+        self._order_nums.extend(order_nums)
+        self._invalidate()
+
+    def add_order_row(self, row, order_num):
+        """Add an order to this group; the orders of a customer must be consecutive.
+
+        :param row: the row of the order in the store.
+        :param order_num: the order number with respect to that particular customer.
+        """
+        self._order_rows.append(row)
+        self._order_nums.append(order_num)
+        self._invalidate()
+
+    def _iter_bucket_orders(self):
+        store = self._store
+        user_id = store.user_id
+        order_user = store.order_user
+
+        for row, order_num in izip(self._order_rows, self._order_nums):
+            index = order_user[row]
+
+            delta_days = abs(store.order_day(row) - store.join_day(index))
+            bucket_index = (delta_days / self._bucket_days)
+
+            # ignore orders in future buckets
+            if bucket_index >= self._group_number:
+                continue
+
+            yield user_id[index], bucket_index, order_num
+
+
+# the analysis being run by the worker processes of _analyze_partitions
+_parallel_analysis = None
+
+
+def _analyze_partition(index):
+    return _parallel_analysis._analyze_partition(index)
+
+
+def _merge_group_sketches(results):
+    # merges the sketches of the same groups and buckets of several partitions,
+    # as they come, into the sketches of the first one (not used otherwise)
+    results = iter(results)
+    merged = next(results)
+    for partition_sketches in results:
+        for index, (num_customers, sketches) in enumerate(partition_sketches):
+            merged_sketches = merged[index][1]
+            merged[index] = (merged[index][0] + num_customers, merged_sketches)
+            for bucket_index, partition_bucket in enumerate(sketches):
+                merged_sketches[bucket_index] = tuple(
+                    _merge_sketch(i, j) for i, j in zip(merged_sketches[bucket_index], partition_bucket)
+                )
+
+    return merged
+
+
+def _merge_sketch(sketch, other):
+    # the sketches of empty buckets are None
+    if sketch is None:
+        return other
+    elif other is not None:
+        sketch.merge(other)
+
+    return sketch
+
+
+def _count_sketches(sketches):
+    return [
+        tuple(0 if sketch is None else sketch.count() for sketch in bucket_sketches)
+        for bucket_sketches in sketches
+    ]
+
+
+def _check_columns(*columns):
+    lengths = set(len(i) for i in columns if hasattr(i, '__len__'))
+    if len(lengths) > 1:
+        raise ValueError('all columns must have the same length')
+
+
+def get_objects_from_file(file_path, instrumentation=None):
     """Loads the CSV files into dictionary objects.
 
     :param file_path: the path to the CSV data file.
+    :param instrumentation: the Instrumentation recording the "load" stage.
 
     :return: list of dictionaries representing each row in the CSV file
     """
+    if instrumentation is None:
+        return list(iter_objects_from_file(file_path))
 
-    # validate the specified file
-    result = []
+    with instrumentation.span('load') as timer:
+        objects = list(iter_objects_from_file(file_path))
+        timer.rows = len(objects)
 
-    customer_fields = None
-    num_fields = 0
-    with open(file_path, 'rb') as csvfile:
-        file_reader = csv.reader(
-            csvfile,
-            delimiter=',',
-            quotechar='"',
-        )
+    return objects
 
-        line_num = 0
+
+def iter_objects_from_file(file_path):
+    """Streams the rows of a CSV file as dictionary objects.
+
+    :param file_path: the path to the CSV data file (optionally compressed, see open_data_file).
+
+    :return: generator of dictionaries representing each row in the CSV file
+    """
+    with open_data_file(file_path) as csvfile:
+        file_reader = _get_csv_reader(csvfile)
+
+        customer_fields = next(file_reader, None)
+        if customer_fields is None:
+            return
+
+        num_fields = len(customer_fields)
         for line_parts in file_reader:
-            line_num += 1
-            if line_num == 1:
-                customer_fields = line_parts
-                num_fields = len(line_parts)
-                continue
+            yield dict([(customer_fields[i], line_parts[i]) for i in range(num_fields)])
 
-            obj = dict([(customer_fields[i], line_parts[i]) for i in range(num_fields)])
-            result.append(obj)
 
-    return result
+def iter_columns_from_file(file_path, fields):
+    """Streams selected columns of a CSV file as tuples, without building a
+    dictionary per row; the columns are resolved by their index in the header.
+
+    :param file_path: the path to the CSV data file (optionally compressed, see open_data_file).
+    :param fields: the names of the columns to extract (in that order).
+
+    :return: generator of tuples with the values of the requested columns
+    """
+    with open_data_file(file_path) as csvfile:
+        file_reader = _get_csv_reader(csvfile)
+
+        header = next(file_reader, None)
+        if header is None:
+            return
+
+        indices = _get_column_indices(header, fields, file_path)
+
+        get_columns = itemgetter(*indices)
+        if len(indices) == 1:
+            for line_parts in file_reader:
+                yield (get_columns(line_parts),)
+        else:
+            for line_parts in file_reader:
+                yield get_columns(line_parts)
+
+
+def load_columns_from_file(file_path, fields, use_cache=False, instrumentation=None, processes=1):
+    """Loads selected columns of a CSV file into typed arrays of integers; the
+    date columns (see DATE_FIELDS) are converted into UTC epoch seconds.
+
+    With use_cache, the parsed columns are also saved to a binary sidecar next
+    to the file and loaded from it (without parsing the file) on the next runs,
+    until the file changes; see ColumnCache.
+
+    With several processes, the rows after the header are split into byte
+    ranges (of about PARSE_CHUNK_SIZE bytes, aligned on line breaks) that are
+    parsed by a process pool and concatenated in order; the values must not
+    contain line breaks. Compressed files are always parsed sequentially.
+
+    :param file_path: the path to the CSV data file.
+    :param fields: the names of the columns to load (in that order).
+    :param use_cache: whether to use the binary sidecar of the file.
+    :param instrumentation: the Instrumentation recording the "load" stage.
+    :param processes: the number of processes parsing the file.
+
+    :return: list of typed arrays with the values of the requested columns
+    """
+    if instrumentation is None:
+        return _load_columns(file_path, fields, use_cache, processes)
+
+    with instrumentation.span('load') as timer:
+        columns = _load_columns(file_path, fields, use_cache, processes)
+        timer.rows = len(columns[0]) if columns else 0
+
+    return columns
+
+
+def _load_columns(file_path, fields, use_cache, processes):
+    cache = ColumnCache(file_path) if use_cache else None
+    if cache is not None:
+        cached = cache.load(fields)
+        if cached is not None:
+            return [cached[i] for i in fields]
+
+    if processes > 1 and not is_compressed(file_path):
+        columns = _parse_columns_parallel(file_path, fields, processes)
+    else:
+        columns = _parse_columns(iter_columns_from_file(file_path, fields), fields)
+
+    if cache is not None:
+        cache.save(zip(fields, columns))
+
+    return columns
+
+
+def _parse_columns(rows, fields):
+    parse = TimestampParser('UTC').parse
+    converters = [(lambda value: parse(value).epoch) if i in DATE_FIELDS else int for i in fields]
+    columns = [array('l') for i in fields]
+    for values in rows:
+        for column, convert, value in izip(columns, converters, values):
+            if not value:
+                raise ValueError('all arguments are required')
+
+            column.append(convert(value))
+
+    return columns
+
+
+def _parse_columns_parallel(file_path, fields, processes, chunk_size=PARSE_CHUNK_SIZE):
+    with open(file_path, 'rb') as csvfile:
+        header = next(_get_csv_reader([csvfile.readline()]), None)
+        if header is None:
+            return [array('l') for i in fields]
+
+        indices = _get_column_indices(header, fields, file_path)
+
+        # newline aligned byte ranges
+        bounds = [csvfile.tell()]
+        size = os.fstat(csvfile.fileno()).st_size
+        while bounds[-1] + chunk_size < size:
+            csvfile.seek(bounds[-1] + chunk_size)
+            csvfile.readline()
+            if csvfile.tell() >= size:
+                break
+
+            bounds.append(csvfile.tell())
+        bounds.append(size)
+
+    tasks = [(file_path, fields, indices, bounds[i], bounds[i + 1]) for i in range(len(bounds) - 1)]
+    pool = None
+    if len(tasks) > 1:
+        import multiprocessing
+
+        pool = multiprocessing.Pool(processes=min(processes, len(tasks)))
+
+    try:
+        columns = [array('l') for i in fields]
+        for chunk in (pool.imap(_parse_range, tasks) if pool else imap(_parse_range, tasks)):
+            for column, values in izip(columns, chunk):
+                column.fromstring(values)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    return columns
+
+
+def _parse_range(task):
+    file_path, fields, indices, start, end = task
+    with open(file_path, 'rb') as csvfile:
+        csvfile.seek(start)
+        lines = csvfile.read(end - start).splitlines()
+
+    get_columns = itemgetter(*indices)
+    if len(indices) == 1:
+        rows = ((get_columns(i),) for i in _get_csv_reader(lines))
+    else:
+        rows = (get_columns(i) for i in _get_csv_reader(lines))
+
+    # raw bytes are much cheaper to send back than pickled arrays
+    return [i.tostring() for i in _parse_columns(rows, fields)]
+
+
+def _parse_configuration(value):
+    # "TIMEZONE:DAYS"
+    timezone, separator, days_per_bucket = value.rpartition(':')
+    if not (timezone and days_per_bucket.isdigit() and int(days_per_bucket) > 0):
+        raise argparse.ArgumentTypeError('invalid configuration (expected TIMEZONE:DAYS): {}'.format(value))
+
+    return timezone, int(days_per_bucket)
+
+
+def _print_memory(span, unit=None):
+    if span.memory is None:
+        return
+
+    line = 'DEBUG:        memory: {:+.1f} MB (peak {:.1f} MB)'.format(
+        float(span.memory) / BYTES_PER_MB,
+        float(span.peak_memory or 0) / BYTES_PER_MB
+    )
+    if unit and span.bytes_per_row is not None:
+        line += ', {:.0f} bytes per {}'.format(span.bytes_per_row, unit)
+
+    print line
+
+
+def _get_column_indices(header, fields, file_path):
+    indices = []
+    for field in fields:
+        if field not in header:
+            raise ValueError('column "{}" not found in {}'.format(field, file_path))
+        indices.append(header.index(field))
+
+    return indices
+
+
+def _get_csv_reader(csvfile):
+    return csv.reader(
+        csvfile,
+        delimiter=',',
+        quotechar='"',
+    )
 
 
 def main():
@@ -539,8 +1877,53 @@ def main():
     parser.add_argument('-tz', '--timezone', default='UTC', help='the timezone associated with the cohort groups')
     parser.add_argument('-d', '--days-per-bucket', metavar='DAYS', type=int, default=7, help='number of days per bucket')
     parser.add_argument('-v', '--verbosity', action='count', default=0, help='display debugging information')
-    parser.add_argument('orders_file', help='the orders CSV file')
-    parser.add_argument('customers_file', help='the customers CSV file')
+    parser.add_argument('--columnar', action='store_true', help='store the customers and orders in typed arrays')
+    parser.add_argument('--engine', choices=ENGINES, default='python', help='the cohort analysis engine')
+    parser.add_argument('-j', '--processes', type=int, default=1, help='number of processes to parse and analyze the data')
+    parser.add_argument(
+        '--memory-budget',
+        metavar='MB',
+        type=int,
+        help='spill the customers and orders to disk and analyze them in partitions that fit in MB megabytes'
+    )
+    parser.add_argument('--spill-directory', metavar='DIR', help='the directory of the spilled files')
+    parser.add_argument('--cache', action='store_true', help='cache the parsed CSV data in binary sidecar files')
+    parser.add_argument(
+        '--sketch-precision',
+        metavar='BITS',
+        type=int,
+        help='estimate the distinct customers of each bucket with HyperLogLog sketches of 2^BITS registers ({}-{})'.format(
+            MIN_PRECISION, MAX_PRECISION
+        )
+    )
+    parser.add_argument(
+        '--filter-orders',
+        action='store_true',
+        help='drop the duplicate order ids and the orders of unknown customers as they are loaded'
+    )
+    parser.add_argument(
+        '--sweep',
+        metavar='TIMEZONE:DAYS',
+        action='append',
+        type=_parse_configuration,
+        help='analyze the data with each (repeatable) configuration instead of --timezone and --days-per-bucket'
+    )
+    parser.add_argument(
+        '--format',
+        choices=('table',) + FORMATS,
+        default='table',
+        help='the output format; csv, json and ndjson are streamed with the raw counts and percentages'
+    )
+    parser.add_argument('--memory', action='store_true', help='track the memory of each stage (with -v or --metrics)')
+    parser.add_argument('--metrics', metavar='FILE', help='write the time and rows/sec of each stage as JSON to FILE')
+    parser.add_argument(
+        '--profile',
+        metavar='STAGE',
+        choices=STAGES,
+        help='profile a stage with cProfile (to stderr): {}'.format(', '.join(STAGES))
+    )
+    parser.add_argument('orders_file', help='the orders CSV file (optionally .gz, .bz2 or .xz)')
+    parser.add_argument('customers_file', help='the customers CSV file (optionally .gz, .bz2 or .xz)')
     args = parser.parse_args()
 
     orders_file = args.orders_file
@@ -549,6 +1932,23 @@ def main():
     timezone = args.timezone
     days_per_bucket = args.days_per_bucket
     verbosity = args.verbosity
+    columnar = args.columnar
+    engine = args.engine
+    processes = args.processes
+    use_cache = args.cache
+    memory_budget = args.memory_budget * BYTES_PER_MB if args.memory_budget else None
+    spill_directory = args.spill_directory
+    sketch_precision = args.sketch_precision
+    filter_orders = args.filter_orders
+    track_memory = args.memory
+    configurations = args.sweep
+    if configurations:
+        # the column store is required to switch configurations
+        timezone, days_per_bucket = configurations[0]
+        columnar = True
+    metrics_file = args.metrics
+    profile_stage = args.profile
+    output_format = args.format
 
     if verbosity > 0:
         print 'ARG: orders_file     = [{}]'.format(orders_file)
@@ -556,64 +1956,134 @@ def main():
         print 'ARG: display size    = [{}]'.format(num_cohorts_to_display)
         print 'ARG: timezone        = [{}]'.format(timezone)
         print 'ARG: verbosity       = [{}]'.format(verbosity)
-
-    # load the csv data files
-    checkpoint = time.time()
-    customers = get_objects_from_file(customers_file)
-    orders = get_objects_from_file(orders_file)
-
-    if verbosity > 0:
-        print 'DEBUG: num customers:', len(customers)
-        print 'DEBUG: num orders:', len(orders)
-        print 'DEBUG: ~~~ 1) time:', time.time() - checkpoint, '(load files)'
+        print 'ARG: columnar        = [{}]'.format(columnar)
+        print 'ARG: engine          = [{}]'.format(engine)
+        print 'ARG: processes       = [{}]'.format(processes)
+        print 'ARG: memory budget   = [{}]'.format(memory_budget)
+        print 'ARG: spill directory = [{}]'.format(spill_directory)
+        print 'ARG: cache           = [{}]'.format(use_cache)
+        print 'ARG: sketch bits     = [{}]'.format(sketch_precision)
+        print 'ARG: filter orders   = [{}]'.format(filter_orders)
+        print 'ARG: sweep           = [{}]'.format(configurations)
+        print 'ARG: format          = [{}]'.format(output_format)
+        print 'ARG: memory          = [{}]'.format(track_memory)
+        print 'ARG: metrics         = [{}]'.format(metrics_file)
+        print 'ARG: profile         = [{}]'.format(profile_stage)
+
+    writer = None if output_format == 'table' else get_writer(output_format)
 
     # start the cohorts initialization
-    checkpoint = time.time()
+    instrumentation = Instrumentation(profile=profile_stage, track_memory=track_memory)
     cohorts = CohortAnalysis(
         timezone=timezone,
         days_per_bucket=days_per_bucket,
-        verbosity=verbosity
+        verbosity=verbosity,
+        columnar=columnar,
+        engine=engine,
+        processes=processes,
+        instrumentation=instrumentation,
+        memory_budget=memory_budget,
+        spill_directory=spill_directory,
+        sketch_precision=sketch_precision,
+        filter_orders=filter_orders
     )
 
-    # -- load all the customers into the cohorts
-    for i in customers:
-        cohorts.add_customer(
-            i['id'],
-            i['created']
-        )
+    # -- load all the customers from the csv data file (streamed, parsed in parallel or from its cache) into the cohorts
+    with instrumentation.span('load customers') as timer:
+        if use_cache or processes > 1:
+            num_customers = cohorts.add_customer_epochs(
+                *load_columns_from_file(customers_file, ('id', 'created'), use_cache, instrumentation, processes)
+            )
+        else:
+            num_customers = cohorts.add_customers(
+                iter_columns_from_file(customers_file, ('id', 'created'))
+            )
+        timer.rows = num_customers
 
     if verbosity > 0:
-        print 'DEBUG: ~~~ 2) time:', time.time() - checkpoint, '(add customers)'
-
-    checkpoint = time.time()
-
-    # -- load all the customer orders into the cohorts
-    for i in orders:
-        cohorts.add_order(
-            i['user_id'],
-            i['id'],
-            i['order_number'],
-            i['created'],
-        )
+        print 'DEBUG: num customers:', num_customers
+        print 'DEBUG: ~~~ 1) time:', instrumentation.get_span('load customers').seconds, '(load customers)'
+        _print_memory(instrumentation.get_span('load customers'), 'customer')
+
+    # -- load all the customer orders from the csv data file (streamed, parsed in parallel or from its cache) into the cohorts
+    with instrumentation.span('load orders') as timer:
+        if use_cache or processes > 1:
+            num_orders = cohorts.add_order_epochs(*load_columns_from_file(
+                orders_file, ('user_id', 'id', 'order_number', 'created'), use_cache, instrumentation, processes
+            ))
+        else:
+            num_orders = cohorts.add_orders(
+                iter_columns_from_file(orders_file, ('user_id', 'id', 'order_number', 'created'))
+            )
+        timer.rows = num_orders
 
     if verbosity > 0:
-        print 'DEBUG: ~~~ 3) time:', time.time() - checkpoint, '(add orders)'
+        print 'DEBUG: num orders:', num_orders
+        if filter_orders:
+            print 'DEBUG: dropped orders:', ', '.join('{} {}'.format(v, k) for k, v in cohorts.dropped_orders.items())
+        print 'DEBUG: ~~~ 2) time:', instrumentation.get_span('load orders').seconds, '(load orders)'
+        _print_memory(instrumentation.get_span('load orders'), 'order')
+
+    if configurations:
+        # -- perform the cohort analysis and generate the summarized output of each configuration
+        for timezone, days_per_bucket in cohorts.sweep(configurations):
+            if writer is not None:
+                cohorts.write_output(writer, num_cohorts_to_display)
+            else:
+                print 'Timezone: {}, days per bucket: {}'.format(timezone, days_per_bucket)
+                cohorts.print_table(num_cohorts_to_display)
+
+        if verbosity > 0:
+            print 'DEBUG: ~~~ 3) time:', instrumentation.get_span('analyze').seconds, '(analyze)'
+            _print_memory(instrumentation.get_span('analyze'), 'customer')
+    else:
+        # -- perform the actual cohort analysis
+        cohorts.analyze()
+
+        if verbosity > 0:
+            print 'DEBUG: ~~~ 3) time:', instrumentation.get_span('analyze').seconds, '(analyze)'
+            _print_memory(instrumentation.get_span('analyze'), 'customer')
+
+        # -- generate the summarized output
+        if writer is not None:
+            cohorts.write_output(writer, num_cohorts_to_display)
+        else:
+            cohorts.print_table(num_cohorts_to_display)
 
-    # -- perform the actual cohort analysis
-    checkpoint = time.time()
-    cohorts.analyze()
+    if writer is not None:
+        writer.close()
 
-    if verbosity > 0:
-        print 'DEBUG: ~~~ 4) time:', time.time() - checkpoint, '(analyze)'
+    if filter_orders:
+        message = 'Orders dropped while loading: {}'.format(
+            ', '.join('{} {}'.format(v, k) for k, v in cohorts.dropped_orders.items())
+        )
+        if writer is None:
+            print message
+        else:
+            print >> sys.stderr, message
 
-    # -- generate the summarized output
-    checkpoint = time.time()
-    cohorts.print_table(num_cohorts_to_display)
+    if cohorts.relative_error is not None:
+        message = 'Distinct customers estimated with HyperLogLog sketches (precision {}): {:.2%} relative standard error'.format(
+            sketch_precision, cohorts.relative_error
+        )
+        if writer is None:
+            print message
+        else:
+            # keep the machine readable output clean
+            print >> sys.stderr, message
 
     if verbosity > 0:
-        print 'DEBUG: ~~~ 5) time:', time.time() - checkpoint, '(print table)'
+        print 'DEBUG: ~~~ 4) time:', instrumentation.get_span('render').seconds, '(output)'
+        _print_memory(instrumentation.get_span('render'), None)
         print 'DEBUG: $$$$ TOTAL TIME:', time.time() - start
 
+    if metrics_file:
+        with open(metrics_file, 'w') as output:
+            output.write(instrumentation.to_json() + '\n')
+
+    if profile_stage:
+        sys.stderr.write(instrumentation.profile_stats() or 'stage "{}" did not run\n'.format(profile_stage))
+
     return 0
 
 
@@ -0,0 +1,134 @@
+import bz2
+import gzip
+import os
+import sys
+import threading
+
+from Queue import Full
+from Queue import Queue
+
+try:
+    import lzma
+except ImportError:  # pragma: no cover - optional dependency on Python 2
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+
+READ_SIZE = 1024 * 1024
+QUEUE_SIZE = 16
+
+
+def is_compressed(file_path):
+    """Whether a data file is compressed (i.e., has a ".gz", ".bz2" or ".xz" extension)."""
+    return os.path.splitext(file_path)[1].lower() in ('.gz', '.bz2', '.xz')
+
+
+def open_data_file(file_path):
+    """Opens a data file for reading; ".gz", ".bz2" and ".xz" files are
+    decompressed on the fly by a background thread (see ThreadedReader).
+
+    :param file_path: the path to the data file.
+
+    :return: file object (or ThreadedReader), iterable by lines
+    """
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension == '.gz':
+        return ThreadedReader(gzip.open(file_path, 'rb'))
+    elif extension == '.bz2':
+        return ThreadedReader(bz2.BZ2File(file_path, 'rb'))
+    elif extension == '.xz':
+        if lzma is None:
+            raise ValueError('reading .xz files requires the lzma module (backports.lzma)')
+
+        return ThreadedReader(lzma.open(file_path, 'rb'))
+
+    return open(file_path, 'rb')
+
+
+class ThreadedReader(object):
+    def __init__(self, source, read_size=READ_SIZE, queue_size=QUEUE_SIZE):
+        """Constructor.
+
+        Reads a (decompressing) file object on a background thread, a chunk at a
+        time, so the decompression overlaps with the parsing of the previous
+        chunks (zlib, bz2 and lzma release the GIL while decompressing).
+
+        :param source: the file object to read (closed along with the reader).
+        :param read_size: the number of bytes per chunk.
+        :param queue_size: the maximum number of chunks read ahead.
+        """
+        super(ThreadedReader, self).__init__()
+
+        self._source = source
+        self._read_size = read_size
+        self._chunks = Queue(maxsize=queue_size)
+        self._closed = threading.Event()
+        self._eof = False
+
+        self._thread = threading.Thread(target=self._read_chunks)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __iter__(self):
+        pending = ''
+        while True:
+            chunk = self._next_chunk()
+            if not chunk:
+                break
+
+            data = pending + chunk
+            end = data.rfind('\n') + 1
+            for line in data[:end].splitlines(True):
+                yield line
+
+            pending = data[end:]
+
+        if pending:
+            yield pending
+
+    def close(self):
+        self._closed.set()
+        self._thread.join()
+        self._source.close()
+
+    def _next_chunk(self):
+        # the next chunk read by the thread; empty at the end of the file
+        if self._eof:
+            return ''
+
+        chunk = self._chunks.get()
+        if isinstance(chunk, tuple):
+            # exception info of an error in the thread
+            self._eof = True
+            raise chunk[0], chunk[1], chunk[2]
+
+        if not chunk:
+            self._eof = True
+
+        return chunk
+
+    def _read_chunks(self):
+        try:
+            while not self._closed.is_set():
+                chunk = self._source.read(self._read_size)
+                self._put(chunk)
+                if not chunk:
+                    return
+        except Exception:
+            self._put(sys.exc_info())
+
+    def _put(self, item):
+        while not self._closed.is_set():
+            try:
+                self._chunks.put(item, timeout=0.1)
+                return
+            except Full:
+                pass
@@ -0,0 +1,194 @@
+from array import array
+
+from timeparse import SECONDS_PER_DAY
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover - optional dependency
+    numpy = None
+
+
+class CohortMatrix(object):
+    def __init__(
+            self,
+            num_customers,
+            customers,
+            first):
+        """Constructor.
+
+        The summarized counts of a cohort analysis; group i (0-based, newest
+        first) has i + 1 age buckets.
+
+        :param num_customers: array with the number of customers per group.
+        :param customers: (groups x buckets) array with the number of customers
+            that made an order in each age bucket.
+        :param first: (groups x buckets) array with the number of customers
+            that made their first order in each age bucket.
+        """
+        super(CohortMatrix, self).__init__()
+
+        self.num_customers = num_customers
+        self.customers = customers
+        self.first = first
+
+    @property
+    def num_groups(self):
+        return len(self.num_customers)
+
+    def get_bucket_counts(self, group_index):
+        """Gets the (customers, first) counts of each age bucket of a group.
+
+        :param group_index: the 0-based index of the group.
+
+        :return: list of (int, int) tuples
+        """
+        return [
+            (int(self.customers[group_index, i]), int(self.first[group_index, i]))
+            for i in range(group_index + 1)
+        ]
+
+
+class CohortAssignment(object):
+    def __init__(self, customer_indices, order_rows, order_nums):
+        """Constructor.
+
+        The customers and orders assigned to each cohort group, as lists (one
+        item per group) of typed arrays.
+        """
+        super(CohortAssignment, self).__init__()
+
+        self.customer_indices = customer_indices
+        self.order_rows = order_rows
+        self.order_nums = order_nums
+
+
+def analyze_store(store, end_day, num_groups, days_per_bucket):
+    """Computes the cohort groups and their age buckets from a ColumnStore
+    with NumPy array operations.
+
+    The cohort index of a customer is the number of whole buckets between the
+    local join day and the last day of the newest group; the age bucket of an
+    order is the number of local calendar days since the join day divided by
+    the bucket size. Orders are numbered per customer by date and duplicate
+    order ids within a group are dropped, the same way as the per-row analysis.
+
+    :param store: the ColumnStore with the customers and orders.
+    :param end_day: the local day number (days since 1970-01-01) of the last day of the newest group.
+    :param num_groups: the number of cohort groups.
+    :param days_per_bucket: the number of days per bucket.
+
+    :return: tuple (CohortMatrix, CohortAssignment)
+    """
+    if numpy is None:
+        raise ValueError('the numpy engine requires numpy')
+
+    # customers -> cohort group index
+    joined = _column(store.joined, numpy.uint8).astype(bool)
+    join_epoch = _column(store.join_epoch)
+    join_offset = _column(store.join_offset)
+    join_day = (join_epoch + join_offset) // SECONDS_PER_DAY
+
+    customers = numpy.flatnonzero(joined)
+    customer_group = (end_day - join_day[customers]) // days_per_bucket
+    if len(customers) and (customer_group.min() < 0 or customer_group.max() >= num_groups):
+        raise ValueError('cohort group not found')
+
+    user_group = numpy.full(len(joined), -1, dtype=numpy.int64)
+    user_group[customers] = customer_group
+
+    # walk the customers by descending join date, like the per-row analysis
+    customers = customers[numpy.lexsort((customers, -join_offset[customers], -join_epoch[customers]))]
+    customer_group = user_group[customers]
+
+    # orders of known customers, in processing order
+    order_user = _column(store.order_user)
+    rows = numpy.flatnonzero(user_group[order_user] >= 0)
+    order_user = order_user[rows]
+    order_id = _column(store.order_id)[rows]
+    order_epoch = _column(store.order_epoch)[rows]
+    order_offset = _column(store.order_offset)[rows]
+
+    position = numpy.empty(len(joined), dtype=numpy.int64)
+    position[customers] = numpy.arange(len(customers))
+
+    ordering = numpy.lexsort((
+        _column(store.order_number)[rows],
+        order_id,
+        order_offset,
+        order_epoch,
+        position[order_user],
+    ))
+    rows = rows[ordering]
+    order_user = order_user[ordering]
+    order_id = order_id[ordering]
+    order_day = (order_epoch[ordering] + order_offset[ordering]) // SECONDS_PER_DAY
+    order_group = user_group[order_user]
+
+    # number the orders of each customer
+    run_start = numpy.ones(len(rows), dtype=bool)
+    run_start[1:] = order_user[1:] != order_user[:-1]
+    run_id = numpy.cumsum(run_start) - 1
+    order_num = numpy.arange(len(rows)) - numpy.flatnonzero(run_start)[run_id] + 1
+
+    # ignore duplicate orders (keeping the first one of each group)
+    keep = _first_occurrences(order_group, order_id)
+    rows = rows[keep]
+    order_user = order_user[keep]
+    order_day = order_day[keep]
+    order_group = order_group[keep]
+    order_num = order_num[keep]
+
+    # age bucket of each order; ignore orders in future buckets
+    bucket = numpy.abs(order_day - join_day[order_user]) // days_per_bucket
+    in_range = bucket <= order_group
+    cell = (order_group * num_groups + bucket)[in_range]
+    cell_user = order_user[in_range]
+
+    num_cells = num_groups * num_groups
+    num_users = max(len(joined), 1)
+    orderers = numpy.unique(cell * num_users + cell_user) // num_users
+    first = cell[order_num[in_range] == 1]
+
+    matrix = CohortMatrix(
+        numpy.bincount(customer_group, minlength=num_groups),
+        numpy.bincount(orderers, minlength=num_cells).reshape(num_groups, num_groups),
+        numpy.bincount(first, minlength=num_cells).reshape(num_groups, num_groups),
+    )
+
+    assignment = CohortAssignment(
+        _split(customers, customer_group, num_groups),
+        _split(rows, order_group, num_groups),
+        _split(order_num, order_group, num_groups),
+    )
+
+    return matrix, assignment
+
+
+def _column(values, dtype=None):
+    # zero-copy view of a typed array; only valid until the array is resized
+    if not len(values):
+        return numpy.zeros(0, dtype=numpy.int64)
+
+    return numpy.frombuffer(values, dtype=dtype or numpy.dtype(values.typecode)).astype(numpy.int64)
+
+
+def _first_occurrences(groups, values):
+    # mask of the first occurrence of each (group, value) pair
+    keep = numpy.ones(len(values), dtype=bool)
+    if len(numpy.unique(values)) == len(values):
+        return keep
+
+    ordering = numpy.lexsort((values, groups))
+    duplicate = (groups[ordering][1:] == groups[ordering][:-1]) & (values[ordering][1:] == values[ordering][:-1])
+    keep[ordering[1:][duplicate]] = False
+
+    return keep
+
+
+def _split(values, groups, num_groups):
+    # split the values (already ordered) into one typed array per group
+    ordering = numpy.argsort(groups, kind='mergesort')
+    bounds = numpy.searchsorted(groups[ordering], numpy.arange(num_groups + 1))
+    values = values[ordering].astype(numpy.dtype('l'))
+
+    return [array('l', values[bounds[i]:bounds[i + 1]].tostring()) for i in range(num_groups)]
@@ -0,0 +1,221 @@
+import cProfile
+import json
+import os
+import pstats
+import sys
+import time
+
+from collections import OrderedDict
+from StringIO import StringIO
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - not available on Windows
+    resource = None
+
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+class Span(object):
+    def __init__(self, name):
+        """Constructor.
+
+        The accumulated measurements of a named stage: the number of times it
+        ran, the total seconds and the total number of rows it processed. When
+        the memory is tracked, also the growth of the resident memory during the
+        stage and the peak resident memory of the process at its end (i.e., the
+        high-water mark reached by the stage or before it).
+
+        :param name: the name of the stage (e.g., "add orders").
+        """
+        super(Span, self).__init__()
+
+        self.name = name
+        self.calls = 0
+        self.seconds = 0.0
+        self.rows = None
+        self.memory = None
+        self.peak_memory = None
+
+    @property
+    def rows_per_second(self):
+        if self.rows is None or self.seconds <= 0:
+            return None
+
+        return self.rows / self.seconds
+
+    @property
+    def bytes_per_row(self):
+        if self.rows is None or self.memory is None or self.rows <= 0:
+            return None
+
+        return float(self.memory) / self.rows
+
+    def as_dict(self):
+        result = OrderedDict([
+            ('calls', self.calls),
+            ('seconds', self.seconds),
+            ('rows', self.rows),
+            ('rows_per_second', self.rows_per_second),
+        ])
+
+        if self.memory is not None:
+            result['memory'] = self.memory
+            result['peak_memory'] = self.peak_memory
+            result['bytes_per_row'] = self.bytes_per_row
+
+        return result
+
+
+class Instrumentation(object):
+    def __init__(self, profile=None, track_memory=False):
+        """Constructor.
+
+        Records named spans (stages) of a cohort analysis. Spans with the same
+        name are accumulated and spans may be nested (e.g., "add customers" runs
+        within the "load customers" stage of the command line).
+
+        :param profile: the name of a stage to run under cProfile (see profile_stats).
+        :param track_memory: whether to measure the resident memory (in bytes) of
+            each stage; see get_memory and get_peak_memory.
+        """
+        super(Instrumentation, self).__init__()
+
+        self._spans = OrderedDict()
+        self._profile = profile
+        self._profiler = None
+        self._track_memory = track_memory
+
+    @property
+    def track_memory(self):
+        return self._track_memory
+
+    @property
+    def spans(self):
+        return self._spans.values()
+
+    def get_span(self, name):
+        """Gets the Span of a stage (None when it has not run)."""
+        return self._spans.get(name)
+
+    def span(self, name):
+        """Measures a stage; the rows it processed can be set on the returned
+        context manager:
+
+            with instrumentation.span('add orders') as timer:
+                timer.rows = add_orders()
+
+        :param name: the name of the stage.
+
+        :return: context manager
+        """
+        span = self._spans.get(name)
+        if span is None:
+            span = self._spans[name] = Span(name)
+
+        return _SpanTimer(self, span)
+
+    def metrics(self):
+        """Gets the measurements of every stage.
+
+        :return: dict of dictionaries (calls, seconds, rows, rows_per_second and, when
+            the memory is tracked, memory, peak_memory and bytes_per_row) by stage name
+        """
+        return OrderedDict((span.name, span.as_dict()) for span in self._spans.itervalues())
+
+    def to_json(self):
+        return json.dumps(self.metrics())
+
+    def profile_stats(self, sort='cumulative', limit=30):
+        """Formats the cProfile statistics of the profiled stage.
+
+        :param sort: the pstats sort key.
+        :param limit: the maximum number of functions to list.
+
+        :return: the statistics text or None when the stage was not profiled
+        """
+        if self._profiler is None:
+            return None
+
+        output = StringIO()
+        stats = pstats.Stats(self._profiler, stream=output)
+        stats.sort_stats(sort).print_stats(limit)
+
+        return output.getvalue()
+
+    def _start_profile(self, span):
+        if span.name != self._profile:
+            return None
+
+        if self._profiler is None:
+            self._profiler = cProfile.Profile()
+
+        self._profiler.enable()
+
+        return self._profiler
+
+
+def get_memory():
+    """Gets the current resident memory of the process.
+
+    :return: the number of bytes or None when it is not available
+    """
+    try:
+        with open('/proc/self/statm', 'rb') as statm:
+            return int(statm.read().split()[1]) * PAGE_SIZE
+    except (IOError, IndexError, ValueError):
+        # no procfs; the best known approximation is the peak
+        return get_peak_memory()
+
+
+def get_peak_memory():
+    """Gets the peak resident memory of the process.
+
+    :return: the number of bytes or None when it is not available
+    """
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return peak
+
+    # kilobytes
+    return peak * 1024
+
+
+class _SpanTimer(object):
+    __slots__ = ('rows', '_instrumentation', '_span', '_start', '_profiler', '_memory')
+
+    def __init__(self, instrumentation, span):
+        self.rows = None
+        self._instrumentation = instrumentation
+        self._span = span
+        self._start = None
+        self._profiler = None
+        self._memory = None
+
+    def __enter__(self):
+        if self._instrumentation.track_memory:
+            self._memory = get_memory()
+
+        self._profiler = self._instrumentation._start_profile(self._span)
+        self._start = time.time()
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = time.time() - self._start
+        if self._profiler is not None:
+            self._profiler.disable()
+
+        span = self._span
+        span.calls += 1
+        span.seconds += seconds
+        if self.rows is not None:
+            span.rows = (span.rows or 0) + self.rows
+
+        if self._memory is not None:
+            span.memory = (span.memory or 0) + (get_memory() - self._memory)
+            span.peak_memory = max(span.peak_memory, get_peak_memory())
@@ -0,0 +1,157 @@
+import csv
+import json
+import sys
+
+from collections import OrderedDict
+
+
+FORMATS = ('csv', 'json', 'ndjson')
+CSV_FIELDS = (
+    'timezone',
+    'days_per_bucket',
+    'cohort',
+    'start',
+    'end',
+    'customers',
+    'bucket',
+    'start_day',
+    'end_day',
+    'orderers',
+    'orderers_pct',
+    'first',
+    'first_pct',
+)
+
+
+def get_writer(output_format, stream=None):
+    """Creates the writer of an output format.
+
+    :param output_format: one of FORMATS.
+    :param stream: the file object to write to (defaults to stdout).
+
+    :return: OutputWriter
+    """
+    writers = {
+        'csv': CsvWriter,
+        'json': JsonWriter,
+        'ndjson': NdjsonWriter,
+    }
+    if output_format not in writers:
+        raise ValueError('output format must be one of: {}'.format(', '.join(FORMATS)))
+
+    return writers[output_format](stream)
+
+
+class OutputWriter(object):
+    def __init__(self, stream=None):
+        """Constructor.
+
+        Writes the cohort rows of one or more analyses (e.g., a sweep) as they
+        are generated (see CohortAnalysis.iter_rows), so the whole table is
+        never held in memory. Each row is a dictionary with the cohort label,
+        its start and end dates, its number of customers and its buckets, each
+        with its start and end days and the raw counts and percentages of the
+        customers that made an order (orderers) and their first order (first).
+
+        :param stream: the file object to write to (defaults to stdout).
+        """
+        super(OutputWriter, self).__init__()
+
+        self._stream = stream or sys.stdout
+
+    def write_analysis(self, timezone, days_per_bucket, rows):
+        """Writes the cohort rows of an analysis.
+
+        :param timezone: the timezone of the analysis.
+        :param days_per_bucket: the number of days per bucket of the analysis.
+        :param rows: iterable of cohort rows.
+
+        :return: the number of rows written
+        """
+        raise NotImplementedError()
+
+    def close(self):
+        """Completes the output (the stream itself is not closed)."""
+        self._stream.flush()
+
+
+class CsvWriter(OutputWriter):
+    """Writes one CSV line per bucket of each cohort (i.e., in long format,
+    with the CSV_FIELDS columns), so the number of columns does not depend on
+    the number of buckets.
+    """
+
+    def __init__(self, stream=None):
+        super(CsvWriter, self).__init__(stream)
+
+        self._writer = csv.writer(self._stream, lineterminator='\n')
+        self._writer.writerow(CSV_FIELDS)
+
+    def write_analysis(self, timezone, days_per_bucket, rows):
+        count = 0
+        for row in rows:
+            cohort = (timezone, days_per_bucket, row['cohort'], row['start'], row['end'], row['customers'])
+            for bucket in row['buckets']:
+                self._writer.writerow(cohort + (
+                    bucket['bucket'],
+                    bucket['start_day'],
+                    bucket['end_day'],
+                    bucket['orderers'],
+                    bucket['orderers_pct'],
+                    bucket['first'],
+                    bucket['first_pct'],
+                ))
+            count += 1
+
+        return count
+
+
+class JsonWriter(OutputWriter):
+    """Writes a JSON array with one object per analysis:
+
+        [{"timezone": ..., "days_per_bucket": ..., "cohorts": [<row>, ...]}, ...]
+    """
+
+    def __init__(self, stream=None):
+        super(JsonWriter, self).__init__(stream)
+
+        self._num_analyses = 0
+
+    def write_analysis(self, timezone, days_per_bucket, rows):
+        self._stream.write('[\n' if not self._num_analyses else ',\n')
+        self._stream.write('{{"timezone": {}, "days_per_bucket": {}, "cohorts": ['.format(
+            json.dumps(timezone),
+            json.dumps(days_per_bucket),
+        ))
+        self._num_analyses += 1
+
+        count = 0
+        for row in rows:
+            self._stream.write('\n' if not count else ',\n')
+            self._stream.write(json.dumps(row))
+            count += 1
+
+        self._stream.write('\n]}')
+
+        return count
+
+    def close(self):
+        self._stream.write('\n]\n' if self._num_analyses else '[]\n')
+
+        super(JsonWriter, self).close()
+
+
+class NdjsonWriter(OutputWriter):
+    """Writes one JSON object per line and cohort row, with the timezone and
+    the number of days per bucket of its analysis.
+    """
+
+    def write_analysis(self, timezone, days_per_bucket, rows):
+        count = 0
+        for row in rows:
+            row = OrderedDict([('timezone', timezone), ('days_per_bucket', days_per_bucket)] + row.items())
+            self._stream.write(json.dumps(row))
+            self._stream.write('\n')
+            count += 1
+
+        return count
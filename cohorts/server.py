@@ -0,0 +1,306 @@
+import argparse
+import json
+import sys
+import threading
+import urlparse
+
+from BaseHTTPServer import BaseHTTPRequestHandler
+from BaseHTTPServer import HTTPServer
+from cohort import CohortAnalysis
+from cohort import ENGINES
+from cohort import iter_columns_from_file
+from cohort import load_columns_from_file
+from collections import OrderedDict
+from output import FORMATS
+from output import get_writer
+from SocketServer import ThreadingMixIn
+from StringIO import StringIO
+
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8000
+DEFAULT_CACHE_SIZE = 32
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def load_analysis(orders_file, customers_file, use_cache=False, **options):
+    """Loads the customers and orders CSV files into a CohortAnalysis that can be
+    reconfigured (i.e., kept in a column store).
+
+    :param orders_file: the orders CSV file.
+    :param customers_file: the customers CSV file.
+    :param use_cache: whether to load the files through their binary cache.
+    :param options: the keyword arguments of the CohortAnalysis (e.g., timezone).
+
+    :return: CohortAnalysis
+    """
+    options.setdefault('columnar', True)
+    cohorts = CohortAnalysis(**options)
+    processes = options.get('processes', 1)
+
+    if use_cache or processes > 1:
+        cohorts.add_customer_epochs(*load_columns_from_file(
+            customers_file, ('id', 'created'), use_cache, cohorts.instrumentation, processes
+        ))
+        cohorts.add_order_epochs(*load_columns_from_file(
+            orders_file, ('user_id', 'id', 'order_number', 'created'), use_cache, cohorts.instrumentation, processes
+        ))
+    else:
+        cohorts.add_customers(iter_columns_from_file(customers_file, ('id', 'created')))
+        cohorts.add_orders(iter_columns_from_file(orders_file, ('user_id', 'id', 'order_number', 'created')))
+
+    return cohorts
+
+
+class CohortService(object):
+    def __init__(self, cohorts, timezone='UTC', days_per_bucket=7, cache_size=DEFAULT_CACHE_SIZE):
+        """Constructor.
+
+        Answers cohort table queries from customers and orders loaded once. The
+        rows of each (timezone, days_per_bucket) configuration are computed by
+        reconfiguring and analyzing the same CohortAnalysis (one query at a time,
+        since it is not thread safe) and kept in a least recently used cache, so
+        the queries of a cached configuration (with any limit or format) are
+        answered concurrently without analyzing the data again.
+
+        :param cohorts: the CohortAnalysis of the customers and orders, kept in a
+            column store (see load_analysis).
+        :param timezone: the timezone of the queries without one.
+        :param days_per_bucket: the number of days per bucket of the queries without one.
+        :param cache_size: the maximum number of configurations in the cache.
+        """
+        super(CohortService, self).__init__()
+
+        if not cache_size or cache_size <= 0:
+            raise ValueError('cache size must be greater than 0')
+
+        self._cohorts = cohorts
+        self._timezone = timezone or 'UTC'
+        self._days_per_bucket = days_per_bucket
+        self._cache_size = cache_size
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._analysis_lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    @property
+    def status(self):
+        with self._cache_lock:
+            return OrderedDict([
+                ('customers', self._cohorts.num_customers),
+                ('cached', [OrderedDict([('timezone', i[0]), ('days_per_bucket', i[1])]) for i in self._cache]),
+                ('hits', self._hits),
+                ('misses', self._misses),
+            ])
+
+    def get_rows(self, timezone=None, days_per_bucket=None):
+        """Gets the rows of the cohort table of a configuration (see CohortAnalysis.iter_rows).
+
+        :param timezone: the timezone of the analysis (None for the default one).
+        :param days_per_bucket: the number of days per bucket (None for the default one).
+
+        :return: list of cohort rows (shared by the queries; not to be modified)
+        """
+        key = (timezone or self._timezone, self._days_per_bucket if days_per_bucket is None else days_per_bucket)
+        if key[1] <= 0:
+            raise ValueError('days per bucket must be greater than 0')
+
+        rows = self._get_cached(key)
+        if rows is not None:
+            return rows
+
+        _check_timezone(key[0])
+
+        with self._analysis_lock:
+            # another query may have analyzed the configuration in the meantime
+            rows = self._get_cached(key)
+            if rows is not None:
+                return rows
+
+            self._cohorts.reconfigure(*key)
+            self._cohorts.analyze()
+            rows = list(self._cohorts.iter_rows())
+
+            # cached before the lock is released, so the queries waiting for it find the rows
+            with self._cache_lock:
+                self._misses += 1
+                self._cache[key] = rows
+                while len(self._cache) > self._cache_size:
+                    self._cache.popitem(last=False)
+
+        return rows
+
+    def render(self, output_format='json', timezone=None, days_per_bucket=None, limit=0):
+        """Renders the cohort table of a configuration in an output format.
+
+        :param output_format: one of output.FORMATS.
+        :param timezone: the timezone of the analysis (None for the default one).
+        :param days_per_bucket: the number of days per bucket (None for the default one).
+        :param limit: the number of cohort groups to render; <= 0 renders all groups.
+
+        :return: tuple (content type, rendered string)
+        """
+        if output_format not in FORMATS:
+            raise ValueError('output format must be one of: {}'.format(', '.join(FORMATS)))
+
+        rows = self.get_rows(timezone, days_per_bucket)
+        if limit > 0:
+            rows = rows[:limit]
+
+        stream = StringIO()
+        writer = get_writer(output_format, stream)
+        writer.write_analysis(
+            timezone or self._timezone,
+            self._days_per_bucket if days_per_bucket is None else days_per_bucket,
+            rows
+        )
+        writer.close()
+
+        return CONTENT_TYPES[output_format], stream.getvalue()
+
+    def _get_cached(self, key):
+        with self._cache_lock:
+            rows = self._cache.pop(key, None)
+            if rows is None:
+                return None
+
+            # most recently used last
+            self._cache[key] = rows
+            self._hits += 1
+
+            return rows
+
+
+class CohortServer(ThreadingMixIn, HTTPServer):
+    """Serves the queries of a CohortService over HTTP, each on its own thread:
+
+        GET /cohorts?timezone=<TIMEZONE>&days_per_bucket=<DAYS>&limit=<LIMIT>&format=<FORMAT>
+            the cohort table (all the parameters are optional; json by default)
+        GET /status
+            the number of customers, the cached configurations and the cache hits and misses
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, service, address=(DEFAULT_HOST, DEFAULT_PORT), verbosity=0):
+        # the SocketServer classes are old-style classes
+        HTTPServer.__init__(self, address, CohortRequestHandler)
+
+        self.service = service
+        self.verbosity = verbosity
+
+
+class CohortRequestHandler(BaseHTTPRequestHandler):
+    server_version = 'CohortServer/1.0'
+
+    def do_GET(self):
+        url = urlparse.urlparse(self.path)
+        try:
+            if url.path == '/cohorts':
+                content_type, body = self.server.service.render(**_get_query(url.query))
+            elif url.path == '/status':
+                content_type, body = CONTENT_TYPES['json'], json.dumps(self.server.service.status) + '\n'
+            else:
+                self._send_error(404, 'not found: {}'.format(url.path))
+                return
+        except ValueError as e:
+            self._send_error(400, str(e))
+            return
+
+        self._send(200, content_type, body)
+
+    def log_message(self, format, *args):
+        if self.server.verbosity > 0:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def _send_error(self, code, message):
+        self._send(code, CONTENT_TYPES['json'], json.dumps({'error': message}) + '\n')
+
+    def _send(self, code, content_type, body):
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def _get_query(query):
+    # the keyword arguments of CohortService.render from the query string
+    params = dict(urlparse.parse_qsl(query))
+    unknown = set(params) - set(('timezone', 'days_per_bucket', 'limit', 'format'))
+    if unknown:
+        raise ValueError('unknown parameters: {}'.format(', '.join(sorted(unknown))))
+
+    result = dict(output_format=params.get('format', 'json'), timezone=params.get('timezone'))
+    for name in ('days_per_bucket', 'limit'):
+        if name in params:
+            try:
+                result[name] = int(params[name])
+            except ValueError:
+                raise ValueError('{} must be an integer'.format(name))
+
+    return result
+
+
+def _check_timezone(timezone):
+    import pendulum
+
+    try:
+        pendulum.timezone(timezone)
+    except Exception:
+        raise ValueError('unknown timezone: {}'.format(timezone))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='serve the cohort tables of the customers and orders loaded once')
+    parser.add_argument('--host', default=DEFAULT_HOST, help='the address to listen on')
+    parser.add_argument('-p', '--port', type=int, default=DEFAULT_PORT, help='the port to listen on')
+    parser.add_argument('-tz', '--timezone', default='UTC', help='the timezone of the queries without one')
+    parser.add_argument('-d', '--days-per-bucket', metavar='DAYS', type=int, default=7, help='number of days per bucket')
+    parser.add_argument('-v', '--verbosity', action='count', default=0, help='log the requests')
+    parser.add_argument('--engine', choices=ENGINES, default='python', help='the cohort analysis engine')
+    parser.add_argument('-j', '--processes', type=int, default=1, help='number of processes to parse and analyze the data')
+    parser.add_argument('--cache', action='store_true', help='cache the parsed CSV data in binary sidecar files')
+    parser.add_argument('--filter-orders', action='store_true', help='drop the duplicate and orphan orders as they are loaded')
+    parser.add_argument(
+        '--cache-size',
+        type=int,
+        default=DEFAULT_CACHE_SIZE,
+        help='the number of (timezone, days per bucket) cohort tables kept in memory'
+    )
+    parser.add_argument('orders_file', help='the orders CSV file (optionally .gz, .bz2 or .xz)')
+    parser.add_argument('customers_file', help='the customers CSV file (optionally .gz, .bz2 or .xz)')
+    args = parser.parse_args()
+
+    cohorts = load_analysis(
+        args.orders_file,
+        args.customers_file,
+        use_cache=args.cache,
+        timezone=args.timezone,
+        days_per_bucket=args.days_per_bucket,
+        engine=args.engine,
+        processes=args.processes,
+        filter_orders=args.filter_orders,
+    )
+    service = CohortService(cohorts, args.timezone, args.days_per_bucket, args.cache_size)
+    server = CohortServer(service, (args.host, args.port), args.verbosity)
+
+    print 'Serving {} customers on http://{}:{}/cohorts'.format(cohorts.num_customers, *server.server_address)
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
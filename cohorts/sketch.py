@@ -0,0 +1,214 @@
+import hashlib
+import math
+
+from array import array
+from bisect import bisect_left
+
+
+MIN_PRECISION = 4
+MAX_PRECISION = 16
+DEFAULT_PRECISION = 12
+HASH_BITS = 64
+HASH_MASK = (1 << HASH_BITS) - 1
+# the maximum number of registers set in a sparse sketch (or a quarter of its registers)
+SPARSE_LIMIT = 128
+# the bits of the rank in the items of a sparse sketch (below the index of the register)
+RANK_BITS = 8
+RANK_MASK = (1 << RANK_BITS) - 1
+
+
+class HyperLogLog(object):
+    __slots__ = ('_precision', '_registers', '_sparse')
+
+    def __init__(self, precision=DEFAULT_PRECISION):
+        """Constructor.
+
+        A HyperLogLog sketch estimating the number of distinct values (e.g., user
+        ids) added to it in at most 2^precision bytes, whatever the number of
+        values. Like a Bitmap, it starts sparse (a sorted typed array of the
+        indices and ranks of the registers set so far) and only allocates the
+        dense registers once more than SPARSE_LIMIT (or a quarter) of them are
+        set, so the sketches of small sets (e.g., the customers of a day) stay
+        small. Sketches of the same precision merge into the sketch of the union
+        of their values, so the sketches of shards (or of incremental updates)
+        can be combined without double counting the values they share.
+
+        :param precision: the number of bits indexing the registers, between
+            MIN_PRECISION and MAX_PRECISION; the relative standard error of the
+            estimates is 1.04 / sqrt(2^precision) (e.g., 1.6% for 12 bits).
+        """
+        super(HyperLogLog, self).__init__()
+
+        if precision is None or not MIN_PRECISION <= precision <= MAX_PRECISION:
+            raise ValueError('precision must be between {} and {}'.format(MIN_PRECISION, MAX_PRECISION))
+
+        self._precision = precision
+        self._registers = None
+        self._sparse = array('I')
+
+    def __getstate__(self):
+        # byte strings, which pickle (e.g., between processes) much smaller than arrays
+        if self._registers is not None:
+            return self._precision, str(self._registers), None
+
+        return self._precision, None, self._sparse.tostring()
+
+    def __setstate__(self, state):
+        self._precision = state[0]
+        self._registers = None
+        self._sparse = None
+        if state[1] is not None:
+            self._registers = bytearray(state[1])
+        else:
+            self._sparse = array('I')
+            self._sparse.fromstring(state[2])
+
+    @property
+    def precision(self):
+        return self._precision
+
+    @property
+    def relative_error(self):
+        return get_relative_error(self._precision)
+
+    @property
+    def is_sparse(self):
+        return self._registers is None
+
+    @property
+    def nbytes(self):
+        """The number of bytes of the registers (dense) or of the registers set (sparse)."""
+        if self._registers is not None:
+            return len(self._registers)
+
+        return len(self._sparse) * self._sparse.itemsize
+
+    def add(self, value):
+        """Adds a value to the sketch.
+
+        :param value: an integer or a string.
+        """
+        hashed = _hash(value)
+        shift = HASH_BITS - self._precision
+        self._set(hashed >> shift, shift - (hashed & ((1 << shift) - 1)).bit_length() + 1)
+
+    def update(self, values):
+        """Adds several values to the sketch.
+
+        :param values: iterable of integers or strings.
+        """
+        shift = HASH_BITS - self._precision
+        mask = (1 << shift) - 1
+        for value in values:
+            hashed = _hash(value)
+            self._set(hashed >> shift, shift - (hashed & mask).bit_length() + 1)
+
+    def merge(self, other):
+        """Merges another sketch into this one (which then estimates the union of both).
+
+        :param other: a HyperLogLog of the same precision.
+        """
+        if other.precision != self._precision:
+            raise ValueError('only sketches of the same precision can be merged')
+
+        if other._registers is None:
+            # only the registers set in the other sketch can change
+            for item in other._sparse:
+                self._set(item >> RANK_BITS, item & RANK_MASK)
+        elif self._registers is None:
+            sparse = self._sparse
+            self._registers = bytearray(other._registers)
+            self._sparse = None
+            for item in sparse:
+                self._set(item >> RANK_BITS, item & RANK_MASK)
+        else:
+            self._registers = bytearray(map(max, self._registers, other._registers))
+
+    def copy(self):
+        result = HyperLogLog(self._precision)
+        if self._registers is not None:
+            result._registers = bytearray(self._registers)
+            result._sparse = None
+        else:
+            result._sparse = array('I', self._sparse)
+
+        return result
+
+    def count(self):
+        """Estimates the number of distinct values added to the sketch.
+
+        :return: integer
+        """
+        num_registers = 1 << self._precision
+        if self._registers is not None:
+            num_zeros = self._registers.count(b'\x00')
+            ranks = self._registers
+        else:
+            num_zeros = num_registers - len(self._sparse)
+            ranks = [i & RANK_MASK for i in self._sparse]
+
+        if num_zeros == num_registers:
+            return 0
+
+        # the zero registers each add 2^0 to the harmonic sum
+        total = sum(2.0 ** -i for i in ranks if i) + num_zeros
+        estimate = _get_alpha(num_registers) * num_registers * num_registers / total
+        if estimate <= 2.5 * num_registers and num_zeros:
+            # small range correction (linear counting)
+            estimate = num_registers * math.log(float(num_registers) / num_zeros)
+
+        return int(round(estimate))
+
+    def _set(self, index, rank):
+        # raises the rank of a register, if lower
+        registers = self._registers
+        if registers is not None:
+            if rank > registers[index]:
+                registers[index] = rank
+            return
+
+        sparse = self._sparse
+        position = bisect_left(sparse, index << RANK_BITS)
+        if position < len(sparse) and sparse[position] >> RANK_BITS == index:
+            if rank > sparse[position] & RANK_MASK:
+                sparse[position] = (index << RANK_BITS) | rank
+            return
+
+        sparse.insert(position, (index << RANK_BITS) | rank)
+        if len(sparse) > min(SPARSE_LIMIT, (1 << self._precision) >> 2):
+            registers = bytearray(1 << self._precision)
+            for item in sparse:
+                registers[item >> RANK_BITS] = item & RANK_MASK
+
+            self._registers = registers
+            self._sparse = None
+
+
+def get_relative_error(precision):
+    """Gets the relative standard error of the estimates of a sketch precision."""
+    return 1.04 / math.sqrt(1 << precision)
+
+
+def _get_alpha(num_registers):
+    if num_registers == 16:
+        return 0.673
+    elif num_registers == 32:
+        return 0.697
+    elif num_registers == 64:
+        return 0.709
+
+    return 0.7213 / (1 + (1.079 / num_registers))
+
+
+def _hash(value):
+    # 64-bit hash, the same in every process (unlike hash() of strings with -R)
+    if isinstance(value, (int, long)):
+        hashed = (value + 0x9E3779B97F4A7C15) & HASH_MASK
+    else:
+        hashed = int(hashlib.md5(str(value)).hexdigest()[:16], 16)
+
+    # splitmix64 finalizer
+    hashed = ((hashed ^ (hashed >> 30)) * 0xBF58476D1CE4E5B9) & HASH_MASK
+    hashed = ((hashed ^ (hashed >> 27)) * 0x94D049BB133111EB) & HASH_MASK
+
+    return hashed ^ (hashed >> 31)
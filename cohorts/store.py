@@ -0,0 +1,383 @@
+import os
+import shutil
+import tempfile
+
+from array import array
+from itertools import imap
+
+from timeparse import SECONDS_PER_DAY
+from timeparse import Timestamp
+
+
+# estimated bytes in memory (ColumnStore and analysis) per byte of a spilled partition
+SPILL_EXPANSION = 8
+
+
+class ColumnStore(object):
+    def __init__(self):
+        """Constructor.
+
+        Columnar storage for the customers and orders of a cohort analysis.
+        User ids are remapped to dense indices (in the order they are first
+        seen) and every field is kept in a typed array instead of a per-row
+        Python object.
+
+        customer columns (by dense user index):
+            user_id, join_epoch, join_offset, joined (1 when the join date is known)
+
+        order columns (by order row):
+            order_user (dense user index), order_id, order_number, order_epoch, order_offset
+        """
+        super(ColumnStore, self).__init__()
+
+        self._user_index = dict()
+        self._num_customers = 0
+
+        self.user_id = array('l')
+        self.join_epoch = array('l')
+        self.join_offset = array('i')
+        self.joined = bytearray()
+
+        self.order_user = array('l')
+        self.order_id = array('l')
+        self.order_number = array('i')
+        self.order_epoch = array('l')
+        self.order_offset = array('i')
+
+        self._orders_by_user = None
+
+    @property
+    def num_customers(self):
+        return self._num_customers
+
+    @property
+    def num_orders(self):
+        return len(self.order_id)
+
+    @property
+    def num_users(self):
+        return len(self.user_id)
+
+    def index_of(self, user_id):
+        """Gets the dense index of a user id.
+
+        :param user_id: the user id.
+
+        :return: the dense index or None when the user id has not been seen
+        """
+        return self._user_index.get(user_id)
+
+    def add_customer(self, user_id, join_date):
+        """Add (or replace) the join date of a customer.
+
+        :param user_id: the user id (integer).
+        :param join_date: the join date Timestamp.
+
+        :return: the dense index of the customer
+        """
+        index = self._resolve(user_id)
+
+        if not self.joined[index]:
+            self.joined[index] = 1
+            self._num_customers += 1
+
+        self.join_epoch[index] = join_date.epoch
+        self.join_offset[index] = join_date.offset
+
+        return index
+
+    def add_order(self, user_id, order_id, order_number, order_date):
+        """Add an order.
+
+        :param user_id: the user id (integer).
+        :param order_id: the order id (integer).
+        :param order_number: the order number (integer).
+        :param order_date: the order date Timestamp.
+
+        :return: the row of the order
+        """
+        self.order_user.append(self._resolve(user_id))
+        self.order_id.append(order_id)
+        self.order_number.append(order_number)
+        self.order_epoch.append(order_date.epoch)
+        self.order_offset.append(order_date.offset)
+
+        return len(self.order_id) - 1
+
+    def localize(self, offset):
+        """Recomputes the UTC offsets of every join and order date (e.g., for
+        another timezone).
+
+        :param offset: function returning the UTC offset (in seconds) of UTC epoch seconds.
+        """
+        self.join_offset = array('i', imap(offset, self.join_epoch))
+        self.order_offset = array('i', imap(offset, self.order_epoch))
+
+    def customer_indices(self):
+        """Generates the dense indices of the users with a known join date."""
+        joined = self.joined
+        for index in xrange(len(joined)):
+            if joined[index]:
+                yield index
+
+    def join_date(self, index):
+        return Timestamp(self.join_epoch[index], self.join_offset[index])
+
+    def join_day(self, index):
+        return (self.join_epoch[index] + self.join_offset[index]) // SECONDS_PER_DAY
+
+    def order_date(self, row):
+        return Timestamp(self.order_epoch[row], self.order_offset[row])
+
+    def order_day(self, row):
+        return (self.order_epoch[row] + self.order_offset[row]) // SECONDS_PER_DAY
+
+    def orders_by_user(self):
+        """Groups the order rows by user with a counting sort.
+
+        The result only depends on the users and orders (not on their dates), so
+        it is kept until more users or orders are added.
+
+        :return: tuple (starts, rows) where the rows of dense user index i are
+            rows[starts[i]:starts[i + 1]], in the order they were added
+        """
+        num_users = len(self.user_id)
+        order_user = self.order_user
+        if self._orders_by_user is not None and self._orders_by_user[0] == (num_users, len(order_user)):
+            return self._orders_by_user[1]
+
+        starts = array('l', [0]) * (num_users + 1)
+        for index in order_user:
+            starts[index + 1] += 1
+
+        for index in xrange(num_users):
+            starts[index + 1] += starts[index]
+
+        positions = array('l', starts)
+        rows = array('l', [0]) * len(order_user)
+        for row, index in enumerate(order_user):
+            rows[positions[index]] = row
+            positions[index] += 1
+
+        self._orders_by_user = ((num_users, len(order_user)), (starts, rows))
+
+        return starts, rows
+
+    def _resolve(self, user_id):
+        index = self._user_index.get(user_id)
+        if index is None:
+            index = len(self.user_id)
+            self._user_index[user_id] = index
+            self.user_id.append(user_id)
+            self.join_epoch.append(0)
+            self.join_offset.append(0)
+            self.joined.append(0)
+
+        return index
+
+
+class ShardedStore(object):
+    def __init__(self, num_shards):
+        """Constructor.
+
+        Splits the customers and orders across several ColumnStores by the
+        hash of the user id, so each shard holds every order of its customers
+        and can be analyzed on its own.
+
+        :param num_shards: the number of shards (integer > 0).
+        """
+        super(ShardedStore, self).__init__()
+
+        if not num_shards or num_shards <= 0:
+            raise ValueError('number of shards must be greater than 0')
+
+        self.shards = [ColumnStore() for i in range(num_shards)]
+
+    @property
+    def num_customers(self):
+        return sum(i.num_customers for i in self.shards)
+
+    @property
+    def num_orders(self):
+        return sum(i.num_orders for i in self.shards)
+
+    @property
+    def num_partitions(self):
+        return len(self.shards)
+
+    def get_shard(self, user_id):
+        return self.shards[hash(user_id) % len(self.shards)]
+
+    def get_partition(self, index):
+        return self.shards[index]
+
+    def add_customer(self, user_id, join_date):
+        """Add (or replace) the join date of a customer; see ColumnStore.add_customer."""
+        self.get_shard(user_id).add_customer(user_id, join_date)
+
+    def add_order(self, user_id, order_id, order_number, order_date):
+        """Add an order; see ColumnStore.add_order."""
+        self.get_shard(user_id).add_order(user_id, order_id, order_number, order_date)
+
+    def localize(self, offset):
+        """Recomputes the UTC offsets of every shard; see ColumnStore.localize."""
+        for shard in self.shards:
+            shard.localize(offset)
+
+
+class SpilledStore(object):
+    def __init__(self, memory_budget, directory=None, offset=None, num_buckets=256):
+        """Constructor.
+
+        Spills the customers and orders to binary files on local disk, bucketed
+        by the hash of the user id, so each bucket holds every order of its
+        customers. The buckets are then loaded a partition (a few consecutive
+        buckets) at a time into a ColumnStore, to analyze data sets larger than
+        the memory.
+
+        Up to a quarter of the memory budget is used to buffer the rows before
+        writing them; the partitions are sized to fit the rest of the budget
+        once loaded (estimated from their size on disk, see SPILL_EXPANSION).
+        Only the UTC epochs are spilled; the UTC offsets are computed when a
+        partition is loaded (see localize).
+
+        :param memory_budget: the memory budget in bytes (integer > 0).
+        :param directory: the directory of the temporary files (defaults to the system one).
+        :param offset: function returning the UTC offset (in seconds) of UTC epoch seconds (defaults to UTC).
+        :param num_buckets: the number of buckets (the finest partitioning).
+        """
+        super(SpilledStore, self).__init__()
+
+        if not memory_budget or memory_budget <= 0:
+            raise ValueError('memory budget must be greater than 0')
+
+        self._memory_budget = memory_budget
+        self._offset = offset or (lambda epoch: 0)
+        self._directory = tempfile.mkdtemp(prefix='cohorts-', dir=directory)
+        self._customers = [array('l') for i in range(num_buckets)]
+        self._orders = [array('l') for i in range(num_buckets)]
+        self._buffered = 0
+        self._num_customers = 0
+        self._num_orders = 0
+        self._partitions = None
+
+    def __del__(self):
+        self.close()
+
+    @property
+    def directory(self):
+        return self._directory
+
+    @property
+    def num_customers(self):
+        """The number of customer rows added (a replaced join date counts twice)."""
+        return self._num_customers
+
+    @property
+    def num_orders(self):
+        return self._num_orders
+
+    @property
+    def num_partitions(self):
+        return len(self._get_partitions())
+
+    def add_customer(self, user_id, join_date):
+        """Add (or replace) the join date of a customer; see ColumnStore.add_customer."""
+        self._customers[hash(user_id) % len(self._customers)].extend((user_id, join_date.epoch))
+        self._num_customers += 1
+        self._add_buffered(2)
+
+    def add_order(self, user_id, order_id, order_number, order_date):
+        """Add an order; see ColumnStore.add_order."""
+        self._orders[hash(user_id) % len(self._orders)].extend((user_id, order_id, order_number, order_date.epoch))
+        self._num_orders += 1
+        self._add_buffered(4)
+
+    def localize(self, offset):
+        """Changes the UTC offsets of the partitions loaded from now on.
+
+        :param offset: function returning the UTC offset (in seconds) of UTC epoch seconds.
+        """
+        self._offset = offset
+
+    def get_partition(self, index):
+        """Loads a partition.
+
+        :param index: the index of the partition (< num_partitions).
+
+        :return: ColumnStore with the customers and orders of the partition
+        """
+        offset = self._offset
+        store = ColumnStore()
+        for bucket in self._get_partitions()[index]:
+            customers = self._read(self._get_path('customers', bucket))
+            for i in xrange(0, len(customers), 2):
+                epoch = customers[i + 1]
+                store.add_customer(customers[i], Timestamp(epoch, offset(epoch)))
+
+            orders = self._read(self._get_path('orders', bucket))
+            for i in xrange(0, len(orders), 4):
+                epoch = orders[i + 3]
+                store.add_order(orders[i], orders[i + 1], orders[i + 2], Timestamp(epoch, offset(epoch)))
+
+        return store
+
+    def flush(self):
+        """Writes the buffered rows to the bucket files."""
+        for name, buffers in (('customers', self._customers), ('orders', self._orders)):
+            for bucket, values in enumerate(buffers):
+                if values:
+                    with open(self._get_path(name, bucket), 'ab') as spill_file:
+                        values.tofile(spill_file)
+                    del values[:]
+
+        self._buffered = 0
+
+    def close(self):
+        """Removes the spilled files."""
+        directory = getattr(self, '_directory', None)
+        if directory and os.path.isdir(directory):
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def _add_buffered(self, num_values):
+        self._partitions = None
+        self._buffered += num_values
+        if self._buffered * array('l').itemsize * 4 >= self._memory_budget:
+            self.flush()
+
+    def _get_partitions(self):
+        if self._partitions is not None:
+            return self._partitions
+
+        self.flush()
+
+        # group consecutive buckets while they fit in the memory budget
+        budget = (self._memory_budget * 3) // 4
+        partitions = [[]]
+        size = 0
+        for bucket in range(len(self._customers)):
+            bucket_size = sum(
+                os.path.getsize(i) if os.path.exists(i) else 0
+                for i in (self._get_path('customers', bucket), self._get_path('orders', bucket))
+            ) * SPILL_EXPANSION
+            if partitions[-1] and size + bucket_size > budget:
+                partitions.append([])
+                size = 0
+
+            partitions[-1].append(bucket)
+            size += bucket_size
+
+        self._partitions = partitions
+
+        return partitions
+
+    def _get_path(self, name, bucket):
+        return os.path.join(self._directory, '{}-{}.bin'.format(name, bucket))
+
+    def _read(self, path):
+        values = array('l')
+        if os.path.exists(path):
+            with open(path, 'rb') as spill_file:
+                values.fromfile(spill_file, os.path.getsize(path) // values.itemsize)
+
+        return values
@@ -0,0 +1,90 @@
+import os
+import shutil
+import tempfile
+
+from cohort_base_test import CohortTestCase
+
+from cohorts.benchmark import STAGES
+from cohorts.benchmark import generate_data
+from cohorts.benchmark import get_imported_modules
+from cohorts.benchmark import run_benchmark
+from cohorts.benchmark import run_startup_benchmark
+from cohorts.cohort import get_objects_from_file
+
+
+class BenchmarkTest(CohortTestCase):
+
+    def setUp(self):
+        super(BenchmarkTest, self).setUp()
+
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+        super(BenchmarkTest, self).tearDown()
+
+    def test_generate_data(self):
+        num_customers, num_orders = generate_data(
+            self.directory,
+            200,
+            orders_per_customer=2,
+            duplicate_rate=0.1,
+            num_days=30,
+            start_date='2017-05-01',
+            seed=1
+        )
+        self.assertEqual(num_customers, 200)
+
+        customers = get_objects_from_file(os.path.join(self.directory, 'customers.csv'))
+        orders = get_objects_from_file(os.path.join(self.directory, 'orders.csv'))
+        self.assertEqual(len(customers), 200)
+        self.assertEqual(len(orders), num_orders)
+        self.assertTrue(300 < num_orders < 600)
+
+        join_dates = dict((i['id'], i['created']) for i in customers)
+        for order in orders:
+            self.assertTrue(join_dates[order['user_id']] <= order['created'] <= '2017-05-30 23:59:59')
+
+        # some orders are duplicated
+        self.assertTrue(len(set(i['id'] for i in orders)) < num_orders)
+
+        # the same seed generates the same data
+        with open(os.path.join(self.directory, 'orders.csv'), 'rb') as csvfile:
+            content = csvfile.read()
+
+        generate_data(self.directory, 200, 2, 0.1, 30, '2017-05-01', seed=1)
+        with open(os.path.join(self.directory, 'orders.csv'), 'rb') as csvfile:
+            self.assertEqual(csvfile.read(), content)
+
+    def test_generate_bad_input(self):
+        for kwargs in (dict(orders_per_customer=-1), dict(duplicate_rate=2), dict(num_days=0)):
+            try:
+                generate_data(self.directory, 10, **kwargs)
+                self.fail()
+            except ValueError:
+                # successful
+                pass
+
+    def test_run_benchmark(self):
+        num_customers, num_orders = generate_data(self.directory, 100, seed=2)
+
+        for use_cache, processes in ((False, 1), (True, 1), (False, 2)):
+            result = run_benchmark(
+                self.directory, use_cache=use_cache, timezone=self.TZ_PST, days_per_bucket=30, processes=processes
+            )
+            self.assertEqual(result[:2], (num_customers, num_orders))
+            self.assertEqual(tuple(result[2].keys()), STAGES)
+            self.assertTrue(all(i >= 0 for i in result[2].values()))
+
+            # the string parsing path of cohort.py is timed as well
+            self.assertTrue(result[2]['parse'] > 0)
+
+    def test_startup(self):
+        # the heavy dependencies are only imported by the code paths that use them
+        self.assertEqual(get_imported_modules(), [])
+        self.assertEqual(get_imported_modules(['os', 'missing']), ['os'])
+
+        seconds, modules = run_startup_benchmark(repeat=1)
+        self.assertTrue(seconds > 0)
+        self.assertEqual(modules, [])
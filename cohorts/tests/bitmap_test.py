@@ -0,0 +1,108 @@
+import random
+
+from cohort_base_test import CohortTestCase
+
+from cohorts.bitmap import Bitmap
+from cohorts.bitmap import IdSet
+
+
+class BitmapTest(CohortTestCase):
+
+    def get_sets(self, size, count, seed):
+        rng = random.Random(seed)
+        return set(rng.sample(xrange(size), count)), set(rng.sample(xrange(size), count))
+
+    def test_empty(self):
+        bitmap = Bitmap()
+        self.assertEqual(len(bitmap), 0)
+        self.assertEqual(list(bitmap), [])
+        self.assertFalse(bitmap.contains(0))
+        self.assertEqual(bitmap, Bitmap.from_sorted([]))
+        self.assertEqual(bitmap.nbytes, 0)
+
+    def test_bad_indices(self):
+        try:
+            Bitmap([3, -1])
+            self.fail()
+        except ValueError:
+            # successful
+            pass
+
+    def test_representations(self):
+        # sparse: a sorted array
+        bitmap = Bitmap([1000, 5, 5, 70])
+        self.assertTrue(bitmap.is_sparse)
+        self.assertEqual(list(bitmap), [5, 70, 1000])
+        self.assertEqual(len(bitmap), 3)
+        self.assertEqual(bitmap.nbytes, 12)
+
+        # dense: a bitset
+        bitmap = Bitmap(range(0, 1000, 2))
+        self.assertFalse(bitmap.is_sparse)
+        self.assertEqual(len(bitmap), 500)
+        self.assertEqual(bitmap.nbytes, 125)
+        self.assertEqual(list(bitmap), range(0, 1000, 2))
+
+        # both compare (and hash) the same
+        self.assertEqual(Bitmap.from_sorted([1, 2, 3]), Bitmap([3, 2, 1]))
+        self.assertNotEqual(Bitmap([1, 2]), Bitmap([1, 2, 3]))
+        self.assertEqual(hash(Bitmap([1, 2, 3])), hash(Bitmap.from_sorted([1, 2, 3])))
+
+    def test_contains(self):
+        for first, second in (self.get_sets(1000, 10, 1), self.get_sets(1000, 600, 2)):
+            bitmap = Bitmap(first)
+            for i in range(-1, 1001):
+                self.assertEqual(bitmap.contains(i), i in first)
+
+        # the bitmaps of the buckets used to be sets of user ids
+        try:
+            0 in Bitmap([0])
+            self.fail()
+        except TypeError:
+            # successful
+            pass
+
+    def test_operations(self):
+        for size, count in ((1000, 10), (1000, 300), (100000, 20000)):
+            first, second = self.get_sets(size, count, size + count)
+            for left, right in ((first, second), (first, set(list(second)[:5])), (set(), second)):
+                bitmap = Bitmap(left)
+                other = Bitmap(right)
+                self.assertEqual(list(bitmap | other), sorted(left | right))
+                self.assertEqual(list(bitmap & other), sorted(left & right))
+                self.assertEqual(list(other & bitmap), sorted(left & right))
+                self.assertEqual(list(bitmap - other), sorted(left - right))
+                self.assertEqual(list(other - bitmap), sorted(right - left))
+                self.assertEqual(bitmap.intersection_count(other), len(left & right))
+                self.assertEqual(len(bitmap | other), len(left | right))
+
+
+class IdSetTest(CohortTestCase):
+
+    def test_add(self):
+        ids = IdSet(min_bits=64)
+        expected = set()
+        rng = random.Random(1)
+        values = [rng.randint(-10, 5000) for _ in range(3000)] + [10 ** 12, 10 ** 12, -1, 2 ** 70]
+        for value in values:
+            self.assertEqual(ids.add(value), value not in expected)
+            expected.add(value)
+
+        self.assertEqual(len(ids), len(expected))
+        for value in range(-20, 5020) + [10 ** 12, 10 ** 12 + 1, 2 ** 70]:
+            self.assertEqual(value in ids, value in expected)
+
+    def test_sparse_ids(self):
+        # a few large ids do not grow the bitset
+        ids = IdSet(min_bits=64)
+        for value in range(10 ** 9, 10 ** 9 + 100):
+            self.assertTrue(ids.add(value))
+        self.assertEqual(len(ids), 100)
+        self.assertEqual(ids.nbytes, 0)
+
+        # dense ids do
+        ids = IdSet(min_bits=64)
+        for value in range(10000):
+            ids.add(value)
+        self.assertTrue(ids.nbytes < 10000)
+        self.assertFalse(ids._others)
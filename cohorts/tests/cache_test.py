@@ -0,0 +1,91 @@
+import os
+import shutil
+import tempfile
+
+from array import array
+
+from cohort_base_test import CohortTestCase
+
+from cohorts.cache import ColumnCache
+
+
+class ColumnCacheTest(CohortTestCase):
+
+    def setUp(self):
+        super(ColumnCacheTest, self).setUp()
+
+        self.directory = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.directory, 'orders.csv')
+        self.write_file('id,created\n1,2017-05-01 00:00:00\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+        super(ColumnCacheTest, self).tearDown()
+
+    def write_file(self, content):
+        with open(self.file_path, 'wb') as datafile:
+            datafile.write(content)
+
+    def test_save_and_load(self):
+        cache = ColumnCache(self.file_path)
+        self.assertEqual(cache.cache_path, self.file_path + '.cache')
+        self.assertIsNone(cache.load(('id',)))
+
+        cache.save([('id', array('l', [1, 2, 3])), ('created', [1493596800, -1, 0])])
+        self.assertTrue(os.path.exists(cache.cache_path))
+
+        columns = cache.load(('id', 'created'))
+        self.assertEqual(columns['id'], array('l', [1, 2, 3]))
+        self.assertEqual(columns['created'], array('l', [1493596800, -1, 0]))
+
+        self.assertEqual(ColumnCache(self.file_path).load(('created',)), {'created': array('l', [1493596800, -1, 0])})
+
+        # columns that are not in the sidecar
+        self.assertIsNone(cache.load(('id', 'user_id')))
+
+    def test_save_empty(self):
+        cache = ColumnCache(self.file_path)
+        cache.save([('id', array('l'))])
+        self.assertEqual(cache.load(('id',)), {'id': array('l')})
+
+    def test_save_bad_columns(self):
+        try:
+            ColumnCache(self.file_path).save([('id', [1, 2]), ('created', [1])])
+            self.fail()
+        except ValueError:
+            # successful
+            pass
+
+    def test_invalidation(self):
+        cache = ColumnCache(self.file_path)
+        cache.save([('id', [1])])
+
+        # same content, different modification time
+        stat = os.stat(self.file_path)
+        os.utime(self.file_path, (stat.st_atime, stat.st_mtime + 10))
+        self.assertEqual(cache.load(('id',)), {'id': array('l', [1])})
+
+        # same size, different content
+        self.write_file('id,created\n2,2017-05-01 00:00:00\n')
+        os.utime(self.file_path, (stat.st_atime, stat.st_mtime + 20))
+        self.assertIsNone(cache.load(('id',)))
+
+        # different size
+        cache.save([('id', [2])])
+        self.write_file('id,created\n20,2017-05-01 00:00:00\n')
+        self.assertIsNone(cache.load(('id',)))
+
+    def test_corrupted(self):
+        cache = ColumnCache(self.file_path)
+
+        for content in ('', 'garbage', 'COHORTS\x01\xff\xff\xff\xff{'):
+            with open(cache.cache_path, 'wb') as cachefile:
+                cachefile.write(content)
+            self.assertIsNone(cache.load(('id',)))
+
+        # truncated
+        cache.save([('id', [1, 2])])
+        with open(cache.cache_path, 'rb+') as cachefile:
+            cachefile.truncate(os.path.getsize(cache.cache_path) - 1)
+        self.assertIsNone(cache.load(('id',)))
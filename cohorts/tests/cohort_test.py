@@ -1,7 +1,24 @@
+import gzip
+import os
+import random
+import tempfile
+
+from array import array
+from contextlib import closing
+from StringIO import StringIO
+
 from cohort_base_test import CohortTestCase
 
 from cohorts.cohort import CohortAnalysis
 from cohorts.cohort import CohortGroup
+from cohorts.cohort import Order
+from cohorts.cohort import _parse_columns_parallel
+from cohorts.cohort import get_objects_from_file
+from cohorts.cohort import iter_columns_from_file
+from cohorts.cohort import load_columns_from_file
+from cohorts.instrument import Instrumentation
+from cohorts.output import get_writer
+from cohorts.timeparse import as_timestamp
 
 
 class CohortGroupTest(CohortTestCase):
@@ -87,6 +104,41 @@ class CohortGroupTest(CohortTestCase):
             )
         )
 
+    def test_group_timestamps(self):
+        tz = self.TZ_EST
+        start_ts = self.create_datetime(11, 4, 2017, 0, 0, 0, tz)
+        end_ts = self.create_datetime(11, 6, 2017, 23, 59, 59, tz)
+        expected = CohortGroup('a group', 1, 3, start_ts, end_ts)
+
+        # the dates of Timestamps are only converted when needed
+        grp = CohortGroup('a group', 1, 3, as_timestamp(start_ts), as_timestamp(end_ts), timezone=tz)
+        self.assertEqual(grp.label, '11/4-11/6')
+        self.assertEqual(grp.label, expected.label)
+        self.assertTrue(grp._start_date is None)
+        self.assertEqual(grp.start_date.isoformat(), start_ts.isoformat())
+        self.assertEqual(grp.end_date.isoformat(), end_ts.isoformat())
+        self.assertTrue(grp.is_date_in_group(self.create_datetime(11, 5, 2017, 1, 30, 0, tz)))
+
+    def test_generate_groups_dst(self):
+        for tz in (self.TZ_EST, self.TZ_PST):
+            cohort = CohortAnalysis(3, timezone=tz)
+            cohort.add_customer(1, '2017-03-01 12:00:00')
+            cohort.add_customer(2, '2017-11-20 12:00:00')
+            cohort.analyze()
+
+            # each group runs from local midnight to 23:59:59, across the DST changes
+            for grp in cohort._cohort_groups:
+                self.assertEqual((grp.start_date.hour, grp.start_date.minute, grp.start_date.second), (0, 0, 0))
+                self.assertEqual((grp.end_date.hour, grp.end_date.minute, grp.end_date.second), (23, 59, 59))
+                self.assertEqual(grp.end_date.subtract(days=3).add(seconds=1), grp.start_date)
+                self.assertEqual(grp.label, '{}-{}'.format(
+                    grp.start_date.format('M/D', formatter='alternative'),
+                    grp.end_date.format('M/D', formatter='alternative'),
+                ))
+
+            self.assertEqual(cohort._cohort_groups[0].label, '11/18-11/20')
+            self.assertEqual(cohort._cohort_groups[-1].label, '2/27-3/1')
+
     def test_is_in_group_out_of_bound(self):
         tz = self.TZ_UTC
         start_ts = self.create_datetime(5, 1, 2017, 0, 0, 1, tz)
@@ -230,6 +282,14 @@ class CohortGroupTest(CohortTestCase):
         grp.add_order(1, 2, timestamp, 2)
         self.assertEqual(len(grp._orders), 2)
 
+        # add an order record
+        order = Order(1, 3, 7, as_timestamp(timestamp))
+        self.assertTrue(grp.add_order_record(order, 3))
+        self.assertTrue(grp._orders[3] is order)
+        self.assertEqual(order.order_num, 3)
+        self.assertFalse(grp.add_order_record(Order(1, 3, 8, as_timestamp(timestamp)), 4))
+        self.assertEqual(order.order_num, 3)
+
     def test_add_customer(self):
         tz = self.TZ_UTC
         timestamp = self.create_datetime(5, 1, 2017, 0, 0, 1, tz)
@@ -305,6 +365,118 @@ class CohortGroupTest(CohortTestCase):
         self.assertEqual(len(buckets[1]['first']), 0)
         self.assertEqual(len(buckets[1]['customers']), 1)
 
+    def test_buckets_cached(self):
+        tz = self.TZ_UTC
+        start_ts = self.create_datetime(5, 1, 2017, 0, 0, 0, tz)
+        end_ts = self.create_datetime(5, 3, 2017, 23, 59, 59, tz)
+        grp = CohortGroup('a group', 2, 3, start_ts, end_ts)
+
+        grp.add_customer(1, self.create_datetime(5, 1, 2017, 0, 0, 1, tz))
+        grp.add_order(1, 1, self.create_datetime(5, 1, 2017, 0, 0, 1, tz), 1)
+
+        buckets = grp.get_buckets()
+        self.assertTrue(grp.get_buckets() is buckets)
+        self.assertEqual(grp.get_bucket_counts(), [(1, 1), (0, 0)])
+
+        # a duplicate order does not change the group
+        grp.add_order(1, 1, self.create_datetime(5, 4, 2017, 0, 0, 1, tz), 2)
+        self.assertTrue(grp.get_buckets() is buckets)
+
+        # a new order invalidates the buckets
+        grp.add_order(1, 2, self.create_datetime(5, 4, 2017, 0, 0, 1, tz), 2)
+        self.assertFalse(grp.get_buckets() is buckets)
+        self.assertEqual(len(grp.get_buckets()[1]['customers']), 1)
+        self.assertEqual(grp.get_bucket_counts(), [(1, 1), (1, 0)])
+
+        # so does a new customer
+        counts = grp.get_bucket_counts()
+        grp.add_customer(2, self.create_datetime(5, 2, 2017, 0, 0, 1, tz))
+        self.assertFalse(grp.get_bucket_counts() is counts)
+
+    def test_bucket_counts(self):
+        tz = self.TZ_UTC
+        start_ts = self.create_datetime(5, 1, 2017, 0, 0, 0, tz)
+        end_ts = self.create_datetime(5, 3, 2017, 23, 59, 59, tz)
+        grp = CohortGroup('a group', 3, 2, start_ts, end_ts)
+
+        for user_id in (3, 1, 2):
+            grp.add_customer(user_id, self.create_datetime(5, user_id, 2017, 0, 0, 1, tz))
+
+        grp.add_order(2, 1, self.create_datetime(5, 2, 2017, 3, 0, 0, tz), 1)
+        grp.add_order(1, 2, self.create_datetime(5, 2, 2017, 4, 0, 0, tz), 1)
+        grp.add_order(2, 3, self.create_datetime(5, 3, 2017, 3, 0, 0, tz), 2)
+        grp.add_order(1, 4, self.create_datetime(5, 4, 2017, 4, 0, 0, tz), 2)
+        grp.add_order(3, 5, self.create_datetime(5, 8, 2017, 4, 0, 0, tz), 1)
+        grp.add_order(4, 6, self.create_datetime(5, 8, 2017, 4, 0, 0, tz), 1)
+
+        # counts without the sets match the sets
+        counts = grp.get_bucket_counts()
+        self.assertEqual(grp._buckets, None)
+        self.assertEqual(counts, [(2, 2), (1, 0), (1, 1)])
+        self.assertEqual(
+            counts,
+            [(len(i['customers']), len(i['first'])) for i in grp.get_buckets()]
+        )
+
+        self.assertEqual(grp.get_retention(0, 2), 0)
+        self.assertEqual(grp.get_retention(1, 1), 1)
+
+    def test_bucket_bitmaps(self):
+        tz = self.TZ_UTC
+        start_ts = self.create_datetime(5, 1, 2017, 0, 0, 0, tz)
+        end_ts = self.create_datetime(5, 3, 2017, 23, 59, 59, tz)
+        grp = CohortGroup('a group', 3, 2, start_ts, end_ts)
+
+        for user_id in (30, 10, 20):
+            grp.add_customer(user_id, self.create_datetime(5, 1, 2017, 0, 0, 1, tz))
+
+        grp.add_order(10, 1, self.create_datetime(5, 1, 2017, 3, 0, 0, tz), 1)
+        grp.add_order(10, 2, self.create_datetime(5, 3, 2017, 3, 0, 0, tz), 2)
+        grp.add_order(20, 3, self.create_datetime(5, 1, 2017, 4, 0, 0, tz), 1)
+        grp.add_order(20, 4, self.create_datetime(5, 2, 2017, 4, 0, 0, tz), 2)
+        grp.add_order(30, 5, self.create_datetime(5, 4, 2017, 4, 0, 0, tz), 1)
+
+        buckets = grp.get_buckets()
+        self.assertEqual(grp.get_customer_ids(buckets[0]['customers']), [10, 20])
+        self.assertEqual(grp.get_customer_ids(buckets[0]['first']), [10, 20])
+        self.assertEqual(grp.get_customer_ids(buckets[1]['customers']), [10, 30])
+        self.assertEqual(grp.get_customer_ids(buckets[1]['first']), [30])
+        self.assertEqual(grp.get_customer_ids(buckets[2]['customers']), [])
+
+        # membership by user id
+        self.assertTrue(grp.has_customer(1, 30))
+        self.assertTrue(grp.has_customer(1, 30, first=True))
+        self.assertTrue(grp.has_customer(1, 10))
+        self.assertFalse(grp.has_customer(1, 10, first=True))
+        self.assertFalse(grp.has_customer(1, 20))
+        self.assertFalse(grp.has_customer(0, 99))
+        try:
+            grp.has_customer(3, 10)
+            self.fail()
+        except ValueError:
+            # successful
+            pass
+
+        # retention from the first bucket to the second one
+        self.assertEqual(grp.get_customer_ids(buckets[0]['customers'] & buckets[1]['customers']), [10])
+        self.assertEqual(grp.get_retention(0, 1), 1)
+        self.assertEqual(grp.get_retention(0, 0), 2)
+
+        try:
+            grp.get_retention(0, 3)
+            self.fail()
+        except ValueError:
+            # successful
+            pass
+
+        grp.add_order(30, 6, self.create_datetime(5, 4, 2017, 5, 0, 0, tz), 2)
+        try:
+            grp.get_customer_ids(buckets[0]['customers'])
+            self.fail()
+        except ValueError:
+            # successful
+            pass
+
 
 class CohortAnalysisTest(CohortTestCase):
 
@@ -483,12 +655,544 @@ class CohortAnalysisTest(CohortTestCase):
         self.assertEqual(len(cohort._customer_join_date), 2)
         self.assertEqual(
             cohort._customer_join_date[1],
-            self.create_datetime(5, 1, 2017, 0, 0, 1, timezone='UTC')
+            as_timestamp(self.create_datetime(5, 1, 2017, 0, 0, 1, timezone='UTC'))
         )
         self.assertEqual(
             cohort._customer_join_date[2],
-            self.create_datetime(5, 1, 2017, 0, 2, 0, timezone='UTC')
+            as_timestamp(self.create_datetime(5, 1, 2017, 0, 2, 0, timezone='UTC'))
+        )
+
+    def test_add_customers(self):
+        cohort = CohortAnalysis(1, timezone=self.TZ_UTC)
+
+        count = cohort.add_customers([
+            (1, '2017-05-02 00:00:01'),
+            ('2', '2017-05-01 00:02:00'),
+            (3, '2017-05-03 00:00:00'),
+        ])
+        self.assertEqual(count, 3)
+        self.assertEqual(sorted(cohort._customer_join_date.keys()), [1, 2, 3])
+        self.assertEqual(cohort._min_customer_join_date, cohort._customer_join_date[2])
+        self.assertEqual(cohort._max_customer_join_date, cohort._customer_join_date[3])
+
+        # the rows before a bad row are still accounted for
+        try:
+            cohort.add_customers([(4, '2017-04-01 00:00:00'), (5, None)])
+            self.fail()
+        except ValueError:
+            # successful
+            pass
+
+        self.assertEqual(cohort._min_customer_join_date, cohort._customer_join_date[4])
+
+    def test_add_customer_columns(self):
+        cohort = CohortAnalysis(1, timezone=self.TZ_UTC, columnar=True)
+
+        count = cohort.add_customer_columns([1, 2], ['2017-05-01 00:00:01', '2017-05-01 00:02:00'])
+        self.assertEqual(count, 2)
+        self.assertEqual(cohort._store.num_customers, 2)
+
+        try:
+            cohort.add_customer_columns([1, 2], ['2017-05-01 00:00:01'])
+            self.fail()
+        except ValueError:
+            # successful
+            pass
+
+    def test_add_epochs(self):
+        cohort = CohortAnalysis(1, timezone=self.TZ_EST, columnar=True)
+
+        # 2017-05-01 00:00:01 UTC
+        count = cohort.add_customer_epochs([1, 2], [1493596801, 1493596920])
+        self.assertEqual(count, 2)
+        self.assertEqual(
+            cohort._store.join_date(0),
+            as_timestamp(self.create_datetime(5, 1, 2017, 0, 0, 1, timezone='UTC').in_timezone(self.TZ_EST))
         )
+        self.assertEqual(cohort._min_customer_join_date, cohort._store.join_date(0))
+        self.assertEqual(cohort._max_customer_join_date, cohort._store.join_date(1))
+
+        count = cohort.add_order_epochs([1, 2], [10, 11], [1, 1], [1493596801, 1493596920])
+        self.assertEqual(count, 2)
+        self.assertEqual(cohort._store.order_date(1), cohort._store.join_date(1))
+
+        try:
+            cohort.add_order_epochs([1, 2], [10], [1, 1], [1493596801, 1493596920])
+            self.fail()
+        except ValueError:
+            # successful
+            pass
+
+    def test_add_orders(self):
+        timestamp = '2017-05-01 00:00:01'
+
+        for columnar in (False, True):
+            cohort = CohortAnalysis(1, timezone=self.TZ_UTC, columnar=columnar)
+
+            count = cohort.add_orders(iter([(1, 1, 1, timestamp), (1, 2, 2, timestamp), (2, 3, 1, timestamp)]))
+            self.assertEqual(count, 3)
+
+            count = cohort.add_order_columns([3, 3], [4, 5], [1, 2], [timestamp, timestamp])
+            self.assertEqual(count, 2)
+
+            if columnar:
+                self.assertEqual(cohort._store.num_orders, 5)
+            else:
+                self.assertEqual([len(cohort._cust_orders[i]) for i in (1, 2, 3)], [2, 1, 2])
+
+            for orders in ([(1, 6, 0, timestamp)], [(1, 7, 1, None)]):
+                try:
+                    cohort.add_orders(orders)
+                    self.fail()
+                except ValueError:
+                    # successful
+                    pass
+
+    def add_sample_data(self, cohort):
+        cohort.add_customer(1, '2017-05-01 00:01:00')
+        cohort.add_customer(2, '2017-05-01 23:02:00')
+        cohort.add_customer(3, '2017-05-09 04:03:00')
+        cohort.add_customer(4, '2017-05-12 06:04:00')
+        cohort.add_customer(5, '2017-05-16 18:05:00')
+
+        cohort.add_order(1, 101, 1, '2017-05-02 03:08:01')
+        cohort.add_order(1, 102, 2, '2017-05-01 01:08:01')
+        cohort.add_order(1, 103, 3, '2017-05-13 03:08:01')
+        cohort.add_order(2, 201, 1, '2017-05-19 00:08:01')
+        cohort.add_order(3, 301, 1, '2017-05-09 03:08:01')
+        cohort.add_order(3, 302, 2, '2017-05-10 03:08:01')
+        cohort.add_order(4, 401, 1, '2017-05-16 23:08:01')
+        cohort.add_order(6, 601, 1, '2017-05-16 23:08:01')
+
+    def get_bucket_sizes(self, cohort):
+        return [
+            [(len(i['customers']), len(i['first'])) for i in grp.get_buckets()]
+            for grp in cohort._cohort_groups
+        ]
+
+    def test_shared_order_records(self):
+        cohort = CohortAnalysis(3, timezone=self.TZ_UTC)
+        self.add_sample_data(cohort)
+        cohort.add_order(1, 101, 4, '2017-05-03 03:08:01')
+        cohort.analyze()
+
+        # the cohort groups keep the orders of the analysis, without copies
+        orders = set(id(order) for user_orders in cohort._cust_orders.values() for order in user_orders)
+        grp_orders = dict((order_id, order) for grp in cohort._cohort_groups for order_id, order in grp._orders.items())
+        self.assertEqual(sorted(grp_orders), [101, 102, 103, 201, 301, 302, 401])
+        self.assertTrue(all(id(i) in orders for i in grp_orders.values()))
+        self.assertTrue(all(isinstance(i, Order) for i in grp_orders.values()))
+
+        # numbered by date within each customer, the first of the duplicates is kept
+        self.assertEqual([(grp_orders[i].order_number, grp_orders[i].order_num) for i in (101, 102, 103)], [(1, 2), (2, 1), (3, 4)])
+
+    def test_filter_orders(self):
+        for kwargs in (dict(), dict(columnar=True), dict(processes=2), dict(engine='numpy')):
+            expected = CohortAnalysis(3, timezone=self.TZ_UTC, **kwargs)
+            self.add_sample_data(expected)
+            expected.add_order(3, 303, 3, '2017-05-11 03:08:01')
+            expected.analyze()
+
+            cohort = CohortAnalysis(3, timezone=self.TZ_UTC, filter_orders=True, **kwargs)
+            self.add_sample_data(cohort)
+            self.assertEqual(cohort.dropped_orders, {'duplicate': 0, 'orphan': 1})
+
+            # the first order added with an id is kept, even across customers
+            self.assertEqual(cohort.add_orders([
+                (1, 101, 4, '2017-04-03 03:08:01'),
+                (2, 301, 2, '2017-05-20 00:08:01'),
+                (7, 701, 1, '2017-05-20 00:08:01'),
+                (3, 303, 3, '2017-05-11 03:08:01'),
+            ]), 1)
+            self.assertEqual(cohort.dropped_orders, {'duplicate': 2, 'orphan': 2})
+            cohort.analyze()
+
+            self.assertEqual(
+                [cohort._get_group_counts(i, grp) for i, grp in enumerate(cohort._cohort_groups)],
+                [expected._get_group_counts(i, grp) for i, grp in enumerate(expected._cohort_groups)],
+            )
+
+    def test_filter_orders_without_customers(self):
+        # without customers, only the duplicates are dropped
+        cohort = CohortAnalysis(filter_orders=True)
+        cohort.add_order(6, 601, 1, '2017-05-16 23:08:01')
+        cohort.add_order(7, 601, 1, '2017-05-16 23:08:01')
+        self.assertEqual(cohort.dropped_orders, {'duplicate': 1, 'orphan': 0})
+
+        cohort = CohortAnalysis()
+        self.add_sample_data(cohort)
+        self.assertEqual(cohort.dropped_orders, {'duplicate': 0, 'orphan': 0})
+
+    def test_analyze_columnar(self):
+        for tz in (self.TZ_UTC, self.TZ_EST, self.TZ_PST):
+            for days_per_bucket in (1, 3, 7):
+                expected = CohortAnalysis(days_per_bucket, timezone=tz)
+                self.add_sample_data(expected)
+                expected.analyze()
+
+                cohort = CohortAnalysis(days_per_bucket, timezone=tz, columnar=True)
+                self.add_sample_data(cohort)
+                cohort.analyze()
+
+                self.assertEqual(cohort._store.num_customers, 5)
+                self.assertEqual(cohort._store.num_orders, 8)
+                self.assertEqual(len(cohort._customer_join_date), 0)
+                self.assertEqual(len(cohort._cust_orders), 0)
+
+                self.assertEqual(
+                    [(grp.label, grp.num_customers, grp.num_orders) for grp in cohort._cohort_groups],
+                    [(grp.label, grp.num_customers, grp.num_orders) for grp in expected._cohort_groups],
+                )
+                self.assertEqual(self.get_bucket_sizes(cohort), self.get_bucket_sizes(expected))
+
+    def test_sweep(self):
+        configurations = [(tz, days) for tz in (self.TZ_UTC, self.TZ_EST, self.TZ_PST) for days in (1, 3, 7)]
+
+        for kwargs in (dict(columnar=True), dict(processes=2)):
+            cohort = CohortAnalysis(timezone=self.TZ_UTC, **kwargs)
+            self.add_sample_data(cohort)
+
+            count = 0
+            for timezone, days_per_bucket in cohort.sweep(configurations):
+                expected = CohortAnalysis(days_per_bucket, timezone=timezone)
+                self.add_sample_data(expected)
+                expected.analyze()
+
+                self.assertEqual(
+                    [cohort._get_group_counts(i, grp) for i, grp in enumerate(cohort._cohort_groups)],
+                    [expected._get_group_counts(i, grp) for i, grp in enumerate(expected._cohort_groups)],
+                )
+                self.assertEqual(
+                    [grp.label for grp in cohort._cohort_groups],
+                    [grp.label for grp in expected._cohort_groups],
+                )
+                count += 1
+
+            self.assertEqual(count, len(configurations))
+
+    def test_reconfigure_bad_input(self):
+        try:
+            CohortAnalysis(timezone=self.TZ_UTC).reconfigure(self.TZ_EST)
+            self.fail()
+        except ValueError:
+            # successful
+            pass
+
+        try:
+            CohortAnalysis(timezone=self.TZ_UTC, columnar=True).reconfigure(days_per_bucket=0)
+            self.fail()
+        except ValueError:
+            # successful
+            pass
+
+    def test_instrumentation(self):
+        cohort = CohortAnalysis(1, timezone=self.TZ_UTC)
+        self.add_sample_data(cohort)
+        cohort.analyze()
+
+        metrics = cohort.instrumentation.metrics()
+        self.assertEqual(metrics.keys(), ['add customers', 'add orders', 'analyze'])
+        self.assertEqual(metrics['analyze']['rows'], cohort.num_customers)
+        self.assertEqual(metrics['add customers']['calls'], 5)
+        self.assertEqual(metrics['add orders']['rows'], 8)
+
+    def test_find_group(self):
+        for tz in (self.TZ_UTC, self.TZ_EST, self.TZ_PST):
+            for days_per_bucket in (1, 3):
+                cohort = CohortAnalysis(days_per_bucket, timezone=tz)
+
+                # two years of customers, every 7 hours (crossing the DST changes)
+                join_dates = []
+                for i in range(0, 2 * 365 * 24, 7):
+                    join_date = self.create_datetime(1, 1, 2016, 0, 13, 0).add(hours=i)
+                    join_dates.append(join_date.format('YYYY-MM-DD HH:mm:ss', formatter='alternative'))
+                    cohort.add_customer(i + 1, join_dates[-1])
+
+                cohort.analyze()
+
+                end_day = cohort._max_customer_join_date.local_day
+                for user_id, join_date in cohort._customer_join_date.iteritems():
+                    grp = cohort._find_group(cohort._cohort_groups, end_day, join_date)
+                    self.assertTrue(grp.is_date_in_group(join_date))
+                    self.assertTrue(user_id in grp._customers)
+
+                self.assertEqual(
+                    sum(grp.num_customers for grp in cohort._cohort_groups),
+                    len(join_dates)
+                )
+
+    def test_analyze_incremental(self):
+        random.seed(7)
+
+        def random_date(first_day, num_days):
+            timestamp = self.create_datetime(5, 1, 2017, 0, 0, 0).add(
+                days=first_day + random.randint(0, num_days - 1),
+                seconds=random.randint(0, 86399)
+            )
+            return timestamp.format('YYYY-MM-DD HH:mm:ss', formatter='alternative')
+
+        for columnar in (False, True):
+            for tz in (self.TZ_UTC, self.TZ_PST):
+                cohort = CohortAnalysis(3, timezone=tz, columnar=columnar)
+                expected = CohortAnalysis(3, timezone=tz, columnar=columnar)
+
+                customers = []
+                orders = []
+                next_user_id = 1
+                next_order_id = 1
+
+                # day ranges of the customers of each batch; the newest join day moves by
+                # 0, 6 (a multiple of the bucket size) and 1 day (full recompute)
+                for first_day, num_days in ((10, 20), (12, 18), (5, 31), (20, 16), (0, 37)):
+                    new_customers = []
+                    for i in range(20):
+                        new_customers.append((next_user_id, random_date(first_day, num_days)))
+                        next_user_id += 1
+
+                    # some orders for existing customers, new customers and unknown users
+                    new_orders = []
+                    for i in range(60):
+                        new_orders.append((
+                            random.randint(1, next_user_id + 3),
+                            next_order_id,
+                            1,
+                            random_date(0, 40)
+                        ))
+                        next_order_id += 1
+
+                    customers.extend(new_customers)
+                    orders.extend(new_orders)
+
+                    cohort.add_customers(new_customers)
+                    cohort.add_orders(new_orders)
+                    cohort.analyze(incremental=True)
+
+                    expected = CohortAnalysis(3, timezone=tz, columnar=columnar)
+                    expected.add_customers(customers)
+                    expected.add_orders(orders)
+                    expected.analyze()
+
+                    self.assertEqual(
+                        [(grp.label, grp.group_number, grp.num_customers, grp.num_orders) for grp in cohort._cohort_groups],
+                        [(grp.label, grp.group_number, grp.num_customers, grp.num_orders) for grp in expected._cohort_groups],
+                    )
+                    self.assertEqual(self.get_bucket_sizes(cohort), self.get_bucket_sizes(expected))
+
+    def test_analyze_incremental_updates_affected_groups(self):
+        cohort = CohortAnalysis(2, timezone=self.TZ_UTC)
+        cohort.add_customer(1, '2017-05-01 00:01:00')
+        cohort.add_customer(2, '2017-05-03 00:01:00')
+        cohort.add_customer(3, '2017-05-05 00:01:00')
+        cohort.add_order(1, 101, 1, '2017-05-02 00:08:01')
+        cohort.analyze()
+
+        groups = list(cohort._cohort_groups)
+        self.assertEqual([grp.num_orders for grp in groups], [0, 0, 1])
+
+        # a new order for customer 2 and a new customer in the newest group
+        cohort.add_order(2, 201, 1, '2017-05-04 00:08:01')
+        cohort.add_customer(4, '2017-05-04 00:01:00')
+        self.assertEqual(cohort._dirty_users, set([2, 4]))
+
+        cohort.analyze(incremental=True)
+        self.assertEqual([grp.num_customers for grp in cohort._cohort_groups], [2, 1, 1])
+        self.assertEqual([grp.num_orders for grp in cohort._cohort_groups], [0, 1, 1])
+
+        # the same group objects were reused
+        self.assertTrue(all(i is j for i, j in zip(cohort._cohort_groups, groups)))
+        self.assertEqual(cohort._dirty_users, set())
+
+        # a customer joining two days later adds a new group
+        cohort.add_customer(5, '2017-05-07 00:01:00')
+        cohort.analyze(incremental=True)
+        self.assertEqual(len(cohort._cohort_groups), 4)
+        self.assertTrue(all(i is j for i, j in zip(cohort._cohort_groups[1:], groups)))
+        self.assertEqual([grp.group_number for grp in cohort._cohort_groups], [1, 2, 3, 4])
+
+    def test_analyze_incremental_shared_order_id(self):
+        # customers of the same group with the same order id keep the same copy of
+        # the order in an incremental and a full analysis
+        for columnar in (False, True):
+            for join_dates in (('2017-05-01 00:01:00', '2017-05-01 00:01:00'), ('2017-05-01 00:01:00', '2017-05-02 00:01:00')):
+                cohort = CohortAnalysis(7, timezone=self.TZ_UTC, columnar=columnar)
+                expected = CohortAnalysis(7, timezone=self.TZ_UTC, columnar=columnar)
+                for analysis in (cohort, expected):
+                    analysis.add_customer(1, join_dates[0])
+                    analysis.add_customer(8, join_dates[1])
+                    analysis.add_customer(3, '2017-05-20 00:01:00')
+
+                cohort.analyze()
+                for analysis in (cohort, expected):
+                    analysis.add_order(1, 500, 1, '2017-05-01 10:00:00')
+                    analysis.add_order(8, 500, 1, '2017-05-10 10:00:00')
+
+                cohort.analyze(incremental=True)
+                expected.analyze()
+
+                self.assertEqual(self.get_bucket_sizes(cohort), self.get_bucket_sizes(expected))
+                self.assertEqual(
+                    [cohort._get_group_counts(i, grp) for i, grp in enumerate(cohort._cohort_groups)],
+                    [expected._get_group_counts(i, grp) for i, grp in enumerate(expected._cohort_groups)]
+                )
+
+    def get_random_data(self):
+        random.seed(11)
+
+        customers = []
+        for user_id in range(1, 301):
+            customers.append((user_id, '2017-0{}-{:02d} {:02d}:13:00'.format(
+                random.randint(3, 5), random.randint(1, 28), random.randint(0, 23))))
+
+        orders = []
+        for order_id in range(1, 1001):
+            orders.append((random.randint(1, 320), order_id, 1, '2017-0{}-{:02d} {:02d}:13:00'.format(
+                random.randint(3, 6), random.randint(1, 28), random.randint(0, 23))))
+
+        return customers, orders
+
+    def test_analyze_parallel(self):
+        customers, orders = self.get_random_data()
+
+        for engine in ('python', 'numpy'):
+            expected = CohortAnalysis(7, timezone=self.TZ_EST, engine=engine)
+            expected.add_customers(customers)
+            expected.add_orders(orders)
+            expected.analyze()
+
+            cohort = CohortAnalysis(7, timezone=self.TZ_EST, engine=engine, processes=3)
+            cohort.add_customers(customers)
+            cohort.add_orders(orders)
+            cohort.analyze()
+
+            self.assertEqual(len(cohort._store.shards), 3)
+            self.assertTrue(all(i.num_customers > 0 for i in cohort._store.shards))
+            self.assertEqual(
+                [grp.label for grp in cohort._cohort_groups],
+                [grp.label for grp in expected._cohort_groups]
+            )
+            self.assertEqual(
+                [cohort._get_group_counts(i, grp) for i, grp in enumerate(cohort._cohort_groups)],
+                [expected._get_group_counts(i, grp) for i, grp in enumerate(expected._cohort_groups)]
+            )
+
+    def test_analyze_spilled(self):
+        customers, orders = self.get_random_data()
+
+        expected = CohortAnalysis(3, timezone=self.TZ_PST)
+        expected.add_customers(customers)
+        expected.add_orders(orders)
+        expected.analyze()
+
+        for processes in (1, 2):
+            cohort = CohortAnalysis(3, timezone=self.TZ_PST, processes=processes, memory_budget=8192)
+            cohort.add_customers(customers)
+            cohort.add_orders(orders)
+            cohort.analyze()
+
+            self.assertTrue(cohort._store.num_partitions > 2)
+            self.assertEqual(
+                [grp.label for grp in cohort._cohort_groups],
+                [grp.label for grp in expected._cohort_groups]
+            )
+            self.assertEqual(
+                [cohort._get_group_counts(i, grp) for i, grp in enumerate(cohort._cohort_groups)],
+                [expected._get_group_counts(i, grp) for i, grp in enumerate(expected._cohort_groups)]
+            )
+
+        try:
+            CohortAnalysis(7, memory_budget=-1)
+            self.fail()
+        except ValueError:
+            # successful
+            pass
+
+    def test_analyze_sketches(self):
+        customers, orders = self.get_random_data()
+
+        expected = CohortAnalysis(7, timezone=self.TZ_EST)
+        expected.add_customers(customers)
+        expected.add_orders(orders)
+        expected.analyze()
+        self.assertIsNone(expected.relative_error)
+
+        results = []
+        for kwargs in (dict(), dict(columnar=True), dict(engine='numpy'), dict(processes=3), dict(memory_budget=8192)):
+            cohort = CohortAnalysis(7, timezone=self.TZ_EST, sketch_precision=10, **kwargs)
+            cohort.add_customers(customers)
+            cohort.add_orders(orders)
+            cohort.analyze()
+            self.assertAlmostEqual(cohort.relative_error, 1.04 / 32)
+
+            counts = [cohort._get_group_counts(i, grp) for i, grp in enumerate(cohort._cohort_groups)]
+            for (num_customers, buckets), (expected_customers, expected_buckets) in zip(
+                    counts, [expected._get_group_counts(i, grp) for i, grp in enumerate(expected._cohort_groups)]):
+                self.assertEqual(num_customers, expected_customers)
+                for estimates, exact in zip(buckets, expected_buckets):
+                    for estimate, count in zip(estimates, exact):
+                        self.assertTrue(abs(estimate - count) <= max(1, 3 * cohort.relative_error * count))
+
+            # the sketches of the partitions merge into the sketches of the whole
+            results.append(counts)
+            self.assertEqual(results[-1], results[0])
+
+        sketches = cohort.get_sketches()
+        self.assertEqual(len(sketches), len(cohort._cohort_groups))
+
+        # the empty buckets have no sketches
+        buckets = [bucket for num_customers, group_sketches in sketches for bucket in group_sketches]
+        self.assertIn((None, None), buckets)
+        self.assertEqual(set(i.precision for bucket in buckets for i in bucket if i is not None), set([10]))
+
+        try:
+            expected.get_sketches()
+            self.fail()
+        except ValueError:
+            # successful
+            pass
+
+        for precision in (0, 3, 17):
+            try:
+                CohortAnalysis(7, sketch_precision=precision)
+                self.fail()
+            except ValueError:
+                # successful
+                pass
+
+    def test_invalid_processes(self):
+        for processes in (0, -1, None):
+            try:
+                CohortAnalysis(7, processes=processes)
+                self.fail()
+            except ValueError:
+                # successful
+                pass
+
+    def test_iter_rows(self):
+        cohort = CohortAnalysis(3, timezone=self.TZ_UTC)
+        self.add_sample_data(cohort)
+        cohort.analyze()
+
+        rows = list(cohort.iter_rows())
+        self.assertEqual(len(rows), len(cohort._cohort_groups))
+        for i, (row, grp) in enumerate(zip(rows, cohort._cohort_groups)):
+            num_customers, bucket_counts = cohort._get_group_counts(i, grp)
+            self.assertEqual(row['cohort'], grp.label)
+            self.assertEqual(row['start'], grp.start_date.isoformat())
+            self.assertEqual(row['customers'], num_customers)
+            self.assertEqual([(j['orderers'], j['first']) for j in row['buckets']], list(bucket_counts))
+            self.assertEqual([(j['start_day'], j['end_day']) for j in row['buckets']], [(j * 3, (j * 3) + 2) for j in range(i + 1)])
+
+            for bucket in row['buckets']:
+                self.assertAlmostEqual(bucket['orderers_pct'], bucket['orderers'] * 100.0 / max(num_customers, 1))
+                self.assertAlmostEqual(bucket['first_pct'], bucket['first'] * 100.0 / max(num_customers, 1))
+
+        self.assertEqual(list(cohort.iter_rows(1)), rows[:1])
+
+        output = StringIO()
+        writer = get_writer('ndjson', output)
+        self.assertEqual(cohort.write_output(writer, 2), 2)
+        self.assertEqual(len(output.getvalue().splitlines()), 2)
+        self.assertEqual(cohort.instrumentation.get_span('render').rows, 2)
 
     def test_analyze_cohorts(self):
         tz = self.TZ_UTC
@@ -573,3 +1277,128 @@ class CohortAnalysisTest(CohortTestCase):
         self.assertEqual(len(cohort._cohort_groups[3].get_buckets()[2]['first']), 2)
         self.assertEqual(len(cohort._cohort_groups[3].get_buckets()[3]['customers']), 2)
         self.assertEqual(len(cohort._cohort_groups[3].get_buckets()[3]['first']), 1)
+
+
+class CohortFileTest(CohortTestCase):
+
+    def setUp(self):
+        super(CohortFileTest, self).setUp()
+
+        handle, self.file_path = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(handle, 'wb') as csvfile:
+            csvfile.write('id,order_number,user_id,created\n')
+            csvfile.write('1709,36,344,2014-10-28 00:20:01\n')
+            csvfile.write('1406,7,608,"2014-10-14 23:44:53"\n')
+
+    def tearDown(self):
+        os.remove(self.file_path)
+
+        super(CohortFileTest, self).tearDown()
+
+    def test_get_objects_from_file(self):
+        self.assertEqual(
+            get_objects_from_file(self.file_path),
+            [
+                {'id': '1709', 'order_number': '36', 'user_id': '344', 'created': '2014-10-28 00:20:01'},
+                {'id': '1406', 'order_number': '7', 'user_id': '608', 'created': '2014-10-14 23:44:53'},
+            ]
+        )
+
+    def test_get_objects_instrumentation(self):
+        instrumentation = Instrumentation()
+        self.assertEqual(len(get_objects_from_file(self.file_path, instrumentation)), 2)
+        self.assertEqual(instrumentation.get_span('load').rows, 2)
+
+        self.assertEqual(len(load_columns_from_file(self.file_path, ('id',), instrumentation=instrumentation)[0]), 2)
+        self.assertEqual(instrumentation.get_span('load').rows, 4)
+        self.assertEqual(instrumentation.get_span('load').calls, 2)
+
+    def test_iter_columns_from_file(self):
+        rows = iter_columns_from_file(self.file_path, ('user_id', 'created'))
+        self.assertEqual(next(rows), ('344', '2014-10-28 00:20:01'))
+        self.assertEqual(next(rows), ('608', '2014-10-14 23:44:53'))
+        self.assertEqual(list(rows), [])
+
+        self.assertEqual(
+            list(iter_columns_from_file(self.file_path, ('id',))),
+            [('1709',), ('1406',)]
+        )
+
+    def test_iter_columns_missing_column(self):
+        try:
+            list(iter_columns_from_file(self.file_path, ('id', 'missing')))
+            self.fail()
+        except ValueError:
+            # successful
+            pass
+
+    def test_load_columns_from_file(self):
+        expected = [array('l', [344, 608]), array('l', [1414455601, 1413330293])]
+        cache_path = self.file_path + '.cache'
+
+        self.assertEqual(load_columns_from_file(self.file_path, ('user_id', 'created')), expected)
+        self.assertFalse(os.path.exists(cache_path))
+
+        try:
+            self.assertEqual(load_columns_from_file(self.file_path, ('user_id', 'created'), use_cache=True), expected)
+            self.assertTrue(os.path.exists(cache_path))
+
+            # loaded from the sidecar
+            with open(cache_path, 'rb+') as cachefile:
+                cachefile.seek(-8, os.SEEK_END)
+                cachefile.write(array('l', [0]).tostring())
+            self.assertEqual(
+                load_columns_from_file(self.file_path, ('user_id', 'created'), use_cache=True),
+                [expected[0], array('l', [1414455601, 0])]
+            )
+        finally:
+            os.remove(cache_path)
+
+    def test_load_columns_missing_value(self):
+        with open(self.file_path, 'ab') as csvfile:
+            csvfile.write('1407,8,,2014-10-14 23:44:53\n')
+
+        try:
+            load_columns_from_file(self.file_path, ('user_id', 'created'))
+            self.fail()
+        except ValueError:
+            # successful
+            pass
+
+    def test_load_columns_parallel(self):
+        with open(self.file_path, 'ab') as csvfile:
+            for i in range(100):
+                csvfile.write('{},{},{},2015-07-03 22:{:02d}:23\n'.format(2000 + i, i + 1, 700 + i, i % 60))
+
+        expected = load_columns_from_file(self.file_path, ('user_id', 'id', 'created'))
+        self.assertEqual(len(expected[0]), 102)
+
+        self.assertEqual(load_columns_from_file(self.file_path, ('user_id', 'id', 'created'), processes=2), expected)
+        for chunk_size in (1, 100, 1000):
+            self.assertEqual(_parse_columns_parallel(self.file_path, ('user_id', 'id', 'created'), 2, chunk_size), expected)
+
+        self.assertEqual(_parse_columns_parallel(self.file_path, ('created',), 3, 50), [expected[2]])
+
+        try:
+            _parse_columns_parallel(self.file_path, ('id', 'missing'), 2, 100)
+            self.fail()
+        except ValueError:
+            # successful
+            pass
+
+    def test_load_columns_compressed(self):
+        gzip_path = self.file_path + '.gz'
+        with open(self.file_path, 'rb') as csvfile, closing(gzip.open(gzip_path, 'wb')) as gzipfile:
+            gzipfile.write(csvfile.read())
+
+        try:
+            self.assertEqual(
+                list(iter_columns_from_file(gzip_path, ('user_id', 'created'))),
+                list(iter_columns_from_file(self.file_path, ('user_id', 'created')))
+            )
+            self.assertEqual(get_objects_from_file(gzip_path), get_objects_from_file(self.file_path))
+
+            expected = load_columns_from_file(self.file_path, ('user_id', 'id', 'created'))
+            self.assertEqual(load_columns_from_file(gzip_path, ('user_id', 'id', 'created'), processes=2), expected)
+        finally:
+            os.remove(gzip_path)
@@ -0,0 +1,128 @@
+import bz2
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+from contextlib import closing
+from StringIO import StringIO
+
+from cohort_base_test import CohortTestCase
+
+from cohorts import compression
+from cohorts.compression import ThreadedReader
+from cohorts.compression import is_compressed
+from cohorts.compression import open_data_file
+
+
+class BrokenFile(object):
+
+    def __init__(self):
+        self.closed = False
+
+    def read(self, size):
+        raise IOError('broken')
+
+    def close(self):
+        self.closed = True
+
+
+class CompressionTest(CohortTestCase):
+
+    CONTENT = 'id,created\n1,2017-05-01 00:00:00\n2,2017-05-02 00:00:00\n3,2017-05-03 00:00:00'
+
+    def setUp(self):
+        super(CompressionTest, self).setUp()
+
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+        super(CompressionTest, self).tearDown()
+
+    def test_is_compressed(self):
+        self.assertTrue(is_compressed('orders.csv.gz'))
+        self.assertTrue(is_compressed('orders.csv.BZ2'))
+        self.assertTrue(is_compressed('orders.csv.xz'))
+        self.assertFalse(is_compressed('orders.csv'))
+        self.assertFalse(is_compressed('orders.gz.csv'))
+
+    def test_open_plain(self):
+        file_path = os.path.join(self.directory, 'orders.csv')
+        with open(file_path, 'wb') as datafile:
+            datafile.write(self.CONTENT)
+
+        with open_data_file(file_path) as datafile:
+            self.assertEqual(''.join(datafile), self.CONTENT)
+
+    def test_open_gzip(self):
+        file_path = os.path.join(self.directory, 'orders.csv.gz')
+        with closing(gzip.open(file_path, 'wb')) as datafile:
+            datafile.write(self.CONTENT)
+
+        with open_data_file(file_path) as datafile:
+            self.assertIsInstance(datafile, ThreadedReader)
+            self.assertEqual(list(datafile), self.CONTENT.splitlines(True))
+
+    def test_open_bz2(self):
+        file_path = os.path.join(self.directory, 'orders.csv.bz2')
+        with closing(bz2.BZ2File(file_path, 'wb')) as datafile:
+            datafile.write(self.CONTENT)
+
+        with open_data_file(file_path) as datafile:
+            self.assertEqual(list(datafile), self.CONTENT.splitlines(True))
+
+    @unittest.skipIf(compression.lzma is None, 'backports.lzma is not installed')
+    def test_open_xz(self):
+        file_path = os.path.join(self.directory, 'orders.csv.xz')
+        with closing(compression.lzma.open(file_path, 'wb')) as datafile:
+            datafile.write(self.CONTENT)
+
+        with open_data_file(file_path) as datafile:
+            self.assertIsInstance(datafile, ThreadedReader)
+            self.assertEqual(list(datafile), self.CONTENT.splitlines(True))
+
+    def test_open_xz_without_lzma(self):
+        lzma = compression.lzma
+        compression.lzma = None
+        try:
+            open_data_file(os.path.join(self.directory, 'orders.csv.xz'))
+            self.fail()
+        except ValueError:
+            # successful
+            pass
+        finally:
+            compression.lzma = lzma
+
+    def test_lines_across_chunks(self):
+        for read_size in (1, 2, 7, 100):
+            with ThreadedReader(StringIO(self.CONTENT), read_size=read_size, queue_size=2) as reader:
+                self.assertEqual(list(reader), self.CONTENT.splitlines(True))
+
+        with ThreadedReader(StringIO('')) as reader:
+            self.assertEqual(list(reader), [])
+
+    def test_close_early(self):
+        source = StringIO(self.CONTENT * 100)
+        reader = ThreadedReader(source, read_size=1, queue_size=1)
+        self.assertEqual(next(iter(reader)), 'id,created\n')
+
+        reader.close()
+        self.assertTrue(source.closed)
+
+    def test_read_error(self):
+        source = BrokenFile()
+        with ThreadedReader(source) as reader:
+            try:
+                list(reader)
+                self.fail()
+            except IOError:
+                # successful
+                pass
+
+            # the error is only raised once
+            self.assertEqual(list(reader), [])
+
+        self.assertTrue(source.closed)
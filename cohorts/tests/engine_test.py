@@ -0,0 +1,86 @@
+import unittest
+
+from cohort_base_test import CohortTestCase
+
+from cohorts.cohort import CohortAnalysis
+from cohorts.engine import numpy
+
+
+@unittest.skipIf(numpy is None, 'numpy is not installed')
+class NumpyEngineTest(CohortTestCase):
+
+    def add_sample_data(self, cohort):
+        cohort.add_customer(1, '2017-05-01 00:01:00')
+        cohort.add_customer(2, '2017-05-01 23:02:00')
+        cohort.add_customer(3, '2017-05-09 04:03:00')
+        cohort.add_customer(4, '2017-05-09 04:03:00')
+        cohort.add_customer(5, '2017-05-16 18:05:00')
+
+        cohort.add_order(1, 101, 1, '2017-05-02 03:08:01')
+        cohort.add_order(1, 102, 2, '2017-05-01 01:08:01')
+        cohort.add_order(1, 103, 3, '2017-05-13 03:08:01')
+        cohort.add_order(2, 201, 1, '2017-05-19 00:08:01')
+        cohort.add_order(2, 202, 1, '2017-04-29 00:08:01')
+        cohort.add_order(3, 301, 1, '2017-05-09 03:08:01')
+        cohort.add_order(3, 302, 2, '2017-05-10 03:08:01')
+        cohort.add_order(4, 301, 1, '2017-05-08 03:08:01')
+        cohort.add_order(4, 401, 2, '2017-05-16 23:08:01')
+        cohort.add_order(6, 601, 1, '2017-05-16 23:08:01')
+
+    def get_group_counts(self, cohort):
+        return [
+            cohort._get_group_counts(i, grp)
+            for i, grp in enumerate(cohort._cohort_groups)
+        ]
+
+    def test_invalid_engine(self):
+        try:
+            CohortAnalysis(1, engine='fortran')
+            self.fail()
+        except ValueError:
+            # successful
+            pass
+
+    def test_analyze_same_as_python(self):
+        for tz in (self.TZ_UTC, self.TZ_EST, self.TZ_PST):
+            for days_per_bucket in (1, 2, 7):
+                expected = CohortAnalysis(days_per_bucket, timezone=tz, columnar=True)
+                self.add_sample_data(expected)
+                expected.analyze()
+
+                cohort = CohortAnalysis(days_per_bucket, timezone=tz, engine='numpy')
+                self.add_sample_data(cohort)
+                cohort.analyze()
+
+                self.assertTrue(cohort._matrix is not None)
+                self.assertEqual(cohort._matrix.num_groups, len(expected._cohort_groups))
+                self.assertEqual(self.get_group_counts(cohort), self.get_group_counts(expected))
+
+                # the groups are populated as well
+                for grp, expected_grp in zip(cohort._cohort_groups, expected._cohort_groups):
+                    self.assertEqual(grp.label, expected_grp.label)
+                    self.assertEqual(grp.num_customers, expected_grp.num_customers)
+                    self.assertEqual(grp.num_orders, expected_grp.num_orders)
+                    self.assertEqual(grp.get_buckets(), expected_grp.get_buckets())
+
+    def test_analyze_cohorts(self):
+        cohort = CohortAnalysis(2, timezone=self.TZ_UTC, engine='numpy')
+
+        cohort.add_customer(1, '2017-05-01 00:01:00')
+        cohort.add_customer(2, '2017-05-01 00:02:00')
+        cohort.add_customer(3, '2017-05-02 00:03:00')
+        cohort.add_customer(5, '2017-05-03 00:05:00')
+        cohort.add_customer(10, '2017-05-08 00:10:00')
+
+        cohort.add_order(1, 101, 1, '2017-05-08 00:08:01')
+        cohort.add_order(2, 201, 1, '2017-05-05 00:08:01')
+        cohort.add_order(3, 301, 1, '2017-05-06 00:08:01')
+        cohort.add_order(3, 302, 2, '2017-05-08 00:08:01')
+        cohort.add_order(5, 501, 1, '2017-05-04 00:08:01')
+
+        cohort.analyze()
+
+        self.assertEqual(list(cohort._matrix.num_customers), [1, 0, 1, 3])
+        self.assertEqual(cohort._matrix.get_bucket_counts(0), [(0, 0)])
+        self.assertEqual(cohort._matrix.get_bucket_counts(2), [(1, 1), (0, 0), (0, 0)])
+        self.assertEqual(cohort._matrix.get_bucket_counts(3), [(0, 0), (0, 0), (2, 2), (2, 1)])
@@ -0,0 +1,95 @@
+import json
+
+from cohort_base_test import CohortTestCase
+
+from cohorts.instrument import Instrumentation
+from cohorts.instrument import get_memory
+
+
+class InstrumentationTest(CohortTestCase):
+
+    def test_spans(self):
+        instrumentation = Instrumentation()
+        self.assertIsNone(instrumentation.get_span('load'))
+
+        with instrumentation.span('load') as timer:
+            timer.rows = 10
+
+        with instrumentation.span('analyze'):
+            pass
+
+        with instrumentation.span('load') as timer:
+            timer.rows = 5
+
+        self.assertEqual([i.name for i in instrumentation.spans], ['load', 'analyze'])
+
+        span = instrumentation.get_span('load')
+        self.assertEqual(span.calls, 2)
+        self.assertEqual(span.rows, 15)
+        self.assertTrue(span.seconds >= 0)
+
+        analyze = instrumentation.get_span('analyze')
+        self.assertEqual(analyze.calls, 1)
+        self.assertIsNone(analyze.rows)
+        self.assertIsNone(analyze.rows_per_second)
+
+        span.seconds = 3.0
+        self.assertEqual(span.rows_per_second, 5.0)
+
+    def test_span_error(self):
+        instrumentation = Instrumentation()
+
+        try:
+            with instrumentation.span('load'):
+                raise ValueError('bad row')
+        except ValueError:
+            # successful
+            pass
+
+        self.assertEqual(instrumentation.get_span('load').calls, 1)
+
+    def test_metrics(self):
+        instrumentation = Instrumentation()
+        with instrumentation.span('add orders') as timer:
+            timer.rows = 2
+
+        metrics = instrumentation.metrics()
+        self.assertEqual(metrics.keys(), ['add orders'])
+        self.assertEqual(metrics['add orders']['calls'], 1)
+        self.assertEqual(metrics['add orders']['rows'], 2)
+        self.assertEqual(json.loads(instrumentation.to_json()), json.loads(json.dumps(metrics)))
+
+    def test_profile(self):
+        instrumentation = Instrumentation(profile='analyze')
+
+        with instrumentation.span('load'):
+            sorted(range(10))
+        self.assertIsNone(instrumentation.profile_stats())
+
+        with instrumentation.span('analyze'):
+            sorted(range(10))
+
+        stats = instrumentation.profile_stats()
+        self.assertIn('sorted', stats)
+
+    def test_track_memory(self):
+        instrumentation = Instrumentation(track_memory=True)
+
+        with instrumentation.span('load') as timer:
+            data = [str(i) for i in range(100000)]
+            timer.rows = len(data)
+
+        span = instrumentation.get_span('load')
+        self.assertTrue(span.memory > 0)
+        self.assertTrue(span.peak_memory >= span.memory)
+        self.assertTrue(get_memory() > 0)
+        self.assertEqual(span.bytes_per_row, float(span.memory) / len(data))
+        self.assertEqual(instrumentation.metrics()['load']['memory'], span.memory)
+
+        # not tracked by default
+        instrumentation = Instrumentation()
+        with instrumentation.span('load'):
+            pass
+
+        self.assertIsNone(instrumentation.get_span('load').memory)
+        self.assertNotIn('memory', instrumentation.metrics()['load'])
@@ -0,0 +1,97 @@
+import csv
+import json
+
+from collections import OrderedDict
+from StringIO import StringIO
+
+from cohort_base_test import CohortTestCase
+
+from cohorts.output import CSV_FIELDS
+from cohorts.output import CsvWriter
+from cohorts.output import JsonWriter
+from cohorts.output import NdjsonWriter
+from cohorts.output import get_writer
+
+
+def get_row(label, customers, *buckets):
+    return OrderedDict([
+        ('cohort', label),
+        ('start', '2017-05-01T00:00:00+00:00'),
+        ('end', '2017-05-07T23:59:59+00:00'),
+        ('customers', customers),
+        ('buckets', [
+            OrderedDict([
+                ('bucket', i),
+                ('start_day', i * 7),
+                ('end_day', (i * 7) + 6),
+                ('orderers', orderers),
+                ('orderers_pct', orderers * 100.0 / customers),
+                ('first', first),
+                ('first_pct', first * 100.0 / customers),
+            ])
+            for i, (orderers, first) in enumerate(buckets)
+        ]),
+    ])
+
+
+class OutputTest(CohortTestCase):
+
+    ROWS = [
+        get_row('5/8-5/14', 4, (1, 1)),
+        get_row('5/1-5/7', 8, (2, 2), (4, 1)),
+    ]
+
+    def test_get_writer(self):
+        self.assertIsInstance(get_writer('csv', StringIO()), CsvWriter)
+        self.assertIsInstance(get_writer('json', StringIO()), JsonWriter)
+        self.assertIsInstance(get_writer('ndjson', StringIO()), NdjsonWriter)
+
+        try:
+            get_writer('table')
+            self.fail()
+        except ValueError:
+            # successful
+            pass
+
+    def test_csv(self):
+        output = StringIO()
+        writer = CsvWriter(output)
+        self.assertEqual(writer.write_analysis(self.TZ_UTC, 7, iter(self.ROWS)), 2)
+        self.assertEqual(writer.write_analysis(self.TZ_EST, 7, iter(self.ROWS[:1])), 1)
+        writer.close()
+
+        lines = list(csv.reader(StringIO(output.getvalue())))
+        self.assertEqual(tuple(lines[0]), CSV_FIELDS)
+        self.assertEqual(len(lines), 1 + 3 + 1)
+        self.assertEqual(lines[1][:10], [self.TZ_UTC, '7', '5/8-5/14', self.ROWS[0]['start'], self.ROWS[0]['end'], '4', '0', '0', '6', '1'])
+        self.assertEqual(float(lines[3][10]), 50.0)
+        self.assertEqual(lines[3][11:], ['1', '12.5'])
+        self.assertEqual(lines[4][:3], [self.TZ_EST, '7', '5/8-5/14'])
+
+    def test_json(self):
+        output = StringIO()
+        writer = JsonWriter(output)
+        writer.write_analysis(self.TZ_UTC, 7, iter(self.ROWS))
+        writer.write_analysis(self.TZ_PST, 7, iter([]))
+        writer.close()
+
+        self.assertEqual(json.loads(output.getvalue()), [
+            {'timezone': self.TZ_UTC, 'days_per_bucket': 7, 'cohorts': json.loads(json.dumps(self.ROWS))},
+            {'timezone': self.TZ_PST, 'days_per_bucket': 7, 'cohorts': []},
+        ])
+
+        output = StringIO()
+        JsonWriter(output).close()
+        self.assertEqual(json.loads(output.getvalue()), [])
+
+    def test_ndjson(self):
+        output = StringIO()
+        writer = NdjsonWriter(output)
+        self.assertEqual(writer.write_analysis(self.TZ_UTC, 7, iter(self.ROWS)), 2)
+        writer.close()
+
+        rows = [json.loads(i) for i in output.getvalue().splitlines()]
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[1]['timezone'], self.TZ_UTC)
+        self.assertEqual(rows[1]['days_per_bucket'], 7)
+        self.assertEqual(rows[1]['buckets'], json.loads(json.dumps(self.ROWS[1]['buckets'])))
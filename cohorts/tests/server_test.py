@@ -0,0 +1,171 @@
+import json
+import threading
+import urllib2
+
+from cohort_base_test import CohortTestCase
+
+from cohorts.cohort import CohortAnalysis
+from cohorts.server import CohortServer
+from cohorts.server import CohortService
+
+
+def add_sample_data(cohort):
+    cohort.add_customer(1, '2017-05-01 00:01:00')
+    cohort.add_customer(2, '2017-05-01 23:02:00')
+    cohort.add_customer(3, '2017-05-09 04:03:00')
+    cohort.add_customer(4, '2017-05-12 06:04:00')
+
+    cohort.add_order(1, 101, 1, '2017-05-02 03:08:01')
+    cohort.add_order(1, 102, 2, '2017-05-13 03:08:01')
+    cohort.add_order(2, 201, 1, '2017-05-19 00:08:01')
+    cohort.add_order(3, 301, 1, '2017-05-09 03:08:01')
+    cohort.add_order(4, 401, 1, '2017-05-16 23:08:01')
+
+
+def get_expected_rows(timezone, days_per_bucket):
+    # the rows of a new analysis, as decoded from JSON
+    expected = CohortAnalysis(days_per_bucket, timezone=timezone)
+    add_sample_data(expected)
+    expected.analyze()
+
+    return json.loads(json.dumps(list(expected.iter_rows())))
+
+
+class CohortServiceTest(CohortTestCase):
+
+    def setUp(self):
+        super(CohortServiceTest, self).setUp()
+
+        self.cohorts = CohortAnalysis(columnar=True)
+        add_sample_data(self.cohorts)
+
+    def test_get_rows(self):
+        service = CohortService(self.cohorts, self.TZ_UTC, 7)
+        for timezone, days_per_bucket in ((None, None), (self.TZ_EST, 3), (self.TZ_PST, 1), (self.TZ_EST, 3)):
+            rows = service.get_rows(timezone, days_per_bucket)
+            self.assertEqual(
+                json.loads(json.dumps(rows)),
+                get_expected_rows(timezone or self.TZ_UTC, days_per_bucket or 7)
+            )
+
+        # the same configuration is only analyzed once
+        self.assertTrue(service.get_rows(self.TZ_PST, 1) is service.get_rows(self.TZ_PST, 1))
+        self.assertEqual((service.status['hits'], service.status['misses']), (3, 3))
+
+    def test_cache_size(self):
+        service = CohortService(self.cohorts, cache_size=2)
+        service.get_rows(self.TZ_UTC, 7)
+        service.get_rows(self.TZ_EST, 7)
+        service.get_rows(self.TZ_UTC, 7)
+        service.get_rows(self.TZ_PST, 7)
+
+        # the least recently used configuration is evicted
+        self.assertEqual(
+            [(i['timezone'], i['days_per_bucket']) for i in service.status['cached']],
+            [(self.TZ_UTC, 7), (self.TZ_PST, 7)]
+        )
+
+        try:
+            CohortService(self.cohorts, cache_size=0)
+            self.fail()
+        except ValueError:
+            # successful
+            pass
+
+    def test_render(self):
+        service = CohortService(self.cohorts)
+        content_type, body = service.render('json', self.TZ_EST, 3, limit=2)
+        self.assertEqual(content_type, 'application/json')
+
+        result = json.loads(body)
+        self.assertEqual(len(result), 1)
+        self.assertEqual((result[0]['timezone'], result[0]['days_per_bucket']), (self.TZ_EST, 3))
+        self.assertEqual(result[0]['cohorts'], get_expected_rows(self.TZ_EST, 3)[:2])
+
+        content_type, body = service.render('csv')
+        self.assertEqual(content_type, 'text/csv')
+        self.assertTrue(body.startswith('timezone,days_per_bucket,cohort,'))
+
+    def test_invalid_queries(self):
+        service = CohortService(self.cohorts)
+        for kwargs in (dict(output_format='xml'), dict(timezone='Not/A_Zone'), dict(days_per_bucket=-1),
+                       dict(days_per_bucket=0)):
+            try:
+                service.render(**kwargs)
+                self.fail()
+            except ValueError:
+                # successful
+                pass
+
+        self.assertEqual(service.status['cached'], [])
+
+
+class CohortServerTest(CohortTestCase):
+
+    def setUp(self):
+        super(CohortServerTest, self).setUp()
+
+        cohorts = CohortAnalysis(columnar=True)
+        add_sample_data(cohorts)
+
+        self.server = CohortServer(CohortService(cohorts), ('127.0.0.1', 0))
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+        super(CohortServerTest, self).tearDown()
+
+    def get(self, path):
+        url = 'http://{}:{}{}'.format(self.server.server_address[0], self.server.server_address[1], path)
+        try:
+            response = urllib2.urlopen(url, timeout=10)
+        except urllib2.HTTPError as e:
+            return e.code, json.loads(e.read())
+
+        return response.getcode(), json.loads(response.read())
+
+    def test_query(self):
+        code, result = self.get('/cohorts?timezone=America/New_York&days_per_bucket=3&limit=2')
+        self.assertEqual(code, 200)
+        self.assertEqual(result[0]['cohorts'], get_expected_rows(self.TZ_EST, 3)[:2])
+
+        code, result = self.get('/status')
+        self.assertEqual(code, 200)
+        self.assertEqual(result['customers'], 4)
+        self.assertEqual(result['cached'], [{'timezone': self.TZ_EST, 'days_per_bucket': 3}])
+
+    def test_concurrent_queries(self):
+        configurations = [(tz, days) for tz in (self.TZ_UTC, self.TZ_EST, self.TZ_PST) for days in (1, 3, 7)] * 3
+        results = dict()
+
+        def query(index, timezone, days_per_bucket):
+            results[index] = self.get('/cohorts?timezone={}&days_per_bucket={}'.format(timezone, days_per_bucket))
+
+        threads = [threading.Thread(target=query, args=(i,) + configuration) for i, configuration in enumerate(configurations)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for i, (timezone, days_per_bucket) in enumerate(configurations):
+            code, result = results[i]
+            self.assertEqual(code, 200)
+            self.assertEqual(result[0]['cohorts'], get_expected_rows(timezone, days_per_bucket))
+
+        status = self.server.service.status
+        self.assertEqual((status['hits'], status['misses']), (18, 9))
+
+    def test_errors(self):
+        for path in ('/cohorts?limit=x', '/cohorts?timezone=Not/A_Zone', '/cohorts?color=red', '/cohorts?format=xml',
+                     '/cohorts?days_per_bucket=0'):
+            code, result = self.get(path)
+            self.assertEqual(code, 400)
+            self.assertTrue(result['error'])
+
+        code, result = self.get('/unknown')
+        self.assertEqual(code, 404)
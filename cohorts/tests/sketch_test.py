@@ -0,0 +1,110 @@
+import pickle
+
+from cohort_base_test import CohortTestCase
+
+from cohorts.sketch import HyperLogLog
+from cohorts.sketch import get_relative_error
+
+
+class HyperLogLogTest(CohortTestCase):
+
+    def assert_estimate(self, sketch, count):
+        # within 4 standard errors
+        self.assertTrue(abs(sketch.count() - count) <= 4 * sketch.relative_error * count, (sketch.count(), count))
+
+    def test_bad_precision(self):
+        for precision in (None, 0, 3, 17):
+            try:
+                HyperLogLog(precision)
+                self.fail()
+            except ValueError:
+                # successful
+                pass
+
+    def test_count(self):
+        self.assertEqual(HyperLogLog().count(), 0)
+
+        for precision in (4, 10, 14):
+            for count in (1, 10, 100, 1000, 20000):
+                sketch = HyperLogLog(precision)
+                sketch.update(xrange(count))
+                self.assert_estimate(sketch, count)
+
+                # duplicates do not change the estimate
+                estimate = sketch.count()
+                sketch.update(xrange(count))
+                sketch.add(0)
+                self.assertEqual(sketch.count(), estimate)
+
+        sketch = HyperLogLog(12)
+        sketch.update(str(i) for i in xrange(5000))
+        self.assert_estimate(sketch, 5000)
+
+    def test_constant_size(self):
+        sketch = HyperLogLog(8)
+        sketch.update(xrange(100000))
+        self.assertEqual(len(sketch._registers), 256)
+
+    def test_merge(self):
+        first = HyperLogLog(10)
+        first.update(xrange(0, 6000))
+        second = HyperLogLog(10)
+        second.update(xrange(3000, 9000))
+        union = HyperLogLog(10)
+        union.update(xrange(0, 9000))
+
+        merged = first.copy()
+        merged.merge(second)
+        self.assertEqual(merged._registers, union._registers)
+        self.assert_estimate(merged, 9000)
+        self.assert_estimate(first, 6000)
+
+        try:
+            first.merge(HyperLogLog(11))
+            self.fail()
+        except ValueError:
+            # successful
+            pass
+
+        # the sketches travel between processes
+        self.assertEqual(pickle.loads(pickle.dumps(merged)).count(), merged.count())
+
+    def test_sparse(self):
+        sketch = HyperLogLog(12)
+        sketch.update(xrange(100))
+        self.assertTrue(sketch.is_sparse)
+        self.assertTrue(0 < sketch.nbytes <= 400)
+        self.assert_estimate(sketch, 100)
+
+        sketch.update(xrange(100, 1000))
+        self.assertFalse(sketch.is_sparse)
+        self.assertEqual(sketch.nbytes, 4096)
+        self.assert_estimate(sketch, 1000)
+
+        self.assertEqual(HyperLogLog(12).nbytes, 0)
+
+    def test_merge_sparse(self):
+        for first_count, second_count in ((0, 0), (0, 50), (50, 0), (50, 60), (50, 1000), (1000, 50), (100, 100)):
+            first = HyperLogLog(12)
+            first.update(xrange(0, first_count))
+            second = HyperLogLog(12)
+            second.update(xrange(first_count // 2, first_count // 2 + second_count))
+            union = HyperLogLog(12)
+            union.update(xrange(0, first_count))
+            union.update(xrange(first_count // 2, first_count // 2 + second_count))
+
+            estimate = first.count()
+            merged = first.copy()
+            merged.merge(second)
+            self.assertEqual(merged.is_sparse, union.is_sparse)
+            self.assertEqual(merged.count(), union.count())
+            self.assertEqual(first.count(), estimate)
+
+            # the sketches travel between processes, sparse or not
+            for sketch in (first, second, merged):
+                copy = pickle.loads(pickle.dumps(sketch))
+                self.assertEqual((copy.is_sparse, copy.count()), (sketch.is_sparse, sketch.count()))
+
+    def test_relative_error(self):
+        self.assertAlmostEqual(get_relative_error(12), 0.01625)
+        self.assertAlmostEqual(HyperLogLog(4).relative_error, 0.26)
@@ -0,0 +1,149 @@
+import os
+
+from cohort_base_test import CohortTestCase
+
+from cohorts.store import ColumnStore
+from cohorts.store import ShardedStore
+from cohorts.store import SpilledStore
+from cohorts.timeparse import Timestamp
+
+
+class ColumnStoreTest(CohortTestCase):
+
+    def test_add_customer(self):
+        store = ColumnStore()
+
+        self.assertEqual(store.add_customer(35, Timestamp(100, 0)), 0)
+        self.assertEqual(store.add_customer(12, Timestamp(200, -3600)), 1)
+        self.assertEqual(store.num_customers, 2)
+
+        # replace the join date of an existing customer
+        self.assertEqual(store.add_customer(35, Timestamp(300, 0)), 0)
+        self.assertEqual(store.num_customers, 2)
+        self.assertEqual(store.join_date(0), Timestamp(300, 0))
+        self.assertEqual(store.join_date(1), Timestamp(200, -3600))
+        self.assertEqual(store.index_of(12), 1)
+        self.assertEqual(store.index_of(99), None)
+
+    def test_add_order(self):
+        store = ColumnStore()
+        store.add_customer(35, Timestamp(100, 0))
+
+        self.assertEqual(store.add_order(35, 1, 1, Timestamp(86400, 0)), 0)
+        self.assertEqual(store.add_order(77, 2, 1, Timestamp(86400, -1)), 1)
+        self.assertEqual(store.num_orders, 2)
+
+        # orders from unknown users are remapped, but are not customers
+        self.assertEqual(store.num_users, 2)
+        self.assertEqual(store.num_customers, 1)
+        self.assertEqual(list(store.customer_indices()), [0])
+
+        self.assertEqual(store.order_date(1), Timestamp(86400, -1))
+        self.assertEqual(store.order_day(0), 1)
+        self.assertEqual(store.order_day(1), 0)
+
+    def test_orders_by_user(self):
+        store = ColumnStore()
+        store.add_order(5, 1, 1, Timestamp(1, 0))
+        store.add_order(6, 2, 1, Timestamp(2, 0))
+        store.add_order(5, 3, 2, Timestamp(3, 0))
+        store.add_customer(7, Timestamp(4, 0))
+        store.add_order(6, 4, 2, Timestamp(5, 0))
+
+        starts, rows = store.orders_by_user()
+        self.assertEqual(list(starts), [0, 2, 4, 4])
+        self.assertEqual(list(rows[starts[0]:starts[1]]), [0, 2])
+        self.assertEqual(list(rows[starts[1]:starts[2]]), [1, 3])
+        self.assertEqual(list(rows[starts[2]:starts[3]]), [])
+
+        # kept until more orders are added
+        self.assertIs(store.orders_by_user()[1], rows)
+        store.add_order(7, 5, 1, Timestamp(6, 0))
+        starts, rows = store.orders_by_user()
+        self.assertEqual(list(rows[starts[2]:starts[3]]), [4])
+
+    def test_localize(self):
+        store = ColumnStore()
+        store.add_customer(1, Timestamp(100, 0))
+        store.add_order(1, 1, 1, Timestamp(200, 0))
+        store.add_order(2, 2, 1, Timestamp(300, 0))
+
+        store.localize(lambda epoch: -epoch)
+        self.assertEqual(store.join_date(0), Timestamp(100, -100))
+        self.assertEqual(store.order_date(0), Timestamp(200, -200))
+        self.assertEqual(store.order_date(1), Timestamp(300, -300))
+
+
+class ShardedStoreTest(CohortTestCase):
+
+    def test_shards(self):
+        store = ShardedStore(2)
+
+        store.add_customer(1, Timestamp(100, 0))
+        store.add_customer(2, Timestamp(100, 0))
+        store.add_customer(4, Timestamp(100, 0))
+        store.add_order(2, 1, 1, Timestamp(200, 0))
+        store.add_order(3, 2, 1, Timestamp(200, 0))
+        store.add_order(4, 3, 1, Timestamp(200, 0))
+
+        self.assertEqual(store.num_customers, 3)
+        self.assertEqual(store.num_orders, 3)
+
+        # the customers and their orders are in the same shard
+        self.assertEqual(store.shards[0].num_customers, 2)
+        self.assertEqual(list(store.shards[0].user_id), [2, 4])
+        self.assertEqual(list(store.shards[0].order_id), [1, 3])
+        self.assertEqual(list(store.shards[1].user_id), [1, 3])
+        self.assertEqual(list(store.shards[1].order_id), [2])
+
+    def test_invalid_shards(self):
+        try:
+            ShardedStore(0)
+            self.fail()
+        except ValueError:
+            # successful
+            pass
+
+
+class SpilledStoreTest(CohortTestCase):
+
+    def test_partitions(self):
+        store = SpilledStore(1024, num_buckets=8)
+        self.assertTrue(os.path.isdir(store.directory))
+
+        for user_id in range(1, 101):
+            store.add_customer(user_id, Timestamp(user_id * 100, 0))
+            store.add_order(user_id, user_id + 1000, 1, Timestamp(user_id * 200, 0))
+            store.add_order(user_id, user_id + 2000, 2, Timestamp(user_id * 300, 0))
+
+        self.assertEqual(store.num_customers, 100)
+        self.assertEqual(store.num_orders, 200)
+        self.assertTrue(store.num_partitions > 1)
+
+        store.localize(lambda epoch: -3600)
+        user_ids = set()
+        for index in range(store.num_partitions):
+            partition = store.get_partition(index)
+            self.assertEqual(partition.num_orders, 2 * partition.num_customers)
+
+            for i in partition.customer_indices():
+                user_id = partition.user_id[i]
+                user_ids.add(user_id)
+                self.assertEqual(partition.join_date(i), Timestamp(user_id * 100, -3600))
+
+            # the customers and their orders are in the same partition
+            for row in range(partition.num_orders):
+                self.assertEqual(partition.order_id[row] % 1000, partition.user_id[partition.order_user[row]])
+
+        self.assertEqual(user_ids, set(range(1, 101)))
+
+        store.close()
+        self.assertFalse(os.path.exists(store.directory))
+
+    def test_invalid_memory_budget(self):
+        try:
+            SpilledStore(0)
+            self.fail()
+        except ValueError:
+            # successful
+            pass
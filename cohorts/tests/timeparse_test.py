@@ -0,0 +1,116 @@
+import pendulum
+
+from cohort_base_test import CohortTestCase
+
+from cohorts.timeparse import OffsetTable
+from cohorts.timeparse import Timestamp
+from cohorts.timeparse import TimestampParser
+from cohorts.timeparse import as_timestamp
+from cohorts.timeparse import get_offset_table
+from cohorts.timeparse import to_datetime
+
+
+class TimestampParserTest(CohortTestCase):
+
+    def assert_same_as_pendulum(self, parser, value):
+        expected = pendulum.parse(value, tz='UTC').in_timezone(parser.timezone)
+
+        result = parser.parse(value)
+        self.assertEqual(result.epoch, expected.int_timestamp)
+        self.assertEqual(result.offset, expected.offset)
+
+    def test_parse_utc(self):
+        parser = TimestampParser(self.TZ_UTC)
+
+        self.assertEqual(parser.parse('1970-01-01 00:00:00'), Timestamp(0, 0))
+        self.assertEqual(parser.parse('1970-01-02 01:01:01'), Timestamp(90061, 0))
+        self.assert_same_as_pendulum(parser, '2015-07-03 22:57:23')
+        self.assert_same_as_pendulum(parser, '2016-02-29 23:59:59')
+
+    def test_parse_memoized(self):
+        parser = TimestampParser(self.TZ_EST)
+
+        first = parser.parse('2015-07-03 22:57:23')
+        second = parser.parse('2015-07-03 22:00:00')
+        self.assertEqual(first.epoch - second.epoch, (57 * 60) + 23)
+        self.assertEqual(len(parser._hours), 1)
+        self.assertEqual(len(parser._minutes), 2)
+
+    def test_parse_dst_transitions(self):
+        for tz in (self.TZ_EST, self.TZ_PST):
+            parser = TimestampParser(tz)
+
+            # spring forward / fall back, in UTC
+            for day in ('2017-03-12', '2017-11-05'):
+                for hour in range(0, 24):
+                    self.assert_same_as_pendulum(parser, '{} {:02d}:00:00'.format(day, hour))
+                    self.assert_same_as_pendulum(parser, '{} {:02d}:59:59'.format(day, hour))
+
+    def test_parse_fallback(self):
+        parser = TimestampParser(self.TZ_PST)
+
+        self.assert_same_as_pendulum(parser, '2017-05-01T00:00:01')
+        self.assert_same_as_pendulum(parser, '2017-05-01')
+        self.assertEqual(len(parser._hours), 0)
+
+        for value in ('2017-02-30 00:00:00', '2017-02-03 24:00:00', '2017-02-03 00:61:00', 'garbage'):
+            try:
+                parser.parse(value)
+                self.fail()
+            except ValueError:
+                # successful
+                pass
+
+    def test_from_epoch(self):
+        for timezone in (self.TZ_UTC, self.TZ_EST, self.TZ_PST):
+            parser = TimestampParser(timezone)
+            for value in ('2015-07-03 22:57:23', '2017-03-12 06:59:59', '2017-03-12 07:00:00', '2017-11-05 05:30:00'):
+                self.assertEqual(parser.from_epoch(parser.parse(value).epoch), parser.parse(value))
+
+    def test_local_day(self):
+        parser = TimestampParser(self.TZ_EST)
+
+        # 2017-05-02 01:00 UTC is still 2017-05-01 in New York
+        timestamp = parser.parse('2017-05-02 01:00:00')
+        self.assertEqual(timestamp.local_day, parser.parse('2017-05-01 12:00:00').local_day)
+        self.assertEqual(timestamp.local_day + 1, parser.parse('2017-05-02 05:00:00').local_day)
+
+    def test_conversions(self):
+        dt = self.create_datetime(5, 1, 2017, 0, 0, 1, self.TZ_PST)
+        timestamp = as_timestamp(dt)
+
+        self.assertEqual(timestamp, Timestamp(dt.int_timestamp, dt.offset))
+        self.assertTrue(as_timestamp(timestamp) is timestamp)
+        self.assertEqual(to_datetime(timestamp, self.TZ_PST), dt)
+
+
+class OffsetTableTest(CohortTestCase):
+
+    def test_utc(self):
+        table = OffsetTable(self.TZ_UTC)
+        for epoch in (-10 ** 9, 0, 1500000000, 10 ** 10):
+            self.assertEqual(table.offset(epoch), 0)
+
+    def test_offsets(self):
+        for tz in (self.TZ_EST, self.TZ_PST, 'Australia/Lord_Howe', 'Asia/Kolkata'):
+            table = OffsetTable(tz)
+            for value in ('2017-03-12 06:59:59', '2017-03-12 07:00:00', '2017-03-12 10:00:00', '2017-11-05 05:59:59',
+                          '2017-11-05 06:00:00', '2017-11-05 09:00:00', '2017-07-01 00:00:00', '2019-01-01 00:00:00'):
+                expected = pendulum.parse(value, tz='UTC')
+                for epoch in (expected.int_timestamp - 1, expected.int_timestamp, expected.int_timestamp + 1):
+                    self.assertEqual(table.offset(epoch), pendulum.from_timestamp(epoch, tz).offset)
+
+    def test_to_epoch(self):
+        # like pendulum, skipped local times move forward and repeated ones are the later
+        for tz in (self.TZ_EST, self.TZ_PST, 'America/Sao_Paulo'):
+            table = OffsetTable(tz)
+            for day, hour, minute in ((12, 0, 0), (12, 2, 30), (12, 23, 59), (5, 1, 30), (5, 0, 0), (4, 23, 59)):
+                for month in (3, 11):
+                    expected = pendulum.create(2017, month, day, hour, minute, 0, tz=tz)
+                    local_seconds = pendulum.create(2017, month, day, hour, minute, 0, tz='UTC').int_timestamp
+                    self.assertEqual(table.to_epoch(local_seconds), expected.int_timestamp)
+
+    def test_shared(self):
+        self.assertTrue(get_offset_table(self.TZ_EST) is get_offset_table(self.TZ_EST))
+        self.assertTrue(TimestampParser(self.TZ_EST).offsets is get_offset_table(self.TZ_EST))
+        self.assertEqual(get_offset_table(None).timezone, self.TZ_UTC)
@@ -0,0 +1,314 @@
+from bisect import bisect_right
+from collections import namedtuple
+from datetime import date
+
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+SECONDS_PER_DAY = 86400
+SECONDS_PER_HOUR = 3600
+
+# the offset transitions are tabulated per period of 2^PERIOD_BITS seconds (about a year)
+PERIOD_BITS = 25
+
+# pendulum is slow to import, so it is only imported by the functions that need
+# it (i.e., the fallback parsing and the offset tables of timezones other than UTC)
+
+
+class Timestamp(namedtuple('Timestamp', ['epoch', 'offset'])):
+    """A point in time represented as integer UTC epoch seconds along with the
+    UTC offset (in seconds) of the timezone used for the analysis.
+
+    Timestamps sort by their UTC epoch, so they order the same way as the
+    equivalent pendulum datetimes.
+    """
+    __slots__ = ()
+
+    @property
+    def local_seconds(self):
+        return self.epoch + self.offset
+
+    @property
+    def local_day(self):
+        """The number of days since 1970-01-01 of the local calendar date."""
+        return (self.epoch + self.offset) // SECONDS_PER_DAY
+
+    @property
+    def local_date(self):
+        """The local calendar date."""
+        return date.fromordinal(EPOCH_ORDINAL + self.local_day)
+
+
+def as_timestamp(value):
+    """Converts a pendulum datetime (or an existing timestamp) into a timestamp.
+
+    :param value: a Timestamp or a timezone aware pendulum datetime.
+
+    :return: Timestamp
+    """
+    if isinstance(value, Timestamp):
+        return value
+
+    return Timestamp(value.int_timestamp, value.offset)
+
+
+def to_datetime(timestamp, timezone='UTC'):
+    """Converts a timestamp back into a pendulum datetime in the given timezone.
+
+    :param timestamp: the Timestamp to convert.
+    :param timezone: the timezone of the resulting datetime.
+
+    :return: pendulum datetime
+    """
+    import pendulum
+
+    return pendulum.from_timestamp(timestamp.epoch, timezone)
+
+
+# the offset tables of the timezones (see get_offset_table)
+_offset_tables = dict()
+
+
+def get_offset_table(timezone='UTC'):
+    """Gets the OffsetTable of a timezone, shared by all the parsers of the timezone.
+
+    :param timezone: the timezone of the offsets.
+
+    :return: OffsetTable
+    """
+    timezone = timezone or 'UTC'
+    try:
+        return _offset_tables[timezone]
+    except KeyError:
+        return _offset_tables.setdefault(timezone, OffsetTable(timezone))
+
+
+class OffsetTable(object):
+    def __init__(self, timezone='UTC'):
+        """Constructor.
+
+        The UTC offsets of a timezone as a sorted table of its transitions (the
+        UTC epoch seconds from which each offset applies), so the offset of a
+        point in time is a binary search instead of a pendulum datetime. The
+        table is filled a period (of 2^PERIOD_BITS seconds) at a time, when a
+        point in time of the period is first looked up, i.e., only over the
+        date range of the data: the offset is sampled once per day and each
+        change is narrowed down to the second by bisection.
+
+        :param timezone: the timezone of the offsets.
+        """
+        super(OffsetTable, self).__init__()
+
+        self._timezone = timezone or 'UTC'
+        self._periods = dict()
+
+    @property
+    def timezone(self):
+        return self._timezone
+
+    def offset(self, epoch):
+        """Gets the UTC offset of the timezone at a point in time.
+
+        :param epoch: the UTC epoch seconds (integer).
+
+        :return: the UTC offset in seconds
+        """
+        try:
+            epochs, offsets = self._periods[epoch >> PERIOD_BITS]
+        except KeyError:
+            epochs, offsets = self._load_period(epoch >> PERIOD_BITS)
+
+        return offsets[bisect_right(epochs, epoch) - 1]
+
+    def to_epoch(self, local_seconds):
+        """Gets the point in time of a local date/time, like pendulum: a local time
+        repeated when the clocks go back is the later one, and a local time
+        skipped when they go forward is moved forward by the change.
+
+        :param local_seconds: the local date/time as seconds since 1970-01-01 00:00:00.
+
+        :return: the UTC epoch seconds
+        """
+        before = self.offset(local_seconds - SECONDS_PER_DAY)
+        after = self.offset(local_seconds + SECONDS_PER_DAY)
+        if self.offset(local_seconds - after) == after:
+            return local_seconds - after
+
+        return local_seconds - before
+
+    def _load_period(self, period):
+        start = period << PERIOD_BITS
+        end = (period + 1) << PERIOD_BITS
+        previous = self._offset(start)
+        epochs = [start]
+        offsets = [previous]
+
+        if self._timezone != 'UTC':
+            sample = start
+            while sample < end - 1:
+                next_sample = min(sample + SECONDS_PER_DAY, end - 1)
+                offset = self._offset(next_sample)
+                if offset != previous:
+                    epochs.append(self._find_transition(sample, next_sample, previous))
+                    offsets.append(offset)
+                    previous = offset
+
+                sample = next_sample
+
+        self._periods[period] = result = (epochs, offsets)
+
+        return result
+
+    def _find_transition(self, low, high, offset):
+        # the first second after low (which has the offset) with another offset
+        while high - low > 1:
+            middle = (low + high) // 2
+            if self._offset(middle) == offset:
+                low = middle
+            else:
+                high = middle
+
+        return high
+
+    def _offset(self, epoch):
+        if self._timezone == 'UTC':
+            return 0
+
+        import pendulum
+
+        return pendulum.from_timestamp(epoch, self._timezone).offset
+
+
+class TimestampParser(object):
+    def __init__(self, timezone='UTC'):
+        """Constructor.
+
+        Parses UTC date/time strings in the "YYYY-MM-DD HH:mm:ss" format into
+        timestamps without going through pendulum. The epoch and the local offset
+        of each distinct "YYYY-MM-DD HH" prefix are memoized, as are the seconds of
+        each distinct ":mm:ss" suffix, so parsing a value is two dictionary lookups;
+        the local offsets come from the OffsetTable of the timezone. Any other
+        format falls back to pendulum.
+
+        :param timezone: the timezone used to resolve the local offsets.
+        """
+        super(TimestampParser, self).__init__()
+
+        self._timezone = timezone or 'UTC'
+        self._offsets = get_offset_table(self._timezone)
+        self._hours = dict()
+        self._minutes = dict()
+
+    @property
+    def timezone(self):
+        return self._timezone
+
+    @property
+    def offsets(self):
+        return self._offsets
+
+    def parse(self, value):
+        """Parses a date/time string.
+
+        :param value: a UTC date/time string (e.g., "2015-07-03 22:57:23")
+
+        :return: Timestamp
+        """
+        try:
+            hour_epoch, offset = self._hours[value[:13]]
+            seconds = self._minutes[value[13:]]
+        except KeyError:
+            return self._parse_slow(value)
+
+        if offset is None:
+            return self._from_epoch(hour_epoch + seconds)
+
+        return Timestamp(hour_epoch + seconds, offset)
+
+    def from_epoch(self, epoch):
+        """Gets the timestamp of already parsed UTC epoch seconds.
+
+        :param epoch: the UTC epoch seconds (integer).
+
+        :return: Timestamp
+        """
+        return Timestamp(epoch, self.offset(epoch))
+
+    def offset(self, epoch):
+        """Gets the UTC offset of the timezone at a point in time (see OffsetTable).
+
+        :param epoch: the UTC epoch seconds (integer).
+
+        :return: the UTC offset in seconds
+        """
+        return self._offsets.offset(epoch)
+
+    def _parse_slow(self, value):
+        prefix = value[:13]
+        suffix = value[13:]
+
+        hour = self._load_hour(prefix)
+        seconds = self._load_minutes(suffix)
+        if hour is None or seconds is None:
+            # not in the fixed format; let pendulum deal with it
+            import pendulum
+
+            return self._from_epoch(pendulum.parse(value, tz='UTC').int_timestamp)
+
+        self._hours[prefix] = hour
+        self._minutes[suffix] = seconds
+
+        hour_epoch, offset = hour
+        if offset is None:
+            return self._from_epoch(hour_epoch + seconds)
+
+        return Timestamp(hour_epoch + seconds, offset)
+
+    def _load_hour(self, prefix):
+        # "YYYY-MM-DD HH"
+        if len(prefix) != 13 or prefix[4] != '-' or prefix[7] != '-' or prefix[10] != ' ':
+            return None
+
+        parts = (prefix[0:4], prefix[5:7], prefix[8:10], prefix[11:13])
+        if not all(i.isdigit() for i in parts):
+            return None
+
+        year, month, day, hour = [int(i) for i in parts]
+        if hour > 23:
+            return None
+
+        try:
+            day_number = date(year, month, day).toordinal() - EPOCH_ORDINAL
+        except ValueError:
+            return None
+
+        hour_epoch = (day_number * SECONDS_PER_DAY) + (hour * SECONDS_PER_HOUR)
+
+        # only memoize the offset when it is constant over the whole hour
+        return hour_epoch, self._fixed_offset(hour_epoch, SECONDS_PER_HOUR)
+
+    def _load_minutes(self, suffix):
+        # ":mm:ss"
+        if len(suffix) != 6 or suffix[0] != ':' or suffix[3] != ':':
+            return None
+
+        minutes = suffix[1:3]
+        seconds = suffix[4:6]
+        if not (minutes.isdigit() and seconds.isdigit()):
+            return None
+
+        minutes = int(minutes)
+        seconds = int(seconds)
+        if minutes > 59 or seconds > 59:
+            return None
+
+        return (minutes * 60) + seconds
+
+    def _fixed_offset(self, epoch, seconds):
+        offset = self._offsets.offset(epoch)
+        if offset != self._offsets.offset(epoch + seconds - 1):
+            return None
+
+        return offset
+
+    def _from_epoch(self, epoch):
+        return Timestamp(epoch, self._offsets.offset(epoch))